@@ -3,7 +3,7 @@ from typing import List, Dict, Any, Optional
 from .mdc_parser import parse_mdc_file, generate_mdc_file
 import zipfile
 import io
-import subprocess
+from src.mcp.core.vcs import get_repo
 
 RULES_DIR = '.cursor/rules'
 
@@ -112,18 +112,14 @@ def import_rules_zip(zip_bytes: bytes, base_dir: str = RULES_DIR, user_id: str =
     return count
 
 
-def get_rule_changelog(path: str) -> list:
+async def get_rule_changelog(path: str) -> list:
     """
     Возвращает историю изменений MDC-правила (git log по файлу).
+    git запускается асинхронно и не блокирует event loop.
     """
     try:
-        result = subprocess.run([
-            "git", "log", "--pretty=format:%h|%an|%ad|%s", "--date=iso", path
-        ], capture_output=True, text=True, check=True)
         entries = []
-        for line in result.stdout.strip().split('\n'):
-            if not line:
-                continue
+        for line in await get_repo().log_file(path):
             parts = line.split('|', 3)
             if len(parts) == 4:
                 entries.append({
@@ -137,12 +133,12 @@ def get_rule_changelog(path: str) -> list:
         return [{"error": str(e)}]
 
 
-def rollback_rule(path: str, commit: str, on_change=None) -> bool:
+async def rollback_rule(path: str, commit: str, on_change=None) -> bool:
     """
     Откатывает MDC-правило к версии commit (git checkout <commit> -- <path>).
     """
     try:
-        subprocess.run(["git", "checkout", commit, "--", path], check=True)
+        await get_repo().checkout(commit, path)
         commit_rule_change(path, 'rollback', reason=f'rollback to {commit}')
         if on_change:
             # Парсим meta для webhook
@@ -155,4 +151,4 @@ def rollback_rule(path: str, commit: str, on_change=None) -> bool:
         return True
     except Exception as e:
         print(f"Git rollback error: {e}")
-        return False 
\ No newline at end of file
+        return False
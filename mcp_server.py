@@ -1,23 +1,47 @@
 from fastapi import FastAPI, HTTPException, Depends, Request, Query, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Header
 from pydantic import BaseModel
 from cacd import CACD
+from src.mcp.memory.memory_bank import get_shared_memory_bank, memory_bank_lifespan
+from src.mcp.memory.project_archive import stream_project_zip, iter_archive_rows, diff_project_archive, is_data_entry
+from src.mcp.memory.bulk_loader import bulk_load, log_progress
+from src.mcp.memory.snapshot_store import SnapshotStore, SNAPSHOT_STORE_DIR, new_snapshot_id
+from src.mcp.memory.snapshot_catalog import register_snapshot, get_snapshot, get_previous_snapshot, file_checksum, FORMAT_MANIFEST, FORMAT_ZIP
+from src.mcp.core.vcs import get_repo, GitError
+from src.mcp.memory.vector_index import vector_search, quantized_search, vector_literal, entity_type_predicate, EMBEDDING_ENTITY_TYPES, VECTOR_METRICS, VECTOR_SEARCH_METRIC, VECTOR_EF_SEARCH, VECTOR_PROBES, VECTOR_RERANK_FACTOR
+from src.mcp.memory.vector_cache import VectorCache
+from src.mcp.memory.embedding_batch import iter_ndjson_batches, iter_packed_batches, ingest_batches, DimensionError
+from src.mcp.memory.embedding_store import register_model, list_models, resolve_model, check_dimension, ModelNotRegisteredError, DEFAULT_MODEL, DEFAULT_EMBEDDING_TABLE
+from src.mcp.memory import clustering
+from src.mcp.memory.hybrid_search import hybrid_search, HYBRID_SOURCES
+from src.mcp.memory.version_store import insert_next_version
+from src.mcp.memory.task_store import TaskExistsError
+from src.server.utils.notifications import notifier
 from typing import Optional
 import json
 from fastapi.responses import HTMLResponse, StreamingResponse
 import logging
 import os
-import pync
-import io
 import zipfile
 import tempfile
 import shutil
 import datetime
-import subprocess
-import glob
+import time
+import contextlib
 
-app = FastAPI()
-dsn = os.getenv("DB_DSN")
-cacd = CACD(dsn)
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Пул MemoryBank, фоновый диспетчер уведомлений и процессы кластеризации закрываются при остановке
+    async with memory_bank_lifespan(app):
+        try:
+            yield
+        finally:
+            clustering.shutdown_executor()
+            await notifier.close()
+
+app = FastAPI(lifespan=lifespan)
+cacd = CACD(memory_bank=get_shared_memory_bank())
+snapshot_store = SnapshotStore()
+vector_cache = VectorCache()
 
 API_KEY = "supersecretkey"  # Можно вынести в переменные окружения
 
@@ -25,8 +49,6 @@ API_KEY = "supersecretkey"  # Можно вынести в переменные
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_server")
 
-# Хранилище подключённых WebSocket-клиентов
-ws_clients = set()
 
 def verify_api_key(request: Request):
     key = request.headers.get("X-API-KEY")
@@ -55,10 +77,12 @@ DEFAULT_TEMPLATES = [
 @app.post('/tasks', dependencies=[Depends(verify_api_key)])
 async def create_task(req: TaskRequest):
     logger.info(f"Создание задачи: {req.task_id}")
-    task = await cacd.process_command(req.command, req.task_id)
+    try:
+        task = await cacd.process_command(req.command, req.task_id)
+    except TaskExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     msg = f"Создана задача {task['id']} для проекта {task.get('project_id', '')}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "created", "task": task}
 
 @app.get('/context/{task_id}', dependencies=[Depends(verify_api_key)])
@@ -77,8 +101,7 @@ async def update_rules(req: RuleRequest):
         json.dump(req.rules, f, indent=2)
     cacd._load_rules()
     msg = "Обновлены правила проекта"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "rules updated"}
 
 @app.get('/rules', dependencies=[Depends(verify_api_key)])
@@ -101,7 +124,7 @@ def get_readme():
 
 @app.post('/projects')
 async def create_project(req: ProjectCreateRequest):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
             'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
@@ -125,7 +148,7 @@ async def create_project(req: ProjectCreateRequest):
 
 @app.get('/projects/by_origin')
 async def get_project_by_origin(origin: str = Query(...)):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow('SELECT id FROM projects WHERE origin = $1', origin)
         if not row:
@@ -135,83 +158,51 @@ async def get_project_by_origin(origin: str = Query(...)):
 @app.websocket('/ws/notify')
 async def websocket_notify(websocket: WebSocket):
     await websocket.accept()
-    ws_clients.add(websocket)
+    client = notifier.register(websocket)
     try:
         while True:
             await websocket.receive_text()  # ping/pong или просто держим соединение
     except WebSocketDisconnect:
-        ws_clients.remove(websocket)
+        pass
+    finally:
+        notifier.unregister(client)
 
-# Функция для отправки уведомления всем WebSocket-клиентам
-async def notify_ws_clients(message: str):
-    for ws in list(ws_clients):
-        try:
-            await ws.send_text(message)
-        except Exception:
-            ws_clients.discard(ws)
-
-# Функция для отправки push-уведомления на Mac
-def notify_mac(title: str, message: str):
-    try:
-        pync.notify(message, title=title)
-    except Exception as e:
-        print(f"Push notification error: {e}")
-
-# Пример использования уведомлений (можно вызывать из endpoint'ов)
-# await notify_ws_clients("Новая задача создана!")
-# notify_mac("MCP", "Новая задача создана!")
+# Уведомления (WebSocket и macOS) рассылает фоновый диспетчер; обработчики только вызывают notifier.publish(msg)
+@app.get('/metrics/notifications', dependencies=[Depends(verify_api_key)])
+async def notification_metrics():
+    return notifier.stats()
 
 @app.post('/docs', dependencies=[Depends(verify_api_key)])
 async def create_doc(project_id: int, type: str, content: str):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
             'INSERT INTO docs (project_id, type, content) VALUES ($1, $2, $3)',
             project_id, type, content
         )
     msg = f"Добавлен документ типа {type} для проекта {project_id}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "doc created"}
 
 @app.get('/projects/{project_id}/export', dependencies=[Depends(verify_api_key)])
 async def export_project(project_id: int, user_id: str = Header(None, alias="X-USER-ID")):
     """
     Экспортирует проект и все связанные сущности в zip-архив.
+    Архив (<entity>.ndjson) формируется и отдаётся потоково, без сборки в памяти.
     """
-    # Получаем все данные
-    tasks = await cacd.memory.get_all_tasks(project_id)
-    rules = await cacd.memory.get_all_rules(project_id)
-    templates = await cacd.memory.get_all_templates(project_id)
-    embeddings = await cacd.memory.get_all_embeddings(project_id)
-    docs = await cacd.memory.get_all_docs(project_id)
-    history = await cacd.memory.get_all_history(project_id)
-
-    # Формируем zip-архив в памяти
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr('tasks.json', json.dumps(tasks, ensure_ascii=False, indent=2))
-        zipf.writestr('rules.json', json.dumps(rules, ensure_ascii=False, indent=2))
-        zipf.writestr('templates.json', json.dumps(templates, ensure_ascii=False, indent=2))
-        zipf.writestr('embeddings.json', json.dumps(embeddings, ensure_ascii=False, indent=2))
-        zipf.writestr('docs.json', json.dumps(docs, ensure_ascii=False, indent=2))
-        zipf.writestr('history.json', json.dumps(history, ensure_ascii=False, indent=2))
-    zip_buffer.seek(0)
-
     # Логируем экспорт в changelog (history)
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
             'INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)',
-            project_id, user_id, 'export', json.dumps({'files': ['tasks.json', 'rules.json', 'templates.json', 'embeddings.json', 'docs.json', 'history.json']})
+            project_id, user_id, 'export', json.dumps({'files': ['tasks.ndjson', 'rules.ndjson', 'templates.ndjson', 'embeddings.ndjson', 'docs.ndjson', 'history.ndjson']})
         )
 
     # Push-уведомление
     msg = f"Проект {project_id} экспортирован в архив"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
 
-    return StreamingResponse(zip_buffer, media_type='application/zip', headers={
+    return StreamingResponse(stream_project_zip(cacd.memory, project_id), media_type='application/zip', headers={
         'Content-Disposition': f'attachment; filename="project_{project_id}_export.zip"'
     })
 
@@ -234,52 +225,20 @@ async def merge_project(
         with zipfile.ZipFile(zip_path, 'r') as zipf:
             zipf.extractall(tmpdir)
 
-        # 2. Читаем json-файлы
-        def read_json(name):
-            path = os.path.join(tmpdir, name)
-            if os.path.exists(path):
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
-        import_tasks = read_json('tasks.json')
-        import_rules = read_json('rules.json')
-        import_templates = read_json('templates.json')
-        import_embeddings = read_json('embeddings.json')
-        import_docs = read_json('docs.json')
-        import_history = read_json('history.json')
-
-        # 3. Получаем текущие данные
-        tasks = await cacd.memory.get_all_tasks(project_id)
-        rules = await cacd.memory.get_all_rules(project_id)
-        templates = await cacd.memory.get_all_templates(project_id)
-        embeddings = await cacd.memory.get_all_embeddings(project_id)
-        docs = await cacd.memory.get_all_docs(project_id)
-        history = await cacd.memory.get_all_history(project_id)
-
-        # 4. Формируем diff по id (или уникальным полям)
-        def diff_by_id(current, incoming, key='id'):
-            current_map = {str(x[key]): x for x in current}
-            incoming_map = {str(x[key]): x for x in incoming}
-            added = [x for k, x in incoming_map.items() if k not in current_map]
-            updated = [x for k, x in incoming_map.items() if k in current_map and x != current_map[k]]
-            conflicted = [
-                {'id': k, 'current': current_map[k], 'incoming': incoming_map[k]}
-                for k in incoming_map if k in current_map and incoming_map[k] != current_map[k]
-            ]
-            skipped = [x for k, x in current_map.items() if k in incoming_map and incoming_map[k] == x]
-            return {'added': added, 'updated': updated, 'conflicted': conflicted, 'skipped': skipped}
-
-        tasks_diff = diff_by_id(tasks, import_tasks, 'id')
-        rules_diff = diff_by_id(rules, import_rules, 'id')
-        templates_diff = diff_by_id(templates, import_templates, 'id')
-        embeddings_diff = diff_by_id(embeddings, import_embeddings, 'id')
-        docs_diff = diff_by_id(docs, import_docs, 'id')
-        history_diff = diff_by_id(history, import_history, 'id')
+        # 2-4. Diff по id: архив читается построчно с диска, проект — курсором, merge-join по отсортированным id
+        #      (совпавшие строки нужны только в ответе dry-run)
+        diffs = await diff_project_archive(cacd.memory, project_id, tmpdir, keep_skipped=dry_run)
+        tasks_diff = diffs['tasks']
+        rules_diff = diffs['rules']
+        templates_diff = diffs['templates']
+        embeddings_diff = diffs['embeddings']
+        docs_diff = diffs['docs']
+        history_diff = diffs['history']
 
         # 5. Вложенные файлы (docs/attachments)
         docs_dir = os.path.join('docs', 'temp')
         os.makedirs(docs_dir, exist_ok=True)
-        files_in_zip = [f for f in zipf.namelist() if not f.endswith('.json')]
+        files_in_zip = [f for f in zipf.namelist() if not is_data_entry(f)]
         extracted_files = []
         for fname in files_in_zip:
             src = os.path.join(tmpdir, fname)
@@ -300,33 +259,24 @@ async def merge_project(
                 'attachments': extracted_files
             }
 
-        # 7. Применяем изменения (только added, обновления — по отдельному запросу)
-        pool = await cacd.memory._get_pool()
+        # 7. Применяем изменения (только added, обновления — по отдельному запросу) одной транзакцией
+        pool = await cacd.memory.get_pool()
         async with pool.acquire() as conn:
-            # Добавляем только новые задачи, правила, шаблоны, docs, embeddings, history
-            for t in tasks_diff['added']:
-                await conn.execute('''INSERT INTO tasks (id, project_id, command, context, rules, status, result) VALUES ($1, $2, $3, $4, $5, $6, $7)''',
-                    t['id'], project_id, t.get('command'), t.get('context'), json.dumps(t.get('rules')), t.get('status'), t.get('result'))
-            for r in rules_diff['added']:
-                await conn.execute('''INSERT INTO cursor_rules (id, project_id, type, value, description) VALUES ($1, $2, $3, $4, $5)''',
-                    r['id'], project_id, r.get('type'), r.get('value'), r.get('description'))
-            for tpl in templates_diff['added']:
-                await conn.execute('''INSERT INTO templates (project_id, name, repo_url, tags) VALUES ($1, $2, $3, $4)''',
-                    project_id, tpl.get('name'), tpl.get('repo_url'), tpl.get('tags'))
-            for emb in embeddings_diff['added']:
-                await conn.execute('''INSERT INTO embeddings (project_id, task_id, vector, description) VALUES ($1, $2, $3, $4)''',
-                    project_id, emb.get('task_id'), emb.get('vector'), emb.get('description'))
-            for d in docs_diff['added']:
-                await conn.execute('''INSERT INTO docs (project_id, type, content) VALUES ($1, $2, $3)''',
-                    project_id, d.get('type'), d.get('content'))
-            for h in history_diff['added']:
-                await conn.execute('''INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)''',
-                    project_id, user_id, h.get('action'), json.dumps(h.get('details')))
+            async with conn.transaction():
+                await bulk_load(conn, project_id, {
+                    'tasks': tasks_diff['added'],
+                    'rules': rules_diff['added'],
+                    'templates': templates_diff['added'],
+                    'embeddings': embeddings_diff['added'],
+                    'docs': docs_diff['added'],
+                    'history': history_diff['added'],
+                }, user_id=user_id, on_progress=log_progress(f"merge project {project_id}"))
+        if embeddings_diff['added']:
+            vector_cache.invalidate(project_id)
 
         # 8. Логируем merge
         msg = f"Merge архива в проект {project_id} завершён. Добавлено: задачи {len(tasks_diff['added'])}, правила {len(rules_diff['added'])}, шаблоны {len(templates_diff['added'])}, docs {len(docs_diff['added'])}, embeddings {len(embeddings_diff['added'])}, history {len(history_diff['added'])}"
-        await notify_ws_clients(msg)
-        notify_mac("MCP", msg)
+        notifier.publish(msg)
 
         return {
             'status': 'merged',
@@ -368,67 +318,44 @@ async def import_project(
         with zipfile.ZipFile(zip_path, 'r') as zipf:
             zipf.extractall(tmpdir)
 
-        def read_json(name):
-            path = os.path.join(tmpdir, name)
-            if os.path.exists(path):
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
-        import_tasks = read_json('tasks.json')
-        import_rules = read_json('rules.json')
-        import_templates = read_json('templates.json')
-        import_embeddings = read_json('embeddings.json')
-        import_docs = read_json('docs.json')
-        import_history = read_json('history.json')
-
         # Получаем origin из одного из файлов (например, rules или tasks)
         origin = None
-        if import_rules and 'origin' in import_rules[0]:
-            origin = import_rules[0]['origin']
-        elif import_tasks and 'origin' in import_tasks[0]:
-            origin = import_tasks[0]['origin']
+        first_rule = next(iter_archive_rows(tmpdir, 'rules'), None)
+        first_task = next(iter_archive_rows(tmpdir, 'tasks'), None)
+        if first_rule and 'origin' in first_rule:
+            origin = first_rule['origin']
+        elif first_task and 'origin' in first_task:
+            origin = first_task['origin']
         if new_origin:
             origin = new_origin
         if not origin:
             origin = f"imported_{os.urandom(4).hex()}"
 
-        # Проверяем уникальность origin
-        pool = await cacd.memory._get_pool()
+        # Проверяем уникальность origin; проект и все сущности создаются одной транзакцией
+        pool = await cacd.memory.get_pool()
         async with pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT id FROM projects WHERE origin = $1', origin)
-            if row:
-                raise HTTPException(status_code=409, detail=f"Project with origin '{origin}' already exists. Укажите новый origin.")
-            # Создаём новый проект
-            project_row = await conn.fetchrow(
-                'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
-                f"Импортированный проект {origin}", "Импорт через API", origin
-            )
-            project_id = project_row['id']
-            # Импортируем все сущности с новым project_id
-            for t in import_tasks:
-                await conn.execute('''INSERT INTO tasks (id, project_id, command, context, rules, status, result) VALUES ($1, $2, $3, $4, $5, $6, $7)''',
-                    t['id'], project_id, t.get('command'), t.get('context'), json.dumps(t.get('rules')), t.get('status'), t.get('result'))
-            for r in import_rules:
-                await conn.execute('''INSERT INTO cursor_rules (id, project_id, type, value, description) VALUES ($1, $2, $3, $4, $5)''',
-                    r['id'], project_id, r.get('type'), r.get('value'), r.get('description'))
-            for tpl in import_templates:
-                await conn.execute('''INSERT INTO templates (project_id, name, repo_url, tags) VALUES ($1, $2, $3, $4)''',
-                    project_id, tpl.get('name'), tpl.get('repo_url'), tpl.get('tags'))
-            for emb in import_embeddings:
-                await conn.execute('''INSERT INTO embeddings (project_id, task_id, vector, description) VALUES ($1, $2, $3, $4)''',
-                    project_id, emb.get('task_id'), emb.get('vector'), emb.get('description'))
-            for d in import_docs:
-                await conn.execute('''INSERT INTO docs (project_id, type, content) VALUES ($1, $2, $3)''',
-                    project_id, d.get('type'), d.get('content'))
-            for h in import_history:
-                await conn.execute('''INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)''',
-                    project_id, user_id, h.get('action'), json.dumps(h.get('details')))
+            async with conn.transaction():
+                row = await conn.fetchrow('SELECT id FROM projects WHERE origin = $1', origin)
+                if row:
+                    raise HTTPException(status_code=409, detail=f"Project with origin '{origin}' already exists. Укажите новый origin.")
+                # Создаём новый проект
+                project_row = await conn.fetchrow(
+                    'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
+                    f"Импортированный проект {origin}", "Импорт через API", origin
+                )
+                project_id = project_row['id']
+                # Импортируем все сущности с новым project_id пачками (COPY), строки читаются из архива потоково
+                added = await bulk_load(
+                    conn, project_id,
+                    {entity: iter_archive_rows(tmpdir, entity) for entity in ('tasks', 'rules', 'templates', 'embeddings', 'docs', 'history')},
+                    user_id=user_id, on_progress=log_progress(f"import {origin}")
+                )
 
         # Вложенные файлы (docs/attachments)
         docs_dir = os.path.join('docs')
         os.makedirs(docs_dir, exist_ok=True)
         with zipfile.ZipFile(zip_path, 'r') as zipf:
-            files_in_zip = [f for f in zipf.namelist() if not f.endswith('.json')]
+            files_in_zip = [f for f in zipf.namelist() if not is_data_entry(f)]
             extracted_files = []
             for fname in files_in_zip:
                 src = os.path.join(tmpdir, fname)
@@ -437,20 +364,14 @@ async def import_project(
                     shutil.copy2(src, dst)
                     extracted_files.append(fname)
 
-        msg = f"Импортирован новый проект {origin} (id={project_id}). Задач: {len(import_tasks)}, правил: {len(import_rules)}, docs: {len(import_docs)}"
-        await notify_ws_clients(msg)
-        notify_mac("MCP", msg)
+        msg = f"Импортирован новый проект {origin} (id={project_id}). Задач: {added['tasks']}, правил: {added['rules']}, docs: {added['docs']}"
+        notifier.publish(msg)
         return {
             'status': 'imported',
             'project_id': project_id,
             'origin': origin,
             'added': {
-                'tasks': len(import_tasks),
-                'rules': len(import_rules),
-                'templates': len(import_templates),
-                'embeddings': len(import_embeddings),
-                'docs': len(import_docs),
-                'history': len(import_history),
+                **added,
                 'attachments': extracted_files
             }
         }
@@ -458,68 +379,94 @@ async def import_project(
 @app.post('/projects/{project_id}/snapshot', dependencies=[Depends(verify_api_key)])
 async def create_snapshot(project_id: int, user_id: str = Header(None, alias="X-USER-ID")):
     """
-    Создаёт снапшот проекта: экспортирует архив, делает git commit и tag, пишет в changelog/history.
+    Создаёт снапшот проекта: пишет новые чанки и манифест в content-addressed хранилище,
+    делает git commit (только изменившиеся объекты) и tag, регистрирует снапшот в каталоге
+    и пишет в changelog/history.
     """
-    # 1. Экспортируем проект в zip
-    tasks = await cacd.memory.get_all_tasks(project_id)
-    rules = await cacd.memory.get_all_rules(project_id)
-    templates = await cacd.memory.get_all_templates(project_id)
-    embeddings = await cacd.memory.get_all_embeddings(project_id)
-    docs = await cacd.memory.get_all_docs(project_id)
-    history = await cacd.memory.get_all_history(project_id)
-    now = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S')
-    archive_name = f'project_{project_id}_snapshot_{now}.zip'
-    archive_path = os.path.join('docs', archive_name)
-    import io, zipfile
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr('tasks.json', json.dumps(tasks, ensure_ascii=False, indent=2))
-        zipf.writestr('rules.json', json.dumps(rules, ensure_ascii=False, indent=2))
-        zipf.writestr('templates.json', json.dumps(templates, ensure_ascii=False, indent=2))
-        zipf.writestr('embeddings.json', json.dumps(embeddings, ensure_ascii=False, indent=2))
-        zipf.writestr('docs.json', json.dumps(docs, ensure_ascii=False, indent=2))
-        zipf.writestr('history.json', json.dumps(history, ensure_ascii=False, indent=2))
-    with open(archive_path, 'wb') as f:
-        f.write(zip_buffer.getvalue())
+    # 1. Чанки проекта по хешу: неизменившиеся данные повторно не пишутся
+    created_at = datetime.datetime.utcnow()
+    now = new_snapshot_id(created_at)
+    manifest, paths = await snapshot_store.create_snapshot(cacd.memory, project_id, now)
+    manifest_path = snapshot_store.manifest_path(project_id, now)
     # 2. Git commit и tag
     commit_msg = f"[snapshot] project {project_id} at {now}"
     tag = f"snapshot-{project_id}-{now}"
     try:
-        subprocess.run(["git", "add", archive_path], check=True)
-        subprocess.run(["git", "commit", "-m", commit_msg], check=True)
-        subprocess.run(["git", "tag", tag], check=True)
-    except Exception as e:
-        print(f"Git error: {e}")
-    # 3. Запись в history/changelog
-    pool = await cacd.memory._get_pool()
+        await get_repo().commit_paths(paths, commit_msg, tag)
+    except GitError as e:
+        # Без коммита и тега снапшот нельзя восстановить — в каталог он не попадает
+        raise HTTPException(status_code=500, detail=f"Git error: {e}")
+    # 3. Каталог снапшотов и запись в history/changelog
+    stats = manifest['stats']
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            'INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)',
-            project_id, user_id, 'snapshot', json.dumps({'archive': archive_name, 'tag': tag, 'date': now})
-        )
-    msg = f"Создан снапшот проекта {project_id}: {archive_name}, git tag: {tag}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
-    return {"status": "snapshot_created", "archive": archive_name, "tag": tag}
+        async with conn.transaction():
+            await register_snapshot(
+                conn, project_id, tag, manifest_path, size_bytes=stats['bytes'],
+                checksum=file_checksum(manifest_path), created_by=user_id, created_at=created_at
+            )
+            await conn.execute(
+                'INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)',
+                project_id, user_id, 'snapshot', json.dumps({'archive': manifest_path, 'tag': tag, 'date': now, 'stats': stats})
+            )
+    msg = f"Создан снапшот проекта {project_id}: {manifest_path} (новых чанков {stats['new_chunks']} из {stats['chunks']}), git tag: {tag}"
+    notifier.publish(msg)
+    return {"status": "snapshot_created", "archive": manifest_path, "tag": tag, "stats": stats}
+
+def _legacy_snapshot(project_id: int, tag: str):
+    """Снапшот, созданный до каталога: место определяется тегом snapshot-<project_id>-<snapshot_id>."""
+    prefix = f"snapshot-{project_id}-"
+    if not tag.startswith(prefix):
+        return None
+    snapshot_id = tag[len(prefix):]
+    manifest_path = snapshot_store.manifest_path(project_id, snapshot_id)
+    if os.path.exists(manifest_path):
+        return {'tag': tag, 'location': manifest_path, 'format': FORMAT_MANIFEST, 'checksum': None}
+    # Снапшоты старого формата — целый zip в docs/
+    return {'tag': tag, 'location': os.path.join('docs', f'project_{project_id}_snapshot_{snapshot_id}.zip'), 'format': FORMAT_ZIP, 'checksum': None}
 
 @app.post('/projects/{project_id}/restore_snapshot', dependencies=[Depends(verify_api_key)])
 async def restore_snapshot(project_id: int, tag: str, user_id: str = Header(None, alias="X-USER-ID")):
     """
-    Восстанавливает проект из git snapshot/tag: ищет архив, импортирует его через merge.
+    Восстанавливает проект из снапшота: находит его в каталоге по тегу, собирает архив
+    из манифеста (или берёт zip старого формата), импортирует его через merge.
     """
-    import subprocess
-    import glob
-    # 1. git checkout tag (только docs/)
-    try:
-        subprocess.run(["git", "checkout", tag, "--", "docs/"], check=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Git checkout error: {e}")
-    # 2. Ищем архив снапшота
-    pattern = f"docs/project_{project_id}_snapshot_*.zip"
-    files = glob.glob(pattern)
-    if not files:
+    # 1. Поиск в каталоге по уникальному индексу тега
+    pool = await cacd.memory.get_pool()
+    async with pool.acquire() as conn:
+        snapshot = await get_snapshot(conn, project_id, tag)
+    snapshot = snapshot or _legacy_snapshot(project_id, tag)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found for this tag")
+    location = snapshot['location']
+    # 2. git checkout tag — только если файлов снапшота нет в рабочем дереве
+    if not os.path.exists(location):
+        try:
+            await get_repo().checkout(tag, SNAPSHOT_STORE_DIR if snapshot['format'] == FORMAT_MANIFEST else location)
+        except GitError as e:
+            raise HTTPException(status_code=500, detail=f"Git checkout error: {e}")
+    if not os.path.exists(location):
         raise HTTPException(status_code=404, detail="Snapshot archive not found for this tag")
-    archive_path = max(files, key=os.path.getctime)  # последний по времени
+    if snapshot['checksum'] and file_checksum(location) != snapshot['checksum']:
+        raise HTTPException(status_code=409, detail=f"Checksum mismatch for snapshot {tag}")
+    tmp_dir = None
+    if snapshot['format'] == FORMAT_MANIFEST:
+        with open(location, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        # Объекты чанков могли удалить из рабочего дерева — достаём их из git по тегу
+        if snapshot_store.missing_chunks(manifest):
+            try:
+                await get_repo().checkout(tag, SNAPSHOT_STORE_DIR)
+            except GitError as e:
+                raise HTTPException(status_code=500, detail=f"Git checkout error: {e}")
+        missing = snapshot_store.missing_chunks(manifest)
+        if missing:
+            raise HTTPException(status_code=409, detail=f"Snapshot {tag} is missing {len(missing)} chunk(s): {', '.join(missing[:5])}")
+        tmp_dir = tempfile.mkdtemp()
+        archive_path = os.path.join(tmp_dir, f'project_{project_id}_snapshot_{manifest["snapshot_id"]}.zip')
+        snapshot_store.write_archive(manifest, archive_path)
+    else:
+        archive_path = location
     # 3. Импортируем архив через merge
     from fastapi import UploadFile
     class DummyUploadFile:
@@ -527,8 +474,12 @@ async def restore_snapshot(project_id: int, tag: str, user_id: str = Header(None
             self.file = open(path, 'rb')
             self.filename = os.path.basename(path)
     upload = DummyUploadFile(archive_path)
-    resp = await merge_project(project_id, file=upload, dry_run=False, user_id=user_id)
-    upload.file.close()
+    try:
+        resp = await merge_project(project_id, file=upload, dry_run=False, user_id=user_id)
+    finally:
+        upload.file.close()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
     return {"status": "restored", "archive": archive_path, "merge_result": resp}
 
 @app.post('/projects/{project_id}/rollback', dependencies=[Depends(verify_api_key)])
@@ -537,21 +488,23 @@ async def rollback_project(project_id: int, tag: str = None, user_id: str = Head
     Откатывает проект к предыдущему снапшоту (или к указанному git tag).
     Записывает событие rollback в history/changelog.
     """
-    import subprocess
-    import glob
-    # 1. Находим нужный tag (если не указан — предыдущий по времени)
+    pool = await cacd.memory.get_pool()
+    # 1. Находим нужный tag (если не указан — предпоследний снапшот по каталогу)
     if not tag:
-        # Получаем все snapshot-теги для проекта
-        result = subprocess.run(["git", "tag"], capture_output=True, text=True)
-        tags = [t for t in result.stdout.splitlines() if t.startswith(f"snapshot-{project_id}-")]
-        tags.sort(reverse=True)
-        if len(tags) < 2:
-            raise HTTPException(status_code=404, detail="Нет предыдущих снапшотов для отката")
-        tag = tags[1]  # предыдущий (до последнего)
+        async with pool.acquire() as conn:
+            previous = await get_previous_snapshot(conn, project_id)
+        if previous:
+            tag = previous['tag']
+        else:
+            # Проект без записей в каталоге — снапшоты, созданные до него, ищем по git-тегам
+            tags = await get_repo().tags(f"snapshot-{project_id}-")
+            tags.sort(reverse=True)
+            if len(tags) < 2:
+                raise HTTPException(status_code=404, detail="Нет предыдущих снапшотов для отката")
+            tag = tags[1]  # предыдущий (до последнего)
     # 2. Восстанавливаем через restore_snapshot
     resp = await restore_snapshot(project_id, tag, user_id)
     # 3. Запись в history/changelog
-    pool = await cacd.memory._get_pool()
     import datetime
     now = datetime.datetime.utcnow().isoformat()
     async with pool.acquire() as conn:
@@ -560,10 +513,19 @@ async def rollback_project(project_id: int, tag: str = None, user_id: str = Head
             project_id, user_id, 'rollback', json.dumps({'tag': tag, 'date': now, 'result': resp})
         )
     msg = f"Откат проекта {project_id} к снапшоту {tag} завершён"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "rollback_done", "tag": tag, "result": resp}
 
+@app.get('/metrics/vcs', dependencies=[Depends(verify_api_key)])
+async def vcs_metrics():
+    """Время выполнения git-команд и ожидания лока репозитория (по командам)."""
+    return get_repo().metrics()
+
+@app.get('/metrics/context_cache', dependencies=[Depends(verify_api_key)])
+async def context_cache_metrics():
+    """Счётчики read-through кэша /context/{task_id}: hits, misses, hit_ratio, evictions, invalidations."""
+    return cacd.memory.context_cache.stats()
+
 @app.get('/history')
 async def get_history(
     project_id: Optional[int] = Query(None),
@@ -576,7 +538,7 @@ async def get_history(
     """
     Возвращает историю событий с фильтрацией по проекту, пользователю, действию, дате.
     """
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     query = 'SELECT * FROM history WHERE 1=1'
     params = []
     if project_id:
@@ -618,25 +580,23 @@ async def upload_file(
     else:
         with open(file_path, 'wb') as f:
             f.write(content)
-    # Определяем версию
-    pool = await cacd.memory._get_pool()
+    # Следующая версия файла: номер и вставка — один оператор, гонка разрешается повтором
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
-        vrow = await conn.fetchrow('SELECT max(version) as v FROM file_versions WHERE file_path = $1 AND project_id = $2', file.filename, project_id)
-        version = (vrow['v'] or 0) + 1
-        await conn.execute('''INSERT INTO file_versions (project_id, file_path, version, hash, user_id, s3_url) VALUES ($1, $2, $3, $4, $5, $6)''',
-            project_id, file.filename, version, file_hash, user_id, s3_url)
+        version = await insert_next_version(conn, 'file_versions', {'project_id': project_id, 'file_path': file.filename},
+                                            {'hash': file_hash, 'user_id': user_id, 's3_url': s3_url})
     return {"status": "uploaded", "file": file.filename, "version": version, "s3_url": s3_url}
 
 @app.get('/files/versions')
 async def get_file_versions(project_id: int, file_path: str):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch('SELECT version, hash, user_id, s3_url, created_at FROM file_versions WHERE project_id = $1 AND file_path = $2 ORDER BY version DESC', project_id, file_path)
         return [{"version": r["version"], "hash": r["hash"], "user_id": r["user_id"], "s3_url": r["s3_url"], "created_at": r["created_at"]} for r in rows]
 
 @app.post('/files/rollback')
 async def rollback_file(project_id: int, file_path: str, version: int, user_id: str = Header(None, alias="X-USER-ID")):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow('SELECT hash, s3_url FROM file_versions WHERE project_id = $1 AND file_path = $2 AND version = $3', project_id, file_path, version)
         if not row:
@@ -653,87 +613,245 @@ async def rollback_file(project_id: int, file_path: str, version: int, user_id:
         with open(f"docs/{file_path}", 'wb') as f:
             f.write(content)
         # Сохраняем новую версию (rollback)
-        vrow = await conn.fetchrow('SELECT max(version) as v FROM file_versions WHERE file_path = $1 AND project_id = $2', file_path, project_id)
-        new_version = (vrow['v'] or 0) + 1
-        await conn.execute('''INSERT INTO file_versions (project_id, file_path, version, hash, user_id, s3_url) VALUES ($1, $2, $3, $4, $5, $6)''',
-            project_id, file_path, new_version, row['hash'], user_id, row['s3_url'])
+        await insert_next_version(conn, 'file_versions', {'project_id': project_id, 'file_path': file_path},
+                                  {'hash': row['hash'], 'user_id': user_id, 's3_url': row['s3_url']})
     return {"status": "rolled_back", "file": file_path, "version": version}
 
+def _check_entity_type(entity_type: Optional[str]):
+    if entity_type is not None and entity_type not in EMBEDDING_ENTITY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный entity_type: {entity_type} (доступны {', '.join(EMBEDDING_ENTITY_TYPES)})")
+
+def _check_dimension(store: dict, model: Optional[str], dimension: int):
+    # Незарегистрированная модель чужой размерности — 404: в общую таблицу она не ляжет, нужна регистрация
+    try:
+        check_dimension(store, model, dimension)
+    except ModelNotRegisteredError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/embeddings/models', dependencies=[Depends(verify_api_key)])
+async def register_embedding_model(
+    name: str,
+    dimension: int,
+    storage: str = None,
+    method: str = 'hnsw',
+    metric: str = VECTOR_SEARCH_METRIC
+):
+    """
+    Регистрирует модель эмбеддингов: отдельная таблица {storage}({dimension}) с ANN-индексом.
+    storage=halfvec — float16, вдвое меньше памяти индекса (по умолчанию для размерностей от EMBEDDING_HALFVEC_MIN_DIM).
+    """
+    pool = await cacd.memory.get_pool()
+    async with pool.acquire() as conn:
+        try:
+            return await register_model(conn, name, dimension, storage, method or None, metric)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.get('/embeddings/models', dependencies=[Depends(verify_api_key)])
+async def list_embedding_models():
+    pool = await cacd.memory.get_pool()
+    async with pool.acquire() as conn:
+        return [DEFAULT_MODEL, *await list_models(conn)]
+
 @app.post('/embeddings/add', dependencies=[Depends(verify_api_key)])
 async def add_embedding(
     project_id: int,
     entity_id: str,
     entity_type: str,  # 'task' | 'doc' | 'template'
     vector: list[float],
-    model: str,
+    model: str = None,
     description: str = '',
     user_id: str = Header(None, alias="X-USER-ID")
 ):
-    # Проверка размерности (пример: 384)
-    if len(vector) not in (384, 768, 1024):
-        raise HTTPException(status_code=400, detail="Неподдерживаемая размерность эмбеддинга")
-    pool = await cacd.memory._get_pool()
+    _check_entity_type(entity_type)
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
+        # Как и поиск: зарегистрированная модель — своя таблица, без модели или незарегистрированная —
+        # общая embeddings (vector(384)); незарегистрированная модель другой размерности — 404
+        store = await resolve_model(conn, model)
+        _check_dimension(store, model, len(vector))
         await conn.execute(
-            '''INSERT INTO embeddings (project_id, task_id, vector, description) VALUES ($1, $2, $3, $4)''',
-            project_id, entity_id, vector, description
+            f'''INSERT INTO {store['table_name']} (project_id, task_id, vector, description, entity_type, entity_id, model)
+                VALUES ($1, $2, $3::text::{store['storage']}, $4, $5, $2, $6)''',
+            project_id, entity_id, vector_literal(vector), description, entity_type, model
         )
+    if store['table_name'] == DEFAULT_EMBEDDING_TABLE:
+        vector_cache.invalidate(project_id)
     return {"status": "embedding_added", "entity_id": entity_id, "type": entity_type, "model": model}
 
+@app.post('/embeddings/add_batch', dependencies=[Depends(verify_api_key)])
+async def add_embeddings_batch(
+    request: Request,
+    project_id: int,
+    entity_type: str = None,
+    model: str = None,
+    user_id: str = Header(None, alias="X-USER-ID")
+):
+    """
+    Пакетная загрузка эмбеддингов одним запросом, тело читается потоково:
+    - application/x-ndjson: строка {"entity_id", "vector", "description", "entity_type"} на вектор;
+    - application/octet-stream: uint32 LE длина заголовка, JSON-заголовок {"shape": [N, D], "entity_ids", "descriptions", "entity_types"},
+      затем N*D float32 little-endian.
+    entity_type и model из query применяются к строкам без своего типа; зарегистрированная model —
+    загрузка в её таблицу с её размерностью, незарегистрированная — в общую embeddings (vector(384)),
+    при другой размерности — 404.
+    Размерности проверяются NumPy по пачкам, вставка — COPY в одной транзакции (всё или ничего).
+    """
+    _check_entity_type(entity_type)
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type == 'application/octet-stream':
+        iter_batches = iter_packed_batches
+    elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        iter_batches = iter_ndjson_batches
+    else:
+        raise HTTPException(status_code=415, detail="Ожидается application/x-ndjson или application/octet-stream")
+    started = time.perf_counter()
+    pool = await cacd.memory.get_pool()
+    try:
+        async with pool.acquire() as conn:
+            store = await resolve_model(conn, model)
+            batches = iter_batches(request.stream(), dimensions=(store['dimension'],))
+            async with conn.transaction():
+                inserted = await ingest_batches(conn, project_id, batches, entity_type, model,
+                                                table=store['table_name'], vector_type=store['storage'])
+    except DimensionError as e:
+        # Размерность пачки не совпала с хранилищем: 404 для незарегистрированной модели, иначе 400
+        _check_dimension(store, model, e.dimension)
+        raise
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Некорректная пачка эмбеддингов: {e}")
+    finally:
+        vector_cache.invalidate(project_id)
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "embeddings_added",
+        "inserted": inserted,
+        "seconds": round(elapsed, 3),
+        "vectors_per_sec": round(inserted / elapsed) if elapsed > 0 else None,
+    }
+
+def _cached_search(cached, vector, entity_id, top_k, metric, entity_type=None):
+    if entity_id:
+        if entity_id not in cached.positions:
+            raise HTTPException(status_code=404, detail="Эмбеддинг не найден")
+        vector = cached.vector(cached.positions[entity_id])
+    if vector is None or not len(vector):
+        raise HTTPException(status_code=400, detail="Не передан вектор для поиска")
+    try:
+        return cached.top_k(vector, top_k, metric, entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _search_rows(conn, store, where, params, vector, top_k, columns, metric, ef_search, probes,
+                       quantization=None, rerank=None):
+    options = dict(columns=columns, metric=metric, ef_search=ef_search or VECTOR_EF_SEARCH, probes=probes or VECTOR_PROBES,
+                   table=store['table_name'], vector_type=store['storage'])
+    if not quantization:
+        return await vector_search(conn, where, params, vector, top_k, **options)
+    # Грубый поиск по квантованному индексу (vector-index create --quantization ...), затем точный re-rank
+    try:
+        return await quantized_search(conn, where, params, vector, top_k, quantization, store['dimension'],
+                                      rerank_factor=rerank or VECTOR_RERANK_FACTOR, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get('/embeddings/cache', dependencies=[Depends(verify_api_key)])
+async def embeddings_cache_stats():
+    return vector_cache.stats()
+
 @app.post('/embeddings/search', dependencies=[Depends(verify_api_key)])
 async def search_embeddings(
     project_id: int,
     vector: list[float] = None,
     entity_type: str = None,
     entity_id: str = None,
-    top_k: int = 5
+    top_k: int = 5,
+    metric: str = VECTOR_SEARCH_METRIC,
+    ef_search: int = None,
+    probes: int = None,
+    include_vector: bool = True,
+    model: str = None,
+    quantization: str = None,
+    rerank: int = None
 ) -> list[Any]:
-    pool = await cacd.memory._get_pool()
+    """
+    quantization=binary|halfvec — top-(top_k*rerank) по квантованному индексу и точный re-rank полными векторами:
+    меньше памяти под индекс ценой небольшой потери recall.
+    """
+    if metric not in VECTOR_METRICS:
+        raise HTTPException(status_code=400, detail=f"Неизвестная метрика: {metric}")
+    _check_entity_type(entity_type)
+    if vector_cache.enabled and not model and not quantization:
+        # Точный поиск по кэшу проекта в памяти процесса, без запроса в Postgres
+        cached = await vector_cache.get(cacd.memory, project_id)
+        positions = _cached_search(cached, vector, entity_id, top_k, metric, entity_type)
+        return [
+            {"entity_id": cached.ids[i], **({"vector": vector_literal(cached.vector(i))} if include_vector else {}), "description": cached.descriptions[i]}
+            for i in positions
+        ]
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
+        store = await resolve_model(conn, model)
         # Если передан entity_id — ищем его вектор
         if entity_id:
-            row = await conn.fetchrow('SELECT vector FROM embeddings WHERE project_id = $1 AND task_id = $2', project_id, entity_id)
+            row = await conn.fetchrow(f"SELECT vector FROM {store['table_name']} WHERE project_id = $1 AND entity_id = $2", project_id, entity_id)
             if not row:
                 raise HTTPException(status_code=404, detail="Эмбеддинг не найден")
             vector = row['vector']
         if not vector:
             raise HTTPException(status_code=400, detail="Не передан вектор для поиска")
-        # Поиск по pgvector (cosine distance)
-        query = 'SELECT task_id, vector, description FROM embeddings WHERE project_id = $1'
+        # Фильтр по проекту и типу применяется до ANN: мало кандидатов — точный поиск по ним,
+        # иначе — (частичный) индекс с ef_search/probes на этот запрос
+        where = 'project_id = $1'
         params = [project_id]
         if entity_type:
-            query += ' AND description LIKE $2'
-            params.append(f'%{entity_type}%')
-        query += ' ORDER BY vector <#> $' + str(len(params)+1) + ' LIMIT $' + str(len(params)+2)
-        params.append(vector)
-        params.append(top_k)
-        rows = await conn.fetch(query, *params)
-        return [{"entity_id": r["task_id"], "vector": r["vector"], "description": r["description"]} for r in rows]
+            where += f' AND {entity_type_predicate(entity_type)}'
+        columns = 'entity_id, vector, description' if include_vector else 'entity_id, description'
+        rows = await _search_rows(conn, store, where, params, vector, top_k, columns, metric, ef_search, probes,
+                                  quantization, rerank)
+        return [
+            {"entity_id": r["entity_id"], **({"vector": r["vector"]} if include_vector else {}), "description": r["description"]}
+            for r in rows
+        ]
 
 @app.post('/embeddings/cluster', dependencies=[Depends(verify_api_key)])
 async def cluster_embeddings(
     project_id: int,
     entity_type: str = None,
-    n_clusters: int = 5
+    n_clusters: int = 5,
+    mode: str = 'minibatch',
+    wait: bool = False
 ):
-    pool = await cacd.memory._get_pool()
+    """
+    Ставит задание кластеризации (MiniBatchKMeans в пуле процессов) и сразу возвращает job_id;
+    статус и результат — GET /embeddings/cluster/{job_id}. mode=stream — partial_fit по курсору
+    для проектов, которые не помещаются в память. wait=true — дождаться результата (прежний ответ).
+    """
+    try:
+        job = await clustering.create_job(cacd.memory, project_id, n_clusters, mode, entity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    task = clustering.start_job(cacd.memory, job)
+    if not wait:
+        return {"job_id": job['id'], "status": job['status']}
+    await task
+    result = await cluster_job_status(job['id'], include_members=True)
+    if result['status'] == 'failed':
+        raise HTTPException(status_code=400, detail=result['error'])
+    return result
+
+@app.get('/embeddings/cluster/{job_id}', dependencies=[Depends(verify_api_key)])
+async def cluster_job_status(job_id: str, include_members: bool = False):
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
-        query = 'SELECT task_id, vector, description FROM embeddings WHERE project_id = $1'
-        params = [project_id]
-        if entity_type:
-            query += ' AND description LIKE $2'
-            params.append(f'%{entity_type}%')
-        rows = await conn.fetch(query, *params)
-        if not rows or len(rows) < n_clusters:
-            raise HTTPException(status_code=400, detail="Недостаточно эмбеддингов для кластеризации")
-        X = np.array([r['vector'] for r in rows])
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(X)
-        clusters = {}
-        for idx, r in enumerate(rows):
-            l = int(labels[idx])
-            clusters.setdefault(l, []).append({"entity_id": r["task_id"], "description": r["description"]})
-        return {"clusters": clusters, "centroids": kmeans.cluster_centers_.tolist()}
+        job = await clustering.get_job(conn, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Задание кластеризации не найдено")
+        if job['status'] == 'done':
+            job.update(await clustering.get_clusters(conn, job_id, include_members))
+    return {"job_id": job.pop('id'), **job}
 
 @app.post('/embeddings/recommend', dependencies=[Depends(verify_api_key)])
 async def recommend_embeddings(
@@ -741,39 +859,95 @@ async def recommend_embeddings(
     entity_id: str = None,
     vector: list[float] = None,
     entity_type: str = None,
-    top_k: int = 5
+    top_k: int = 5,
+    metric: str = VECTOR_SEARCH_METRIC,
+    ef_search: int = None,
+    probes: int = None,
+    cluster: int = None,
+    model: str = None,
+    quantization: str = None,
+    rerank: int = None
 ):
     # Использует /embeddings/search для поиска похожих, но фильтрует по entity_type
-    pool = await cacd.memory._get_pool()
+    # и (опционально) по кластеру последней завершённой кластеризации проекта
+    if metric not in VECTOR_METRICS:
+        raise HTTPException(status_code=400, detail=f"Неизвестная метрика: {metric}")
+    _check_entity_type(entity_type)
+    if model and cluster is not None:
+        raise HTTPException(status_code=400, detail="Фильтр по кластеру доступен только для модели по умолчанию")
+    if vector_cache.enabled and cluster is None and not model and not quantization:
+        cached = await vector_cache.get(cacd.memory, project_id)
+        positions = _cached_search(cached, vector, entity_id, top_k, metric, entity_type)
+        return [{"entity_id": cached.ids[i], "description": cached.descriptions[i]} for i in positions]
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
+        store = await resolve_model(conn, model)
         if entity_id:
-            row = await conn.fetchrow('SELECT vector FROM embeddings WHERE project_id = $1 AND task_id = $2', project_id, entity_id)
+            row = await conn.fetchrow(f"SELECT vector FROM {store['table_name']} WHERE project_id = $1 AND entity_id = $2", project_id, entity_id)
             if not row:
                 raise HTTPException(status_code=404, detail="Эмбеддинг не найден")
             vector = row['vector']
         if not vector:
             raise HTTPException(status_code=400, detail="Не передан вектор для рекомендации")
-        query = 'SELECT task_id, vector, description FROM embeddings WHERE project_id = $1'
+        where = 'project_id = $1'
         params = [project_id]
         if entity_type:
-            query += ' AND description LIKE $2'
-            params.append(f'%{entity_type}%')
-        query += ' ORDER BY vector <#> $' + str(len(params)+1) + ' LIMIT $' + str(len(params)+2)
-        params.append(vector)
-        params.append(top_k)
-        rows = await conn.fetch(query, *params)
-        return [{"entity_id": r["task_id"], "description": r["description"]} for r in rows]
+            where += f' AND {entity_type_predicate(entity_type)}'
+        if cluster is not None:
+            job_id = await clustering.latest_done_job_id(conn, project_id)
+            if not job_id:
+                raise HTTPException(status_code=404, detail="Нет завершённой кластеризации проекта")
+            where += f' AND id IN (SELECT embedding_id FROM embedding_cluster_labels WHERE job_id = ${len(params) + 1} AND cluster = ${len(params) + 2})'
+            params.extend([job_id, cluster])
+        rows = await _search_rows(conn, store, where, params, vector, top_k, 'entity_id, description', metric,
+                                  ef_search, probes, quantization, rerank)
+        return [{"entity_id": r["entity_id"], "description": r["description"]} for r in rows]
+
+@app.post('/search/hybrid', dependencies=[Depends(verify_api_key)])
+async def search_hybrid(
+    project_id: int,
+    q: str = None,
+    vector: list[float] = None,
+    sources: list[str] = Query(None),
+    doc_type: str = None,
+    status: str = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    metric: str = VECTOR_SEARCH_METRIC,
+    model: str = None,
+    ef_search: int = None,
+    probes: int = None
+):
+    """
+    Гибридный поиск по docs, tasks.command и context.data одним запросом:
+    полнотекстовый (tsvector/GIN) и векторный (pgvector ANN) списки сливаются reciprocal rank fusion.
+    q — текст (синтаксис websearch_to_tsquery), vector — эмбеддинг запроса; можно передать одно из двух.
+    doc_type / status — фильтры docs.type / tasks.status; limit/offset — страница слитого списка.
+    """
+    pool = await cacd.memory.get_pool()
+    async with pool.acquire() as conn:
+        store = await resolve_model(conn, model)
+        if vector is not None:
+            _check_dimension(store, model, len(vector))
+        try:
+            return await hybrid_search(
+                conn, project_id, q, vector, sources or tuple(HYBRID_SOURCES), {'doc': doc_type, 'task': status},
+                limit, offset, metric, ef_search or VECTOR_EF_SEARCH, probes or VECTOR_PROBES,
+                table=store['table_name'], vector_type=store['storage'],
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
 @app.get('/rules/global', dependencies=[Depends(verify_api_key)])
 async def get_global_rules():
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch('SELECT * FROM cursor_rules WHERE project_id IS NULL')
         return [dict(row) for row in rows]
 
 @app.post('/rules/global', dependencies=[Depends(verify_api_key)])
 async def update_global_rules(rules: list, user_id: str = Header(None, alias="X-USER-ID")):
-    pool = await cacd.memory._get_pool()
+    pool = await cacd.memory.get_pool()
     async with pool.acquire() as conn:
         await conn.execute('DELETE FROM cursor_rules WHERE project_id IS NULL')
         for rule in rules:
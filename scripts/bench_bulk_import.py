@@ -0,0 +1,69 @@
+"""
+Бенчмарк импорта: построчные INSERT (старый путь /projects/import) против bulk_load (COPY).
+Все изменения откатываются в конце каждого прогона.
+
+    DB_DSN=postgresql://... python scripts/bench_bulk_import.py --rows 50000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.mcp.memory.bulk_loader import bulk_load
+
+
+def synthetic_rows(n: int):
+    tasks = [{'id': f'bench-{i}', 'command': f'cmd {i}', 'context': 'ctx', 'rules': [], 'status': 'pending', 'result': None} for i in range(n)]
+    history = [{'action': 'bench', 'details': {'i': i}} for i in range(n)]
+    return {'tasks': tasks, 'history': history}
+
+
+async def per_row_insert(conn, project_id, entities, user_id):
+    for t in entities['tasks']:
+        await conn.execute('''INSERT INTO tasks (id, project_id, command, context, rules, status, result) VALUES ($1, $2, $3, $4, $5, $6, $7)''',
+            t['id'], project_id, t.get('command'), t.get('context'), json.dumps(t.get('rules')), t.get('status'), t.get('result'))
+    for h in entities['history']:
+        await conn.execute('''INSERT INTO history (project_id, user_id, action, details) VALUES ($1, $2, $3, $4)''',
+            project_id, user_id, h.get('action'), json.dumps(h.get('details')))
+
+
+async def run_once(conn, loader, entities):
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        project_id = await conn.fetchval(
+            'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
+            'bench', 'bench', f'bench-{os.urandom(4).hex()}'
+        )
+        started = time.perf_counter()
+        await loader(conn, project_id, entities, 'bench')
+        return time.perf_counter() - started
+    finally:
+        await tr.rollback()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк bulk-импорта')
+    parser.add_argument('--dsn', default=os.getenv('DB_DSN'))
+    parser.add_argument('--rows', type=int, default=50000, help='Строк на сущность (tasks и history)')
+    args = parser.parse_args()
+    entities = synthetic_rows(args.rows)
+    total = sum(len(v) for v in entities.values())
+    conn = await asyncpg.connect(dsn=args.dsn)
+    try:
+        async def bulk(conn, project_id, entities, user_id):
+            await bulk_load(conn, project_id, entities, user_id=user_id)
+        for name, loader in (('per-row', per_row_insert), ('bulk', bulk)):
+            elapsed = await run_once(conn, loader, entities)
+            print(f"{name:8s}: {total} rows in {elapsed:.2f}s — {total / elapsed:,.0f} rows/sec")
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Бенчмарк квантованного поиска: размер индекса, p50/p99 и recall@k для полного HNSW,
+halfvec- и binary-квантования с re-rank против точного поиска.
+Создаёт временный проект с синтетическими векторами; проект, строки и индексы удаляются в конце.
+
+    DB_DSN=postgresql://... python scripts/bench_vector_quantization.py --rows 1000000 --rerank 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.bench_vector_search import load_vectors
+from src.mcp.memory.vector_index import (
+    create_vector_index, drop_vector_index, create_quantized_index, drop_quantized_index,
+    apply_search_params, search_sql, quantized_search_sql, vector_literal,
+)
+
+
+async def run_queries(conn, queries, project_id, sql, top_k, exact=False, ef_search=None):
+    results, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        async with conn.transaction():
+            if exact:
+                await conn.execute('SET LOCAL enable_indexscan = off')
+            else:
+                await apply_search_params(conn, ef_search)
+            rows = await conn.fetch(sql, project_id, vector_literal(q), top_k)
+        latencies.append(time.perf_counter() - started)
+        results.append({r['id'] for r in rows})
+    return results, np.array(latencies) * 1000
+
+
+def report(name, size, results, latencies, truth, top_k):
+    recall = np.mean([len(r & t) / top_k for r, t in zip(results, truth)])
+    print(f"{name:28s} index={size / 2**20:8.1f} MiB  recall@{top_k}={recall:.3f}  "
+          f"p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms")
+
+
+async def index_size(conn, name) -> int:
+    return await conn.fetchval('SELECT pg_relation_size($1::regclass)', name)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк квантованного векторного поиска')
+    parser.add_argument('--dsn', default=os.getenv('DB_DSN'))
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--dim', type=int, default=384, help='Должна совпадать с размерностью embeddings.vector')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--metric', choices=['cosine', 'l2', 'ip'], default='cosine')
+    parser.add_argument('--modes', nargs='+', default=['full', 'halfvec', 'binary'])
+    parser.add_argument('--rerank', type=int, nargs='+', default=[2, 4, 8], help='Множители m для top-(k*m)')
+    parser.add_argument('--ef-search', type=int, default=100)
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+    conn = await asyncpg.connect(dsn=args.dsn)
+    project_id = await conn.fetchval(
+        'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
+        f'bench-quant-{os.urandom(4).hex()}', 'bench', None
+    )
+    try:
+        sample = await load_vectors(conn, project_id, args.rows, args.dim, rng)
+        picks = sample[rng.choice(len(sample), args.queries, replace=len(sample) < args.queries)]
+        queries = picks + rng.standard_normal(picks.shape, dtype=np.float32) * 0.1
+        heap = await conn.fetchval("SELECT pg_relation_size('embeddings')")
+        print(f"embeddings: {heap / 2**20:.0f} MiB в таблице (полные векторы нужны для re-rank в любом режиме)")
+        exact_sql = search_sql('id', 'project_id = $1', 1, args.metric)
+        truth, latencies = await run_queries(conn, queries, project_id, exact_sql, args.top_k, exact=True)
+        report('exact', 0, truth, latencies, truth, args.top_k)
+        for mode in args.modes:
+            started = time.perf_counter()
+            if mode == 'full':
+                name = await create_vector_index(conn, 'hnsw', args.metric, concurrently=False)
+            else:
+                name = await create_quantized_index(conn, mode, args.dim, args.metric, concurrently=False)
+            size = await index_size(conn, name)
+            print(f"{name}: построен за {time.perf_counter() - started:.1f}s")
+            try:
+                if mode == 'full':
+                    results, latencies = await run_queries(conn, queries, project_id, exact_sql, args.top_k, ef_search=args.ef_search)
+                    report('hnsw', size, results, latencies, truth, args.top_k)
+                    continue
+                for factor in args.rerank:
+                    sql = quantized_search_sql('id', 'project_id = $1', 1, mode, args.dim, args.metric, rerank_factor=factor)
+                    ef_search = min(max(args.ef_search, args.top_k * factor), 1000)
+                    results, latencies = await run_queries(conn, queries, project_id, sql, args.top_k, ef_search=ef_search)
+                    report(f"{mode} rerank m={factor}", size, results, latencies, truth, args.top_k)
+            finally:
+                if mode == 'full':
+                    await drop_vector_index(conn, 'hnsw', args.metric, concurrently=False)
+                else:
+                    await drop_quantized_index(conn, mode, args.metric, concurrently=False)
+    finally:
+        await conn.execute('DELETE FROM embeddings WHERE project_id = $1', project_id)
+        await conn.execute('DELETE FROM projects WHERE id = $1', project_id)
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
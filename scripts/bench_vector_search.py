@@ -0,0 +1,108 @@
+"""
+Бенчмарк recall/latency ANN-индексов embeddings против точного поиска.
+Создаёт временный проект с синтетическими векторами, для каждого типа индекса
+перебирает ef_search (HNSW) / probes (IVFFlat) и сравнивает top-k с точным поиском.
+Проект, его строки и индексы удаляются в конце.
+
+    DB_DSN=postgresql://... python scripts/bench_vector_search.py --rows 1000000 --queries 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.mcp.memory.vector_index import create_vector_index, drop_vector_index, apply_search_params, search_sql, vector_literal
+
+LOAD_BATCH = 10000
+
+
+async def load_vectors(conn, project_id: int, rows: int, dim: int, rng) -> np.ndarray:
+    """COPY в текстовом формате: pgvector принимает '[...]' без бинарного кодека. Возвращает выборку для запросов."""
+    sample = []
+
+    async def source():
+        for start in range(0, rows, LOAD_BATCH):
+            batch = rng.standard_normal((min(LOAD_BATCH, rows - start), dim), dtype=np.float32)
+            if len(sample) < 10:
+                sample.append(batch[:100])
+            lines = [f'{project_id}\tbench-{start + i}\t{vector_literal(v)}\n' for i, v in enumerate(batch)]
+            yield ''.join(lines).encode('utf-8')
+            print(f"  загружено {min(start + LOAD_BATCH, rows)}/{rows}", end='\r')
+        print()
+
+    await conn.copy_to_table('embeddings', source=source(), columns=['project_id', 'task_id', 'vector'], format='text')
+    await conn.execute('ANALYZE embeddings')
+    return np.concatenate(sample)
+
+
+async def run_queries(conn, queries, project_id, top_k, metric, exact=False, ef_search=None, probes=None):
+    sql = search_sql('id', 'project_id = $1', 1, metric)
+    results, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        async with conn.transaction():
+            if exact:
+                await conn.execute('SET LOCAL enable_indexscan = off')
+            else:
+                await apply_search_params(conn, ef_search, probes)
+            rows = await conn.fetch(sql, project_id, vector_literal(q), top_k)
+        latencies.append(time.perf_counter() - started)
+        results.append({r['id'] for r in rows})
+    return results, np.array(latencies) * 1000
+
+
+def report(name, results, latencies, truth, top_k):
+    recall = np.mean([len(r & t) / top_k for r, t in zip(results, truth)])
+    print(f"{name:24s} recall@{top_k}={recall:.3f}  p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк recall/latency векторных индексов')
+    parser.add_argument('--dsn', default=os.getenv('DB_DSN'))
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--metric', choices=['cosine', 'l2', 'ip'], default='cosine')
+    parser.add_argument('--methods', nargs='+', default=['hnsw', 'ivfflat'])
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[20, 40, 80, 160, 320])
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 5, 10, 20, 50])
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+    conn = await asyncpg.connect(dsn=args.dsn)
+    project_id = await conn.fetchval(
+        'INSERT INTO projects (name, description, origin) VALUES ($1, $2, $3) RETURNING id',
+        f'bench-vectors-{os.urandom(4).hex()}', 'bench', None
+    )
+    try:
+        sample = await load_vectors(conn, project_id, args.rows, args.dim, rng)
+        picks = sample[rng.choice(len(sample), args.queries, replace=len(sample) < args.queries)]
+        queries = picks + rng.standard_normal(picks.shape, dtype=np.float32) * 0.1
+        truth, latencies = await run_queries(conn, queries, project_id, args.top_k, args.metric, exact=True)
+        report('exact', truth, latencies, truth, args.top_k)
+        for method in args.methods:
+            started = time.perf_counter()
+            options = {'lists': max(args.rows // 1000, 10)} if method == 'ivfflat' else {}
+            name = await create_vector_index(conn, method, args.metric, concurrently=False, **options)
+            size = await conn.fetchval('SELECT pg_relation_size($1::regclass)', name)
+            print(f"{name}: построен за {time.perf_counter() - started:.1f}s, {size / 2**20:.0f} MiB")
+            try:
+                for value in (args.ef_search if method == 'hnsw' else args.probes):
+                    params = {'ef_search': value} if method == 'hnsw' else {'probes': value}
+                    results, latencies = await run_queries(conn, queries, project_id, args.top_k, args.metric, **params)
+                    report(f"{method} {next(iter(params))}={value}", results, latencies, truth, args.top_k)
+            finally:
+                await drop_vector_index(conn, method, args.metric, concurrently=False)
+    finally:
+        await conn.execute('DELETE FROM embeddings WHERE project_id = $1', project_id)
+        await conn.execute('DELETE FROM projects WHERE id = $1', project_id)
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -2,16 +2,21 @@ import json
 import os
 from typing import Dict, Any, List
 from src.mcp.memory.memory_bank import MemoryBank
+from src.mcp.memory import task_store
+from src.mcp.memory.task_store import TaskJournal
 import asyncio
 
 class CACD:
     """
     CACD — обработчик команд, задач, контекста и Cursor Rules (асинхронно, PostgreSQL).
     """
-    def __init__(self, dsn=None, memory_bank: MemoryBank = None, rules_path: str = 'cursor_rules.json', tasks_path: str = 'tasks.mdf'):
+    def __init__(self, dsn=None, memory_bank: MemoryBank = None, rules_path: str = 'cursor_rules.json', tasks_path: str = 'tasks.mdf',
+                 journal: TaskJournal = None):
         self.memory = memory_bank or MemoryBank(dsn)
         self.rules_path = rules_path
+        # Задачи хранятся в таблице tasks; tasks.mdf — только выгрузка (memory_bank_cli tasks-export)
         self.tasks_path = tasks_path
+        self.journal = journal or TaskJournal()
         self.backlog: List[Dict[str, Any]] = []
         self._load_rules()
 
@@ -26,30 +31,15 @@ class CACD:
         with open(self.rules_path, 'w') as f:
             json.dump(self.rules, f, indent=2)
 
-    def _load_tasks(self):
-        if os.path.exists(self.tasks_path):
-            try:
-                if os.path.getsize(self.tasks_path) == 0:
-                    return []
-                with open(self.tasks_path, 'r') as f:
-                    return json.load(f)
-            except Exception:
-                return []
-        return []
-
-    def _save_tasks(self, tasks):
-        with open(self.tasks_path, 'w') as f:
-            json.dump(tasks, f, indent=2)
-
     async def process_command(self, command: str, task_id: str, cli_mode=False) -> Dict[str, Any]:
         """
         Обрабатывает команду: ищет контекст, применяет правила, формирует задачу.
+        Задача с таким id уже есть — task_store.TaskExistsError, ни задача, ни её контекст не меняются.
         """
         if cli_mode:
             context = input(f'Введите контекст для задачи {task_id}: ')
         else:
             context = "test context"
-        await self.memory.save_context(task_id, context)
         # Применяем правила (пример: приоритет)
         applied_rules = [r for r in self.rules if r.get('type') == 'priority']
         task = {
@@ -59,10 +49,12 @@ class CACD:
             'rules': applied_rules,
             'status': 'pending'
         }
-        # Добавляем задачу в tasks.mdf
-        tasks = self._load_tasks()
-        tasks.append(task)
-        self._save_tasks(tasks)
+        # Вставка по ключу в таблицу tasks: без перезаписи файла и потери параллельных записей
+        pool = await self.memory.get_pool()
+        async with pool.acquire() as conn:
+            task = await task_store.insert_task(conn, task)
+        await self.memory.save_context(task_id, context)
+        self.journal.append('created', task)
         self.backlog.append(task)
         return task
 
@@ -70,23 +62,22 @@ class CACD:
         """
         Завершает задачу, обновляет контекст, добавляет новое правило.
         """
-        tasks = self._load_tasks()
-        for task in tasks:
-            if task['id'] == task_id:
-                task['status'] = 'done'
-                task['result'] = result
-                await self.memory.save_context(task_id, task['context'])
-                # Добавляем новое правило
-                new_rule = {
-                    'id': f'rule{len(self.rules)+1}',
-                    'type': 'priority',
-                    'value': 'medium'
-                }
-                self.rules.append(new_rule)
-                self._save_rules()
-                self._save_tasks(tasks)
-                self.generate_doc(task)
-                break
+        pool = await self.memory.get_pool()
+        async with pool.acquire() as conn:
+            task = await task_store.complete_task(conn, task_id, result)
+        if task is None:
+            return
+        self.journal.append('completed', task)
+        await self.memory.save_context(task_id, task['context'])
+        # Добавляем новое правило
+        new_rule = {
+            'id': f'rule{len(self.rules)+1}',
+            'type': 'priority',
+            'value': 'medium'
+        }
+        self.rules.append(new_rule)
+        self._save_rules()
+        self.generate_doc(task)
 
     def generate_doc(self, task: Dict[str, Any]):
         """
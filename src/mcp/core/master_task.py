@@ -2,6 +2,7 @@ import argparse
 import json
 import asyncio
 from cacd import CACD
+from src.mcp.memory.task_store import TaskExistsError
 import httpx
 import os
 
@@ -27,7 +28,11 @@ async def main():
         await cacd.complete_task(args.task_id, args.result)
         print(f'Задача {args.task_id} завершена.')
     else:
-        task = await cacd.process_command(args.command, args.task_id)
+        try:
+            task = await cacd.process_command(args.command, args.task_id)
+        except TaskExistsError as e:
+            print(e)
+            return
         print(f'Задача создана: {json.dumps(task, indent=2)}')
 
 async def auto_snapshot_agent():
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("mcp.vcs")
+
+# Таймаут одной git-команды, секунды
+GIT_TIMEOUT = float(os.getenv("GIT_TIMEOUT", "60"))
+
+
+class GitError(RuntimeError):
+    def __init__(self, args: List[str], returncode: int, stderr: str):
+        super().__init__(f"git {' '.join(args)} завершился с кодом {returncode}: {stderr.strip()}")
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class GitRepo:
+    """
+    Асинхронный адаптер git: команды запускаются через asyncio.create_subprocess_exec
+    и не блокируют event loop. Операции над одним репозиторием сериализуются локом
+    (git сам не допускает параллельных commit/checkout — index.lock).
+    """
+    def __init__(self, path: str = '.', timeout: float = GIT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._loop = None
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Лок привязан к event loop — при смене loop (тесты, CLI) создаём новый
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def _record(self, command: str, wait: float, elapsed: float, failed: bool):
+        m = self._metrics.setdefault(command, {'count': 0, 'errors': 0, 'total_s': 0.0, 'max_s': 0.0, 'wait_s': 0.0})
+        m['count'] += 1
+        m['errors'] += int(failed)
+        m['total_s'] += elapsed
+        m['max_s'] = max(m['max_s'], elapsed)
+        m['wait_s'] += wait
+
+    async def _exec(self, args, check: bool, queued: float) -> str:
+        """Выполняет одну git-команду; вызывается только под локом."""
+        command = args[0] if args else ''
+        started = time.perf_counter()
+        failed = True
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                'git', *args, cwd=self.path,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise GitError(list(args), -1, f'timeout {self.timeout}s')
+            if check and proc.returncode != 0:
+                raise GitError(list(args), proc.returncode, stderr.decode('utf-8', 'replace'))
+            failed = proc.returncode != 0
+            return stdout.decode('utf-8', 'replace')
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record(command, started - queued, elapsed, failed)
+            logger.debug(f"git {command}: {elapsed:.3f}s (ожидание лока {started - queued:.3f}s)")
+
+    async def run(self, *args: str, check: bool = True) -> str:
+        """Выполняет git <args> в репозитории, возвращает stdout. При check и ненулевом коде — GitError."""
+        queued = time.perf_counter()
+        async with self._get_lock():
+            return await self._exec(args, check, queued)
+
+    async def commit_paths(self, paths: List[str], message: str, tag: Optional[str] = None) -> None:
+        """
+        add + commit (+ tag) под одним захватом лока: иначе add двух параллельных снапшотов
+        перемешиваются, первый commit забирает оба набора путей, а второй падает с "nothing to commit".
+        """
+        queued = time.perf_counter()
+        async with self._get_lock():
+            await self._exec(('add', '--', *paths), True, queued)
+            await self._exec(('commit', '-m', message), True, time.perf_counter())
+            if tag:
+                await self._exec(('tag', tag), True, time.perf_counter())
+
+    async def add(self, *paths: str) -> None:
+        await self.run('add', '--', *paths)
+
+    async def commit(self, message: str) -> None:
+        await self.run('commit', '-m', message)
+
+    async def tag(self, name: str) -> None:
+        await self.run('tag', name)
+
+    async def checkout(self, ref: str, *paths: str) -> None:
+        await self.run('checkout', ref, '--', *paths)
+
+    async def tags(self, prefix: Optional[str] = None) -> List[str]:
+        out = await self.run('tag', '--list', f'{prefix}*' if prefix else '*')
+        return [t for t in out.splitlines() if t]
+
+    async def log_file(self, path: str, pretty: str = '%h|%an|%ad|%s') -> List[str]:
+        out = await self.run('log', f'--pretty=format:{pretty}', '--date=iso', '--', path)
+        return [line for line in out.splitlines() if line]
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Счётчики по командам: count, errors, total_s, max_s, wait_s (время ожидания лока)."""
+        return {cmd: dict(m) for cmd, m in self._metrics.items()}
+
+
+_repos: Dict[str, GitRepo] = {}
+
+
+def get_repo(path: str = '.') -> GitRepo:
+    """Один адаптер (и один лок) на репозиторий в процессе."""
+    key = os.path.realpath(path)
+    if key not in _repos:
+        _repos[key] = GitRepo(key)
+    return _repos[key]
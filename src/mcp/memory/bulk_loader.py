@@ -0,0 +1,103 @@
+import itertools
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("memory_bank.bulk_loader")
+
+# Сколько строк уходит в один COPY / executemany
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+
+
+def _jsonb(value):
+    # asyncpg отдаёт jsonb строкой: такие значения не кодируем повторно
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _vector_text(value):
+    # Вектор из архива — список или уже текстовое представление pgvector '[...]'
+    if value is None or isinstance(value, str):
+        return value
+    return '[' + ','.join(str(float(x)) for x in value) + ']'
+
+
+# Сущность архива -> таблица, колонки и преобразование строки в запись
+BULK_TABLES = {
+    'tasks': {
+        'table': 'tasks',
+        'columns': ['id', 'project_id', 'command', 'context', 'rules', 'status', 'result'],
+        'record': lambda r, project_id, user_id: (r['id'], project_id, r.get('command'), r.get('context'), _jsonb(r.get('rules')), r.get('status'), r.get('result')),
+    },
+    'rules': {
+        'table': 'cursor_rules',
+        'columns': ['id', 'project_id', 'type', 'value', 'description'],
+        'record': lambda r, project_id, user_id: (r['id'], project_id, r.get('type'), r.get('value'), r.get('description')),
+    },
+    'templates': {
+        'table': 'templates',
+        'columns': ['project_id', 'name', 'repo_url', 'tags'],
+        'record': lambda r, project_id, user_id: (project_id, r.get('name'), r.get('repo_url'), r.get('tags')),
+    },
+    'embeddings': {
+        'table': 'embeddings',
+        'columns': ['project_id', 'task_id', 'vector', 'description', 'entity_type', 'entity_id', 'model'],
+        'record': lambda r, project_id, user_id: (project_id, r.get('task_id'), _vector_text(r.get('vector')), r.get('description'),
+                                                  r.get('entity_type'), r.get('entity_id') or r.get('task_id'), r.get('model')),
+        # У vector нет бинарного кодека в asyncpg — COPY BINARY невозможен, грузим executemany с текстовым кастом
+        'insert_sql': '''INSERT INTO embeddings (project_id, task_id, vector, description, entity_type, entity_id, model)
+                         VALUES ($1, $2, $3::text::vector, $4, $5, $6, $7)''',
+    },
+    'docs': {
+        'table': 'docs',
+        'columns': ['project_id', 'type', 'content'],
+        'record': lambda r, project_id, user_id: (project_id, r.get('type'), r.get('content')),
+    },
+    'history': {
+        'table': 'history',
+        'columns': ['project_id', 'user_id', 'action', 'details'],
+        'record': lambda r, project_id, user_id: (project_id, user_id, r.get('action'), _jsonb(r.get('details'))),
+    },
+}
+
+
+def _batches(rows: Iterable[Any], size: int):
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+async def bulk_load(conn, project_id: int, entities: Dict[str, Iterable[dict]], user_id: str = None,
+                    on_progress: Optional[Callable[[str, int], None]] = None,
+                    batch_size: int = BULK_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Загружает сущности проекта пачками через COPY (copy_records_to_table) или executemany.
+    Транзакцию открывает вызывающий код — импорт либо применяется целиком, либо не применяется вовсе.
+    on_progress(entity, loaded) вызывается после каждой пачки. Возвращает число строк по сущностям.
+    """
+    counts = {}
+    for entity, rows in entities.items():
+        spec = BULK_TABLES[entity]
+        loaded = 0
+        for batch in _batches(rows, batch_size):
+            records = [spec['record'](r, project_id, user_id) for r in batch]
+            if 'insert_sql' in spec:
+                await conn.executemany(spec['insert_sql'], records)
+            else:
+                await conn.copy_records_to_table(spec['table'], records=records, columns=spec['columns'])
+            loaded += len(records)
+            if on_progress:
+                on_progress(entity, loaded)
+        counts[entity] = loaded
+    return counts
+
+
+def log_progress(prefix: str) -> Callable[[str, int], None]:
+    def report(entity: str, loaded: int):
+        logger.info(f"{prefix}: {entity} — загружено {loaded}")
+    return report
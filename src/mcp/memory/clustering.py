@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.mcp.memory.vector_cache import parse_vectors
+from src.mcp.memory.vector_index import entity_type_predicate
+
+logger = logging.getLogger("memory_bank.clustering")
+
+# Процессы для обучения/разметки: CPU-bound работа не блокирует event loop и не держит GIL
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "2"))
+# Строк на пачку partial_fit / разметки (и prefetch курсора)
+CLUSTER_BATCH_SIZE = int(os.getenv("CLUSTER_BATCH_SIZE", "4096"))
+
+CLUSTER_MODES = ('minibatch', 'stream')
+
+JOB_COLUMNS = 'id, project_id, status, mode, n_clusters, entity_type, rows, inertia, error, created_at, started_at, finished_at'
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Ссылки на запущенные задачи: asyncio хранит только слабые ссылки
+_running: Dict[str, asyncio.Task] = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CLUSTER_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    """Останавливает пул процессов при остановке приложения; незапущенные вызовы отменяются."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+
+
+# --- Функции, выполняемые в процессах пула (должны быть на уровне модуля для pickle) ---
+
+def _fit_minibatch(X: np.ndarray, n_clusters: int, batch_size: int) -> np.ndarray:
+    from sklearn.cluster import MiniBatchKMeans
+    model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=42, n_init=3)
+    model.fit(X)
+    return model.cluster_centers_.astype(np.float32)
+
+
+def _partial_fit(model, X: np.ndarray, n_clusters: int):
+    if model is None:
+        from sklearn.cluster import MiniBatchKMeans
+        model = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+    return model.partial_fit(X)
+
+
+def assign_labels(centers: np.ndarray, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Ближайший центроид и квадрат расстояния до него: ||x||^2 - 2 x·c + ||c||^2 одним matmul."""
+    d = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    labels = d.argmin(axis=1)
+    return labels, np.maximum(d[np.arange(len(X)), labels], 0)
+
+
+# --- Чтение и запись ---
+
+def _source_query(entity_type: Optional[str]) -> str:
+    # Keyset-пагинация: $2 — последний прочитанный id, $3 — размер пачки
+    sql = 'SELECT id, vector_send(vector) AS vector FROM embeddings WHERE project_id = $1 AND id > $2'
+    if entity_type:
+        sql += f' AND {entity_type_predicate(entity_type)}'
+    return sql + ' ORDER BY id LIMIT $3'
+
+
+async def iter_vector_batches(pool, project_id: int, entity_type: Optional[str] = None,
+                              batch_size: int = CLUSTER_BATCH_SIZE) -> AsyncIterator[Tuple[List[int], np.ndarray]]:
+    """
+    Векторы проекта пачками (id, матрица float32) по keyset-пагинации. Соединение берётся на одну выборку
+    и сразу возвращается в пул: обучение между пачками не держит ни соединение, ни транзакцию.
+    """
+    sql, last_id = _source_query(entity_type), 0
+    while True:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(sql, project_id, last_id, batch_size)
+        if not rows:
+            return
+        ids = [r['id'] for r in rows]
+        yield ids, parse_vectors([r['vector'] for r in rows])
+        if len(rows) < batch_size:
+            return
+        last_id = ids[-1]
+
+
+async def _update_job(pool, job_id: str, **fields):
+    assignments = ', '.join(f'{k} = ${i + 2}' for i, k in enumerate(fields))
+    async with pool.acquire() as conn:
+        await conn.execute(f'UPDATE cluster_jobs SET {assignments} WHERE id = $1', job_id, *fields.values())
+
+
+async def create_job(memory_bank, project_id: int, n_clusters: int, mode: str = 'minibatch',
+                     entity_type: Optional[str] = None) -> Dict[str, Any]:
+    if mode not in CLUSTER_MODES:
+        raise ValueError(f"Неизвестный режим кластеризации: {mode} (доступны {', '.join(CLUSTER_MODES)})")
+    if n_clusters < 1:
+        raise ValueError("n_clusters должно быть >= 1")
+    if entity_type:
+        entity_type_predicate(entity_type)
+    pool = await memory_bank.get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            f'''INSERT INTO cluster_jobs (id, project_id, status, mode, n_clusters, entity_type)
+                VALUES ($1, $2, 'queued', $3, $4, $5) RETURNING {JOB_COLUMNS}''',
+            uuid.uuid4().hex, project_id, mode, n_clusters, entity_type
+        )
+    return dict(row)
+
+
+async def run_job(memory_bank, job: Dict[str, Any], batch_size: int = CLUSTER_BATCH_SIZE):
+    """
+    Обучение и разметка в пуле процессов. Чтение — пачками по keyset, соединение не удерживается
+    на время обучения: minibatch — все векторы в одну матрицу и MiniBatchKMeans.fit;
+    stream — partial_fit по пачкам (в памяти одна пачка), затем второй проход для меток.
+    Метки пишутся COPY по пачке сразу после разметки, центроиды и статус done — в конце одной транзакцией;
+    при ошибке частично записанные метки задания удаляются.
+    """
+    job_id, project_id, n_clusters = job['id'], job['project_id'], job['n_clusters']
+    pool = await memory_bank.get_pool()
+    try:
+        await _update_job(pool, job_id, status='running', started_at=datetime.datetime.utcnow())
+        sizes, inertia, rows = np.zeros(n_clusters, dtype=np.int64), 0.0, 0
+        if job['mode'] == 'stream':
+            model = None
+            async for ids, X in iter_vector_batches(pool, project_id, job['entity_type'], batch_size):
+                if model is None and len(X) < n_clusters:
+                    raise ValueError("Недостаточно эмбеддингов для кластеризации")
+                model = await _in_pool(_partial_fit, model, X, n_clusters)
+            if model is None:
+                raise ValueError("Недостаточно эмбеддингов для кластеризации")
+            centers = model.cluster_centers_.astype(np.float32)
+            batches = iter_vector_batches(pool, project_id, job['entity_type'], batch_size)
+        else:
+            all_ids, parts = [], []
+            async for ids, X in iter_vector_batches(pool, project_id, job['entity_type'], batch_size):
+                all_ids.extend(ids)
+                parts.append(X)
+            if len(all_ids) < n_clusters:
+                raise ValueError("Недостаточно эмбеддингов для кластеризации")
+            centers = await _in_pool(_fit_minibatch, np.concatenate(parts), n_clusters, batch_size)
+
+            async def read_batches():
+                offset = 0
+                for X in parts:
+                    yield all_ids[offset:offset + len(X)], X
+                    offset += len(X)
+            batches = read_batches()
+        async for ids, X in batches:
+            labels, dist = await _in_pool(assign_labels, centers, X)
+            async with pool.acquire() as conn:
+                await conn.copy_records_to_table('embedding_cluster_labels', records=zip([job_id] * len(ids), ids, labels.tolist()),
+                                                 columns=['job_id', 'embedding_id', 'cluster'])
+            sizes += np.bincount(labels, minlength=n_clusters)
+            inertia += float(dist.sum())
+            rows += len(ids)
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    'INSERT INTO embedding_clusters (job_id, cluster, centroid, size) VALUES ($1, $2, $3, $4)',
+                    [(job_id, i, centers[i].tolist(), int(sizes[i])) for i in range(n_clusters)]
+                )
+                await conn.execute(
+                    '''UPDATE cluster_jobs SET status = 'done', rows = $2, inertia = $3, finished_at = $4 WHERE id = $1''',
+                    job_id, rows, inertia, datetime.datetime.utcnow()
+                )
+    except Exception as e:
+        logger.exception(f"Кластеризация {job_id} (project {project_id}) завершилась ошибкой")
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('DELETE FROM embedding_cluster_labels WHERE job_id = $1', job_id)
+                await conn.execute(
+                    'UPDATE cluster_jobs SET status = $2, error = $3, finished_at = $4 WHERE id = $1',
+                    job_id, 'failed', str(e), datetime.datetime.utcnow()
+                )
+
+
+def start_job(memory_bank, job: Dict[str, Any]) -> asyncio.Task:
+    task = asyncio.create_task(run_job(memory_bank, job))
+    _running[job['id']] = task
+    task.add_done_callback(lambda _: _running.pop(job['id'], None))
+    return task
+
+
+async def get_job(conn, job_id: str) -> Optional[Dict[str, Any]]:
+    row = await conn.fetchrow(f'SELECT {JOB_COLUMNS} FROM cluster_jobs WHERE id = $1', job_id)
+    return dict(row) if row else None
+
+
+async def get_clusters(conn, job_id: str, include_members: bool = False) -> Dict[str, Any]:
+    """Центроиды и размеры кластеров задания; include_members — состав кластеров (entity_id, description)."""
+    rows = await conn.fetch('SELECT cluster, centroid, size FROM embedding_clusters WHERE job_id = $1 ORDER BY cluster', job_id)
+    result = {'centroids': [list(r['centroid']) for r in rows], 'sizes': {r['cluster']: r['size'] for r in rows}}
+    if include_members:
+        members = await conn.fetch(
+            '''SELECT l.cluster, COALESCE(e.entity_id, e.task_id) AS entity_id, e.description FROM embedding_cluster_labels l
+               JOIN embeddings e ON e.id = l.embedding_id WHERE l.job_id = $1 ORDER BY l.cluster, e.id''',
+            job_id
+        )
+        clusters = {}
+        for m in members:
+            clusters.setdefault(m['cluster'], []).append({'entity_id': m['entity_id'], 'description': m['description']})
+        result['clusters'] = clusters
+    return result
+
+
+async def latest_done_job_id(conn, project_id: int) -> Optional[str]:
+    return await conn.fetchval(
+        '''SELECT id FROM cluster_jobs WHERE project_id = $1 AND status = 'done'
+           ORDER BY created_at DESC LIMIT 1''',
+        project_id
+    )
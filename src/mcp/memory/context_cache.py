@@ -0,0 +1,100 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Кэш контекста задач в MemoryBank (0 — выключен)
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+# Предел устаревания, если уведомление другого воркера потеряно
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "30"))
+# Канал LISTEN/NOTIFY для инвалидации между воркерами
+CONTEXT_CACHE_CHANNEL = os.getenv("CONTEXT_CACHE_CHANNEL", "memory_bank_context")
+
+# Промах кэша (None — валидное значение: строка есть, но другого проекта)
+MISSING = object()
+
+
+class ContextCache:
+    """
+    LRU с TTL: task_id -> (data, project_id, время загрузки). Кэшируется строка context целиком (task_id — ключ
+    таблицы), поэтому фильтр по project_id проверяется по кэшу. Отсутствующие строки не кэшируются.
+    Чтение из БД обрамляется begin/end: запись или инвалидация ключа во время чтения
+    не даст результату чтения перезаписать кэш устаревшими данными.
+    """
+    def __init__(self, max_size: int = CONTEXT_CACHE_SIZE, ttl: float = CONTEXT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, Optional[int], float]]" = OrderedDict()
+        # Только ключи с чтениями в полёте: task_id -> [число чтений, поколение]
+        self._reading: Dict[str, list] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, task_id: str, project_id: int = None):
+        """Данные контекста (None — строка другого проекта) или MISSING при промахе."""
+        entry = self._entries.get(task_id)
+        if entry is None or time.monotonic() - entry[2] >= self.ttl:
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(task_id)
+        self.hits += 1
+        data, row_project_id, _ = entry
+        return data if not project_id or row_project_id == project_id else None
+
+    def begin(self, task_id: str) -> Tuple[int, int]:
+        state = self._reading.setdefault(task_id, [0, 0])
+        state[0] += 1
+        return self._epoch, state[1]
+
+    def end(self, task_id: str, token: Tuple[int, int], row: Optional[Tuple[str, Optional[int]]] = None):
+        """Завершение чтения: row = (data, project_id) попадает в кэш, если ключ не менялся с begin."""
+        state = self._reading[task_id]
+        if row is not None and token == (self._epoch, state[1]):
+            self._store(task_id, *row)
+        state[0] -= 1
+        if not state[0]:
+            del self._reading[task_id]
+
+    def put(self, task_id: str, data: str, project_id: Optional[int]):
+        """Write-through из save_context."""
+        self._bump(task_id)
+        self._store(task_id, data, project_id)
+
+    def invalidate(self, task_id: str):
+        self._bump(task_id)
+        if self._entries.pop(task_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        """Сброс всего кэша (например, после разрыва LISTEN-соединения: уведомления могли потеряться)."""
+        self._epoch += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def _bump(self, task_id: str):
+        if task_id in self._reading:
+            self._reading[task_id][1] += 1
+
+    def _store(self, task_id: str, data: str, project_id: Optional[int]):
+        if not self.enabled:
+            return
+        self._entries[task_id] = (data, project_id, time.monotonic())
+        self._entries.move_to_end(task_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled, 'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl,
+            'hits': self.hits, 'misses': self.misses, 'hit_ratio': round(self.hits / total, 4) if total else None,
+            'evictions': self.evictions, 'invalidations': self.invalidations,
+        }
@@ -0,0 +1,139 @@
+import hashlib
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+# Поля, которые не участвуют в сравнении: project_id у архива и у целевого проекта различается;
+# search_tsv — генерируемая колонка (0007), в архивах старого формата (SELECT *) она ещё есть;
+# created_at — время вставки, у одинаковых строк разных проектов оно разное
+DEFAULT_IGNORE_FIELDS = ('project_id', 'search_tsv', 'created_at')
+
+ADDED = 'added'
+UPDATED = 'updated'
+SKIPPED = 'skipped'
+
+
+def row_hash(row: Dict[str, Any], ignore_fields: Tuple[str, ...] = DEFAULT_IGNORE_FIELDS) -> str:
+    """
+    Стабильный хеш содержимого строки: не зависит от порядка ключей,
+    datetime и прочие типы приводятся к строке так же, как при экспорте (default=str).
+    """
+    payload = {k: v for k, v in row.items() if k not in ignore_fields}
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _empty_diff() -> Dict[str, List]:
+    return {'added': [], 'updated': [], 'conflicted': [], 'skipped': []}
+
+
+def _record(diff: Dict[str, List], status: str, key: str, current, incoming):
+    if status == ADDED:
+        diff['added'].append(incoming)
+    elif status == UPDATED:
+        diff['updated'].append(incoming)
+        diff['conflicted'].append({'id': key, 'current': current, 'incoming': incoming})
+    else:
+        diff['skipped'].append(current)
+
+
+def diff_rows(current: Iterable[Dict[str, Any]], incoming: Iterable[Dict[str, Any]], key: str = 'id',
+              ignore_fields: Tuple[str, ...] = DEFAULT_IGNORE_FIELDS) -> Dict[str, List]:
+    """
+    Diff по id за один проход по incoming: сравниваются хеши, а не целые словари.
+    Для текущей стороны в памяти держится только индекс id -> (хеш, строка).
+    Формат результата совместим с прежним diff_by_id: added / updated / conflicted / skipped.
+    """
+    index = {str(row[key]): (row_hash(row, ignore_fields), row) for row in current}
+    diff = _empty_diff()
+    for row in incoming:
+        k = str(row[key])
+        found = index.get(k)
+        if found is None:
+            _record(diff, ADDED, k, None, row)
+        elif found[0] != row_hash(row, ignore_fields):
+            _record(diff, UPDATED, k, found[1], row)
+        else:
+            _record(diff, SKIPPED, k, found[1], row)
+    return diff
+
+
+def _check_sorted(side: str, key: str, prev, k):
+    # Сравнение Python (<) совпадает с порядком БД только для чисел и для текста в COLLATE "C" (по байтам)
+    if prev is not None and k < prev:
+        raise ValueError(f"{side} не отсортирован по {key}: {k!r} после {prev!r}")
+
+
+def _status(current, incoming, ignore_fields) -> str:
+    return SKIPPED if row_hash(current, ignore_fields) == row_hash(incoming, ignore_fields) else UPDATED
+
+
+def diff_sorted(current: Iterable[Dict[str, Any]], incoming: Iterable[Dict[str, Any]], key: str = 'id',
+                ignore_fields: Tuple[str, ...] = DEFAULT_IGNORE_FIELDS) -> Iterator[Tuple[str, Any, Any, Any]]:
+    """
+    Потоковый diff двух последовательностей, отсортированных по key (merge-join):
+    линейное время и O(1) дополнительной памяти. Выдаёт (status, key, current, incoming).
+    Строки, которые есть только в current, не выдаются (merge их не трогает).
+    Несортированная сторона — ValueError (текстовые ключи из БД — ORDER BY key COLLATE "C").
+    """
+    cur_it = iter(current)
+    cur = next(cur_it, None)
+    prev_key, prev_cur = None, cur[key] if cur is not None else None
+    for row in incoming:
+        k = row[key]
+        _check_sorted('incoming', key, prev_key, k)
+        prev_key = k
+        while cur is not None and cur[key] < k:
+            cur = next(cur_it, None)
+            if cur is not None:
+                _check_sorted('current', key, prev_cur, cur[key])
+                prev_cur = cur[key]
+        if cur is not None and cur[key] == k:
+            yield _status(cur, row, ignore_fields), k, cur, row
+        else:
+            yield ADDED, k, None, row
+
+
+async def diff_sorted_async(current: AsyncIterable, incoming: Iterable[Dict[str, Any]], key: str = 'id',
+                            ignore_fields: Tuple[str, ...] = DEFAULT_IGNORE_FIELDS) -> AsyncIterator[Tuple[str, Any, Any, Any]]:
+    """diff_sorted, у которого текущая сторона — асинхронный поток (серверный курсор asyncpg)."""
+    cur_it = current.__aiter__()
+
+    async def advance():
+        try:
+            return await cur_it.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    cur = await advance()
+    prev_key, prev_cur = None, cur[key] if cur is not None else None
+    for row in incoming:
+        k = row[key]
+        _check_sorted('incoming', key, prev_key, k)
+        prev_key = k
+        while cur is not None and cur[key] < k:
+            cur = await advance()
+            if cur is not None:
+                _check_sorted('current', key, prev_cur, cur[key])
+                prev_cur = cur[key]
+        if cur is not None and cur[key] == k:
+            yield _status(cur, row, ignore_fields), k, dict(cur), row
+        else:
+            yield ADDED, k, None, row
+
+
+def collect_diff(events: Iterable[Tuple[str, Any, Any, Any]], keep_skipped: bool = True) -> Dict[str, List]:
+    """Собирает события diff_sorted в словарь того же формата, что и diff_rows."""
+    diff = _empty_diff()
+    for status, k, current, incoming in events:
+        if status != SKIPPED or keep_skipped:
+            _record(diff, status, str(k), current, incoming)
+    return diff
+
+
+async def collect_diff_async(events: AsyncIterable, keep_skipped: bool = True) -> Dict[str, List]:
+    """collect_diff для diff_sorted_async; keep_skipped=False — совпавшие строки не копятся в памяти."""
+    diff = _empty_diff()
+    async for status, k, current, incoming in events:
+        if status != SKIPPED or keep_skipped:
+            _record(diff, status, str(k), current, incoming)
+    return diff
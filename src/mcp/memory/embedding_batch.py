@@ -0,0 +1,192 @@
+import json
+import os
+import struct
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.mcp.memory.vector_index import EMBEDDING_ENTITY_TYPES
+
+# Допустимые размерности эмбеддингов (как у /embeddings/add)
+EMBEDDING_DIMENSIONS = (384, 768, 1024)
+# Сколько векторов уходит в один COPY
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "5000"))
+
+# (entity_ids, descriptions, матрица, entity_types)
+Batch = Tuple[List[str], List[Optional[str]], np.ndarray, List[Optional[str]]]
+
+
+class DimensionError(ValueError):
+    """Размерность векторов пачки не из допустимых; dimension — пришедшая размерность."""
+    def __init__(self, dimension: int):
+        super().__init__(f"Неподдерживаемая размерность эмбеддинга: {dimension}")
+        self.dimension = dimension
+
+
+def validate_matrix(matrix: np.ndarray, dimensions=EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Проверка пачки целиком: двумерная float32-матрица допустимой размерности без NaN/inf."""
+    if matrix.ndim != 2:
+        raise ValueError("Ожидается матрица векторов (N, D)")
+    if matrix.shape[1] not in dimensions:
+        raise DimensionError(matrix.shape[1])
+    if not np.isfinite(matrix).all():
+        bad = int(np.flatnonzero(~np.isfinite(matrix).all(axis=1))[0])
+        raise ValueError(f"Вектор #{bad} содержит NaN или inf")
+    return matrix
+
+
+def validate_entity_types(entity_types: List[Optional[str]]) -> List[Optional[str]]:
+    unknown = set(entity_types) - set(EMBEDDING_ENTITY_TYPES) - {None}
+    if unknown:
+        raise ValueError(f"Неизвестный entity_type: {', '.join(sorted(unknown))}")
+    return entity_types
+
+
+def _ndjson_batch(lines: List[bytes], dimensions=EMBEDDING_DIMENSIONS) -> Batch:
+    ids, descriptions, vectors, entity_types = [], [], [], []
+    for line in lines:
+        item = json.loads(line)
+        ids.append(str(item['entity_id']))
+        descriptions.append(item.get('description'))
+        vectors.append(item['vector'])
+        entity_types.append(item.get('entity_type'))
+    try:
+        matrix = np.asarray(vectors, dtype=np.float32)
+    except ValueError:
+        raise ValueError("Векторы в пачке разной размерности")
+    return ids, descriptions, validate_matrix(matrix, dimensions), validate_entity_types(entity_types)
+
+
+async def iter_ndjson_batches(chunks: AsyncIterator[bytes], batch_size: int = EMBEDDING_BATCH_SIZE,
+                              dimensions=EMBEDDING_DIMENSIONS) -> AsyncIterator[Batch]:
+    """
+    NDJSON: по строке {"entity_id": ..., "vector": [...], "description": ..., "entity_type": ...} на вектор.
+    Тело читается потоково, в памяти — не больше batch_size строк. dimensions — допустимые размерности.
+    """
+    buf = b''
+    lines = []
+    async for chunk in chunks:
+        buf += chunk
+        *complete, buf = buf.split(b'\n')
+        lines.extend(line for line in complete if line.strip())
+        while len(lines) >= batch_size:
+            yield _ndjson_batch(lines[:batch_size], dimensions)
+            lines = lines[batch_size:]
+    if buf.strip():
+        lines.append(buf)
+    if lines:
+        yield _ndjson_batch(lines, dimensions)
+
+
+async def iter_packed_batches(chunks: AsyncIterator[bytes], batch_size: int = EMBEDDING_BATCH_SIZE,
+                              dimensions=EMBEDDING_DIMENSIONS) -> AsyncIterator[Batch]:
+    """
+    Упакованный формат (application/octet-stream):
+        uint32 LE — длина заголовка, заголовок JSON {"shape": [N, D], "entity_ids": [...], "descriptions": [...], "entity_types": [...]},
+        затем N*D float32 little-endian по строкам.
+    Векторы не разбираются из текста: пачка — это np.frombuffer над байтами тела.
+    """
+    buf = bytearray()
+    header = None
+    offset = 0
+    async for chunk in chunks:
+        buf += chunk
+        if header is None:
+            if len(buf) < 4:
+                continue
+            (header_len,) = struct.unpack('<I', buf[:4])
+            if len(buf) < 4 + header_len:
+                continue
+            header = json.loads(bytes(buf[4:4 + header_len]))
+            n, dim = (int(x) for x in header['shape'])
+            if dim not in dimensions:
+                raise DimensionError(dim)
+            ids = [str(x) for x in header['entity_ids']]
+            if len(ids) != n:
+                raise ValueError(f"entity_ids: {len(ids)} значений при shape[0] = {n}")
+            descriptions = header.get('descriptions') or [None] * n
+            entity_types = validate_entity_types(header.get('entity_types') or [None] * n)
+            row_bytes = dim * 4
+            del buf[:4 + header_len]
+        while offset < n and len(buf) >= min(batch_size, n - offset) * row_bytes:
+            rows = min(batch_size, n - offset)
+            matrix = np.frombuffer(bytes(buf[:rows * row_bytes]), dtype='<f4').reshape(rows, dim)
+            yield ids[offset:offset + rows], descriptions[offset:offset + rows], validate_matrix(matrix, dimensions), entity_types[offset:offset + rows]
+            del buf[:rows * row_bytes]
+            offset += rows
+    if header is None:
+        raise ValueError("Пустое тело или неполный заголовок")
+    if offset < n or buf:
+        raise ValueError(f"Размер данных не совпадает с shape: получено {offset} из {n} векторов")
+
+
+def pack_vectors(matrix: np.ndarray, entity_ids: List[str], descriptions: List[str] = None,
+                 entity_types: List[str] = None) -> bytes:
+    """Клиентская сторона упакованного формата (тесты, скрипты загрузки)."""
+    matrix = np.asarray(matrix, dtype='<f4')
+    header = {'shape': list(matrix.shape), 'entity_ids': list(entity_ids)}
+    if descriptions is not None:
+        header['descriptions'] = list(descriptions)
+    if entity_types is not None:
+        header['entity_types'] = list(entity_types)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return struct.pack('<I', len(header_bytes)) + header_bytes + matrix.tobytes()
+
+
+def _encode_vector(value) -> bytes:
+    # Бинарный формат pgvector: int16 dim, int16 unused, float4 big-endian
+    arr = np.asarray(value, dtype='>f4')
+    return struct.pack('>HH', arr.shape[0], 0) + arr.tobytes()
+
+
+def _decode_vector(data: bytes) -> str:
+    dim, _ = struct.unpack('>HH', data[:4])
+    return '[' + ','.join(repr(float(x)) for x in np.frombuffer(data[4:4 + dim * 4], dtype='>f4')) + ']'
+
+
+def _encode_halfvec(value) -> bytes:
+    # halfvec: тот же заголовок, значения — float16 big-endian
+    arr = np.asarray(value, dtype='>f2')
+    return struct.pack('>HH', arr.shape[0], 0) + arr.tobytes()
+
+
+def _decode_halfvec(data: bytes) -> str:
+    dim, _ = struct.unpack('>HH', data[:4])
+    return '[' + ','.join(repr(float(x)) for x in np.frombuffer(data[4:4 + dim * 2], dtype='>f2')) + ']'
+
+
+VECTOR_CODECS = {
+    'vector': (_encode_vector, _decode_vector),
+    'halfvec': (_encode_halfvec, _decode_halfvec),
+}
+
+
+async def copy_embeddings(conn, project_id: int, batch: Batch, entity_type: str = None, model: str = None,
+                          table: str = 'embeddings') -> int:
+    ids, descriptions, matrix, entity_types = batch
+    await conn.copy_records_to_table(
+        table,
+        records=[(project_id, ids[i], matrix[i], descriptions[i], entity_types[i] or entity_type, ids[i], model) for i in range(len(ids))],
+        columns=['project_id', 'task_id', 'vector', 'description', 'entity_type', 'entity_id', 'model'],
+    )
+    return len(ids)
+
+
+async def ingest_batches(conn, project_id: int, batches: AsyncIterator[Batch], entity_type: str = None, model: str = None,
+                         table: str = 'embeddings', vector_type: str = 'vector') -> int:
+    """
+    COPY всех пачек в таблицу модели (по умолчанию embeddings). На время загрузки на соединении
+    регистрируется бинарный кодек vector/halfvec (строки матрицы уходят без перевода в текст),
+    затем кодек сбрасывается, чтобы остальной код на этом соединении по-прежнему получал векторы текстом.
+    entity_type — тип по умолчанию для строк без своего. Транзакцию открывает вызывающий код.
+    Возвращает число вставленных векторов.
+    """
+    encoder, decoder = VECTOR_CODECS[vector_type]
+    await conn.set_type_codec(vector_type, schema='public', encoder=encoder, decoder=decoder, format='binary')
+    try:
+        total = 0
+        async for batch in batches:
+            total += await copy_embeddings(conn, project_id, batch, entity_type, model, table)
+        return total
+    finally:
+        await conn.reset_type_codec(vector_type, schema='public')
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, TypedDict
+
+from src.mcp.memory.vector_index import VECTOR_SEARCH_METRIC, VECTOR_TYPES, create_index_sql
+
+# Исходная таблица embeddings: vector(384), эмбеддинги без модели пишутся сюда
+DEFAULT_EMBEDDING_TABLE = 'embeddings'
+DEFAULT_EMBEDDING_DIMENSION = 384
+# Модели с размерностью от порога по умолчанию регистрируются в halfvec (0 — только явно)
+EMBEDDING_HALFVEC_MIN_DIM = int(os.getenv("EMBEDDING_HALFVEC_MIN_DIM", "0"))
+# Ограничения pgvector на размерность индексируемой колонки
+MAX_INDEXED_DIMENSIONS = {'vector': 2000, 'halfvec': 4000}
+
+MODEL_COLUMNS = 'name, dimension, storage, table_name, index_method, metric, created_at'
+
+
+class ModelNotRegisteredError(ValueError):
+    """Незарегистрированная модель, размерность которой не подходит общей таблице embeddings."""
+
+
+class EmbeddingModel(TypedDict):
+    name: Optional[str]
+    dimension: int
+    storage: str
+    table_name: str
+
+
+DEFAULT_MODEL: EmbeddingModel = {
+    'name': None, 'dimension': DEFAULT_EMBEDDING_DIMENSION, 'storage': 'vector', 'table_name': DEFAULT_EMBEDDING_TABLE,
+}
+
+# Записи реестра не меняются после регистрации — кэшируются на процесс
+_models: Dict[str, dict] = {}
+
+
+def model_table(name: str) -> str:
+    """Имя таблицы модели: читаемый slug + хэш имени (разные имена с одинаковым slug не сталкиваются)."""
+    slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')[:32]
+    return f'embeddings_{slug}_{hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]}'
+
+
+def create_table_sql(table: str, dimension: int, storage: str = 'vector') -> str:
+    """Та же схема, что у embeddings после 0008, но с размерностью и типом колонки модели."""
+    return f'''CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        project_id INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+        task_id TEXT,
+        vector {storage}({int(dimension)}),
+        description TEXT,
+        entity_type TEXT,
+        entity_id TEXT,
+        model TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    )'''
+
+
+def default_storage(dimension: int) -> str:
+    return 'halfvec' if EMBEDDING_HALFVEC_MIN_DIM and dimension >= EMBEDDING_HALFVEC_MIN_DIM else 'vector'
+
+
+async def register_model(conn, name: str, dimension: int, storage: Optional[str] = None, method: Optional[str] = 'hnsw',
+                         metric: str = VECTOR_SEARCH_METRIC, **index_options) -> dict:
+    """
+    Регистрирует модель: таблица {storage}({dimension}), btree-индексы под фильтры поиска и ANN-индекс method/metric
+    (method=None — без ANN-индекса, его можно построить позже: vector-index create --table ... --vector-type ...).
+    Повторная регистрация с теми же параметрами возвращает существующую запись, с другими — ValueError.
+    """
+    storage = storage or default_storage(dimension)
+    if storage not in VECTOR_TYPES:
+        raise ValueError(f"Неизвестный тип хранения: {storage} (доступны {', '.join(VECTOR_TYPES)})")
+    if not 0 < dimension <= MAX_INDEXED_DIMENSIONS[storage]:
+        raise ValueError(f"Размерность {dimension} вне диапазона 1..{MAX_INDEXED_DIMENSIONS[storage]} для {storage}")
+    existing = await get_model(conn, name)
+    if existing:
+        if (existing['dimension'], existing['storage']) != (dimension, storage):
+            raise ValueError(f"Модель {name} уже зарегистрирована: {existing['storage']}({existing['dimension']})")
+        return existing
+    table = model_table(name)
+    async with conn.transaction():
+        await conn.execute(create_table_sql(table, dimension, storage))
+        await conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_project_type ON {table} (project_id, entity_type)')
+        await conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_project_entity ON {table} (project_id, entity_id)')
+        await conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_project_created_id ON {table} (project_id, created_at, id)')
+        if method:
+            await conn.execute(create_index_sql(method, metric, table, concurrently=False, vector_type=storage, **index_options))
+        row = await conn.fetchrow(
+            f'''INSERT INTO embedding_models (name, dimension, storage, table_name, index_method, metric)
+                VALUES ($1, $2, $3, $4, $5, $6) RETURNING {MODEL_COLUMNS}''',
+            name, dimension, storage, table, method, metric
+        )
+    _models[name] = dict(row)
+    return _models[name]
+
+
+async def get_model(conn, name: str) -> Optional[dict]:
+    if name in _models:
+        return _models[name]
+    row = await conn.fetchrow(f'SELECT {MODEL_COLUMNS} FROM embedding_models WHERE name = $1', name)
+    if row is None:
+        return None
+    _models[name] = dict(row)
+    return _models[name]
+
+
+async def list_models(conn) -> List[dict]:
+    rows = await conn.fetch(f'SELECT {MODEL_COLUMNS} FROM embedding_models ORDER BY name')
+    return [dict(r) for r in rows]
+
+
+async def resolve_model(conn, name: Optional[str]) -> dict:
+    """
+    Хранилище модели: зарегистрированная — своя таблица, иначе общая embeddings (vector(384)).
+    Незарегистрированные имена пишутся в общую таблицу, как до реестра моделей.
+    """
+    if name:
+        model = await get_model(conn, name)
+        if model:
+            return model
+    return DEFAULT_MODEL
+
+
+def check_dimension(model: dict, name: Optional[str], dimension: int) -> None:
+    """
+    Размерность вектора должна совпадать с хранилищем модели (resolve_model).
+    Не совпала у незарегистрированного имени — ModelNotRegisteredError (нужна регистрация), иначе ValueError.
+    """
+    if dimension == model['dimension']:
+        return
+    if name and model['name'] is None:
+        raise ModelNotRegisteredError(
+            f"Модель {name} не зарегистрирована, а общая таблица {model['table_name']} ожидает размерность "
+            f"{model['dimension']}, получено {dimension} (зарегистрируйте модель: POST /embeddings/models)"
+        )
+    hint = '' if model['name'] else ' (для другой размерности зарегистрируйте модель: POST /embeddings/models)'
+    raise ValueError(f"Модель {name or 'по умолчанию'} ожидает размерность {model['dimension']}, получено {dimension}{hint}")
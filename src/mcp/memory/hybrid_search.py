@@ -0,0 +1,124 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.mcp.memory.vector_index import (
+    VECTOR_METRICS, VECTOR_SEARCH_METRIC, apply_search_params, entity_type_predicate, vector_literal,
+)
+
+# Конфигурация to_tsvector из миграции 0007 (генерируемые колонки search_tsv)
+FULLTEXT_CONFIG = 'simple'
+# Константа k в reciprocal rank fusion: score = Σ 1 / (k + rank)
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Глубина каждого списка (лексического и векторного) до слияния
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+HYBRID_SNIPPET_CHARS = 300
+
+# Источник -> (таблица, id как text, текстовая колонка, колонка фильтра)
+HYBRID_SOURCES = {
+    'doc': ('docs', 'id::text', 'content', 'type'),
+    'task': ('tasks', 'id', 'command', 'status'),
+    'context': ('context', 'task_id', 'data', None),
+}
+
+
+class _Params:
+    """Нумерация $n по мере сборки запроса: неиспользуемый параметр asyncpg не сможет типизировать."""
+    def __init__(self):
+        self.values: List[Any] = []
+
+    def __call__(self, value) -> str:
+        self.values.append(value)
+        return f'${len(self.values)}'
+
+
+def _lexical_cte(sources: Sequence[str], p: _Params, project: str, text: str, depth: str, filters: Dict[str, Any]) -> str:
+    parts = []
+    for source in sources:
+        table, id_expr, text_col, filter_col = HYBRID_SOURCES[source]
+        where = f'project_id = {project} AND search_tsv @@ query'
+        if filter_col and filters.get(source) is not None:
+            where += f' AND {filter_col} = {p(filters[source])}'
+        parts.append(
+            f"(SELECT '{source}' AS source, {id_expr} AS id, left({text_col}, {HYBRID_SNIPPET_CHARS}) AS text, "
+            f"ts_rank_cd(search_tsv, query) AS score "
+            f"FROM {table}, websearch_to_tsquery('{FULLTEXT_CONFIG}', {text}) query "
+            f"WHERE {where} ORDER BY score DESC LIMIT {depth})"
+        )
+    return ('lexical AS (SELECT source, id, text, ROW_NUMBER() OVER (ORDER BY score DESC, source, id) AS rank '
+            f'FROM ({" UNION ALL ".join(parts)}) l)')
+
+
+def _semantic_cte(sources: Sequence[str], p: _Params, project: str, vector: str, depth: str, filters: Dict[str, Any],
+                  metric: str, table: str, vector_type: str) -> str:
+    types = [s for s in sources if s in ('doc', 'task')]
+    if not types:
+        return _empty_cte('semantic')
+    where = f"project_id = {project} AND ({' OR '.join(entity_type_predicate(t) for t in types)})"
+    # Фильтры источников для векторной стороны — по строке-владельцу эмбеддинга
+    for source in types:
+        src_table, id_expr, _, filter_col = HYBRID_SOURCES[source]
+        if filters.get(source) is not None:
+            where += (f" AND (entity_type <> '{source}' OR EXISTS (SELECT 1 FROM {src_table} s "
+                      f"WHERE s.project_id = e.project_id AND s.{id_expr} = e.entity_id AND s.{filter_col} = {p(filters[source])}))")
+    distance = f'vector {VECTOR_METRICS[metric][1]} {vector}::text::{vector_type}'
+    return ('semantic AS (SELECT source, id, text, ROW_NUMBER() OVER (ORDER BY distance, source, id) AS rank FROM ('
+            f'SELECT entity_type AS source, entity_id AS id, description AS text, {distance} AS distance '
+            f'FROM {table} e WHERE {where} ORDER BY {distance} LIMIT {depth}) v)')
+
+
+def _empty_cte(name: str) -> str:
+    return f'{name} AS (SELECT NULL::text AS source, NULL::text AS id, NULL::text AS text, NULL::bigint AS rank WHERE false)'
+
+
+def hybrid_search_sql(project_id: int, text: Optional[str] = None, vector=None, sources: Sequence[str] = tuple(HYBRID_SOURCES),
+                      filters: Optional[Dict[str, Any]] = None, limit: int = 20, offset: int = 0,
+                      metric: str = VECTOR_SEARCH_METRIC, candidates: int = HYBRID_CANDIDATES, rrf_k: int = HYBRID_RRF_K,
+                      table: str = 'embeddings', vector_type: str = 'vector') -> Tuple[str, List[Any]]:
+    """
+    Один запрос: лексический список (tsvector/GIN по docs.content, tasks.command, context.data)
+    и векторный (ANN по embeddings) сливаются FULL JOIN по (source, id) через RRF.
+    Глубина списков не меньше offset + limit, чтобы страницы были согласованы.
+    candidates — размер слитого списка (не больше суммы глубин), а не число всех совпадений в проекте.
+    Возвращает (sql, параметры).
+    """
+    unknown = set(sources) - set(HYBRID_SOURCES)
+    if unknown:
+        raise ValueError(f"Неизвестные источники: {', '.join(sorted(unknown))} (доступны {', '.join(HYBRID_SOURCES)})")
+    if metric not in VECTOR_METRICS:
+        raise ValueError(f"Неизвестная метрика: {metric}")
+    if not text and vector is None:
+        raise ValueError("Нужен текст запроса и/или вектор")
+    filters = filters or {}
+    p = _Params()
+    project = p(project_id)
+    depth = p(max(candidates, offset + limit))
+    lexical = _lexical_cte(sources, p, project, p(text), depth, filters) if text else _empty_cte('lexical')
+    semantic = (_semantic_cte(sources, p, project, p(vector_literal(vector)), depth, filters, metric, table, vector_type)
+                if vector is not None else _empty_cte('semantic'))
+    k = p(rrf_k)
+    sql = (f'WITH {lexical}, {semantic} '
+           'SELECT COALESCE(l.source, s.source) AS source, COALESCE(l.id, s.id) AS id, COALESCE(l.text, s.text) AS text, '
+           'l.rank AS lexical_rank, s.rank AS vector_rank, '
+           f'COALESCE(1.0 / ({k} + l.rank), 0) + COALESCE(1.0 / ({k} + s.rank), 0) AS score, '
+           'count(*) OVER () AS candidates '
+           'FROM lexical l FULL OUTER JOIN semantic s ON l.source = s.source AND l.id = s.id '
+           f'ORDER BY score DESC, source, id LIMIT {p(limit)} OFFSET {p(offset)}')
+    return sql, p.values
+
+
+async def hybrid_search(conn, project_id: int, text: Optional[str] = None, vector=None,
+                        sources: Sequence[str] = tuple(HYBRID_SOURCES), filters: Optional[Dict[str, Any]] = None,
+                        limit: int = 20, offset: int = 0, metric: str = VECTOR_SEARCH_METRIC,
+                        ef_search: Optional[int] = None, probes: Optional[int] = None, **options) -> Dict[str, Any]:
+    """Гибридный поиск одной страницей: {"candidates", "items": [{source, id, text, score, lexical_rank, vector_rank}]}."""
+    sql, params = hybrid_search_sql(project_id, text, vector, sources, filters, limit, offset, metric, **options)
+    async with conn.transaction():
+        if vector is not None:
+            await apply_search_params(conn, ef_search, probes)
+        rows = await conn.fetch(sql, *params)
+    items = [
+        {'source': r['source'], 'id': r['id'], 'text': r['text'], 'score': float(r['score']),
+         'lexical_rank': r['lexical_rank'], 'vector_rank': r['vector_rank']}
+        for r in rows
+    ]
+    return {'candidates': rows[0]['candidates'] if rows else 0, 'items': items}
@@ -0,0 +1,72 @@
+import datetime
+import json
+from typing import List, Dict, Any
+
+# Формы запросов из mcp_server.py с типовыми параметрами для EXPLAIN
+QUERY_SHAPES = [
+    {'name': 'get_all_tasks', 'sql': 'SELECT * FROM tasks WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_all_rules', 'sql': 'SELECT * FROM cursor_rules WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_all_templates', 'sql': 'SELECT * FROM templates WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_all_embeddings', 'sql': 'SELECT * FROM embeddings WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_all_docs', 'sql': 'SELECT * FROM docs WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_all_history', 'sql': 'SELECT * FROM history WHERE project_id = $1', 'params': [1]},
+    {'name': 'get_context', 'sql': 'SELECT data FROM context WHERE task_id = $1', 'params': ['task']},
+    {'name': 'project_by_origin', 'sql': 'SELECT id FROM projects WHERE origin = $1', 'params': ['origin']},
+    {'name': 'history_by_project', 'sql': 'SELECT * FROM history WHERE 1=1 AND project_id = $1 ORDER BY created_at DESC LIMIT $2', 'params': [1, 100]},
+    {'name': 'history_by_user', 'sql': 'SELECT * FROM history WHERE 1=1 AND user_id = $1 ORDER BY created_at DESC LIMIT $2', 'params': ['user', 100]},
+    {'name': 'history_by_action', 'sql': 'SELECT * FROM history WHERE 1=1 AND action = $1 ORDER BY created_at DESC LIMIT $2', 'params': ['export', 100]},
+    {'name': 'history_by_date', 'sql': 'SELECT * FROM history WHERE 1=1 AND created_at >= $1 ORDER BY created_at DESC LIMIT $2', 'params': [datetime.datetime(2000, 1, 1), 100]},
+    {'name': 'file_max_version', 'sql': 'SELECT max(version) as v FROM file_versions WHERE file_path = $1 AND project_id = $2', 'params': ['file', 1]},
+    {'name': 'file_versions', 'sql': 'SELECT version, hash, user_id, s3_url, created_at FROM file_versions WHERE project_id = $1 AND file_path = $2 ORDER BY version DESC', 'params': [1, 'file']},
+    {'name': 'doc_max_version', 'sql': 'SELECT max(version) as v FROM doc_versions WHERE doc_id = $1', 'params': [1]},
+    {'name': 'doc_versions', 'sql': 'SELECT version, data, user_id, created_at FROM doc_versions WHERE doc_id = $1 ORDER BY version DESC', 'params': [1]},
+    {'name': 'embedding_by_entity', 'sql': 'SELECT vector FROM embeddings WHERE project_id = $1 AND entity_id = $2', 'params': [1, 'task']},
+    {'name': 'hybrid_lexical_docs', 'sql': "SELECT id FROM docs WHERE project_id = $1 AND search_tsv @@ websearch_to_tsquery('simple', $2)", 'params': [1, 'deploy']},
+    {'name': 'hybrid_lexical_tasks', 'sql': "SELECT id FROM tasks WHERE project_id = $1 AND search_tsv @@ websearch_to_tsquery('simple', $2)", 'params': [1, 'deploy']},
+]
+
+
+def find_seq_scans(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Рекурсивно собирает узлы Seq Scan из JSON-плана EXPLAIN."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append({'relation': plan.get('Relation Name'), 'rows': plan.get('Plan Rows'), 'filter': plan.get('Filter')})
+    for child in plan.get('Plans', []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+async def advise(conn, shapes: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Выполняет EXPLAIN (FORMAT JSON) для каждой формы запроса и возвращает отчёт:
+    какие запросы читают таблицы последовательным сканированием.
+    На маленьких таблицах планировщик выбирает Seq Scan даже при наличии индекса — смотрите rows.
+    """
+    report = []
+    for shape in shapes or QUERY_SHAPES:
+        try:
+            raw = await conn.fetchval('EXPLAIN (FORMAT JSON) ' + shape['sql'], *shape['params'])
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+            seq_scans = find_seq_scans(plan)
+            report.append({
+                'name': shape['name'],
+                'seq_scan': bool(seq_scans),
+                'seq_scans': seq_scans,
+                'total_cost': plan.get('Total Cost'),
+            })
+        except Exception as e:
+            report.append({'name': shape['name'], 'error': str(e)})
+    return report
+
+
+def format_report(report: List[Dict[str, Any]]) -> str:
+    lines = []
+    for item in report:
+        if 'error' in item:
+            lines.append(f"[ERROR] {item['name']}: {item['error']}")
+        elif item['seq_scan']:
+            scans = ', '.join(f"{s['relation']} (~{s['rows']} rows)" for s in item['seq_scans'])
+            lines.append(f"[SEQ SCAN] {item['name']}: {scans}")
+        else:
+            lines.append(f"[OK] {item['name']}: cost {item['total_cost']}")
+    return '\n'.join(lines)
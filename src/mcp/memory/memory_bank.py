@@ -1,176 +1,249 @@
 import asyncpg
+import asyncio
+import contextlib
+import logging
 import os
+import time
+import uuid
+from src.mcp.memory.migrator import get_current_version, latest_version, migrate
+from src.mcp.memory.context_cache import ContextCache, MISSING, CONTEXT_CACHE_CHANNEL
 
-CREATE_TABLES_SQL = [
-    '''
-    CREATE TABLE IF NOT EXISTS projects (
-        id SERIAL PRIMARY KEY,
-        name TEXT UNIQUE,
-        description TEXT,
-        origin TEXT UNIQUE
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS context (
-        task_id TEXT PRIMARY KEY,
-        data TEXT,
-        project_id INTEGER REFERENCES projects(id)
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS tasks (
-        id TEXT PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        command TEXT,
-        context TEXT,
-        rules JSONB,
-        status TEXT,
-        result TEXT
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS cursor_rules (
-        id TEXT PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        type TEXT,
-        value TEXT,
-        description TEXT
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS templates (
-        id SERIAL PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        name TEXT,
-        repo_url TEXT,
-        tags TEXT[]
-    )
-    ''',
-    '''
-    CREATE EXTENSION IF NOT EXISTS vector;
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS embeddings (
-        id SERIAL PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        task_id TEXT,
-        vector vector(384),
-        description TEXT
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS docs (
-        id SERIAL PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        type TEXT,
-        content TEXT,
-        created_at TIMESTAMP DEFAULT now()
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS history (
-        id SERIAL PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        user_id TEXT,
-        action TEXT,
-        details JSONB,
-        diff JSONB,
-        resolved_by TEXT,
-        conflict_details JSONB,
-        created_at TIMESTAMP DEFAULT now()
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS task_versions (
-        id SERIAL PRIMARY KEY,
-        task_id TEXT,
-        project_id INTEGER REFERENCES projects(id),
-        version INTEGER,
-        data JSONB,
-        user_id TEXT,
-        created_at TIMESTAMP DEFAULT now()
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS doc_versions (
-        id SERIAL PRIMARY KEY,
-        doc_id INTEGER,
-        project_id INTEGER REFERENCES projects(id),
-        version INTEGER,
-        data JSONB,
-        user_id TEXT,
-        created_at TIMESTAMP DEFAULT now()
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS file_versions (
-        id SERIAL PRIMARY KEY,
-        project_id INTEGER REFERENCES projects(id),
-        file_path TEXT,
-        version INTEGER,
-        hash TEXT,
-        user_id TEXT,
-        s3_url TEXT,
-        created_at TIMESTAMP DEFAULT now()
-    )
-    ''',
-    '''
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'user',
-        created_at TIMESTAMP DEFAULT now()
-    )
-    '''
-]
+logger = logging.getLogger("memory_bank")
+
+# Настройки пула соединений (переопределяются переменными окружения)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Максимальное время жизни соединения (сек), после которого пул пересоздаёт соединения
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Время простоя соединения (сек), после которого оно закрывается
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+# При отставании схемы: 1 — применить миграции при старте, 0 — упасть и требовать `memory_bank_cli migrate`
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+# Колонки сущностей в архивах и снапшотах — явный список, а не *: генерируемые колонки
+# (search_tsv из 0007) и служебные поля не должны попадать в экспорт и в сравнение при merge.
+# created_at задач и эмбеддингов (0008) — время вставки в этот проект, при импорте оно всё равно новое
+PROJECT_BUNDLE_COLUMNS = {
+    'tasks': ('tasks', 'id, project_id, command, context, rules, status, result'),
+    'rules': ('cursor_rules', 'id, project_id, type, value, description'),
+    'templates': ('templates', 'id, project_id, name, repo_url, tags'),
+    'embeddings': ('embeddings', 'id, project_id, task_id, vector, description, entity_type, entity_id, model'),
+    'docs': ('docs', 'id, project_id, type, content, created_at'),
+    'history': ('history', 'id, project_id, user_id, action, details, diff, resolved_by, conflict_details, created_at'),
+}
+# Таблицы с текстовым id
+TEXT_ID_ENTITIES = ('tasks', 'rules')
+
+# Запросы, из которых собирается полный снимок проекта (порядок = порядок файлов в архиве).
+# Строки упорядочены по id: архивы сравниваются с БД потоково (diff_engine.diff_sorted_async).
+# Текстовые id — COLLATE "C" (побайтно): такой порядок совпадает со сравнением строк в Python
+PROJECT_BUNDLE_QUERIES = {
+    name: f'SELECT {columns} FROM {table} WHERE project_id = $1 ORDER BY id' + (' COLLATE "C"' if name in TEXT_ID_ENTITIES else '')
+    for name, (table, columns) in PROJECT_BUNDLE_COLUMNS.items()
+}
 
 class MemoryBank:
     """
     Класс для работы с хранилищем контекста задач на PostgreSQL (асинхронно).
+    Один экземпляр (и один пул asyncpg) разделяется всем процессом — см. get_shared_memory_bank().
     """
-    def __init__(self, dsn=None):
+    def __init__(self, dsn=None, min_size: int = None, max_size: int = None, max_lifetime: float = None,
+                 statement_cache_size: int = None, health_check_interval: float = None,
+                 context_cache: ContextCache = None):
         self.dsn = dsn or os.getenv("DB_DSN")
+        self.min_size = DB_POOL_MIN_SIZE if min_size is None else min_size
+        self.max_size = DB_POOL_MAX_SIZE if max_size is None else max_size
+        self.max_lifetime = DB_POOL_MAX_LIFETIME if max_lifetime is None else max_lifetime
+        self.statement_cache_size = DB_STATEMENT_CACHE_SIZE if statement_cache_size is None else statement_cache_size
+        self.health_check_interval = DB_HEALTH_CHECK_INTERVAL if health_check_interval is None else health_check_interval
         self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self._pool_born = None
+        self._loop = None
+        self._schema_ready = False
+        self._health_task = None
+        # Read-through кэш get_context; другие воркеры инвалидируют его через NOTIFY
+        self.context_cache = context_cache or ContextCache()
+        self._instance_id = uuid.uuid4().hex[:12]
+        self._listener = None
 
     async def get_pool(self):
+        loop = asyncio.get_running_loop()
+        if self._pool is not None and self._loop is not loop:
+            # Пул привязан к другому event loop (например, TestClient без lifespan): штатно закрыть его
+            # из этого loop нельзя, соединения обрываются terminate(), затем создаётся новый пул
+            stale, self._pool = self._pool, None
+            self._pool_lock = asyncio.Lock()
+            try:
+                stale.terminate()
+            except Exception as e:
+                logger.warning(f"Пул другого event loop не закрыт: {e}")
         if self._pool is None:
-            self._pool = await asyncpg.create_pool(dsn=self.dsn)
-            async with self._pool.acquire() as conn:
-                for sql in CREATE_TABLES_SQL:
-                    await conn.execute(sql)
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        dsn=self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+                        statement_cache_size=self.statement_cache_size,
+                    )
+                    self._pool_born = time.monotonic()
+                    self._loop = loop
+                    # Без lifespan (CLI, тесты) схема создаётся один раз при первом обращении
+                    if not self._schema_ready:
+                        await self.ensure_schema()
         return self._pool
 
+    async def ensure_schema(self):
+        """Проверяет версию схемы (один запрос); при отставании применяет миграции или падает."""
+        if self._schema_ready:
+            return
+        async with self._pool.acquire() as conn:
+            current = await get_current_version(conn)
+            latest = latest_version()
+            if current < latest:
+                if not DB_AUTO_MIGRATE:
+                    raise RuntimeError(
+                        f"Схема БД устарела (v{current} < v{latest}). "
+                        "Выполните: python -m src.mcp.memory.memory_bank_cli migrate"
+                    )
+                await migrate(conn)
+        self._schema_ready = True
+
+    async def open(self):
+        """Открывает пул, создаёт схему, подписывается на инвалидации контекста и запускает фоновую проверку соединений."""
+        await self.get_pool()
+        await self._ensure_listener()
+        if self._health_task is None and self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._maintain_pool())
+        return self
+
+    async def health_check(self) -> dict:
+        """Проверяет доступность БД (SELECT 1) и возвращает состояние пула."""
+        pool = await self.get_pool()
+        started = time.perf_counter()
+        try:
+            async with pool.acquire() as conn:
+                await conn.fetchval('SELECT 1')
+            status = "ok"
+            error = None
+        except Exception as e:
+            status = "error"
+            error = str(e)
+        return {
+            "status": status,
+            "error": error,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "size": pool.get_size(),
+            "idle": pool.get_idle_size(),
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+        }
+
+    async def _maintain_pool(self):
+        """Периодически проверяет пул и пересоздаёт соединения старше max_lifetime."""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                health = await self.health_check()
+                if health["status"] != "ok":
+                    logger.warning(f"DB health check failed: {health['error']}")
+                if self.max_lifetime and time.monotonic() - self._pool_born >= self.max_lifetime:
+                    await self._pool.expire_connections()
+                    self._pool_born = time.monotonic()
+                await self._ensure_listener()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"DB pool maintenance error: {e}")
+
+    async def _ensure_listener(self):
+        """
+        LISTEN на отдельном соединении вне пула (соединения пула при возврате сбрасывают подписки).
+        После разрыва кэш очищается целиком: уведомления за время разрыва потеряны.
+        """
+        if not self.context_cache.enabled or (self._listener is not None and not self._listener.is_closed()):
+            return
+        if self._listener is not None:
+            self.context_cache.clear()
+            self._listener = None
+        try:
+            listener = await asyncpg.connect(dsn=self.dsn)
+            await listener.add_listener(CONTEXT_CACHE_CHANNEL, self._on_context_notify)
+            listener.add_termination_listener(lambda _: self.context_cache.clear())
+            self._listener = listener
+        except Exception as e:
+            logger.warning(f"LISTEN {CONTEXT_CACHE_CHANNEL} недоступен, кэш контекста ограничен TTL: {e}")
+
+    def _on_context_notify(self, connection, pid, channel, payload: str):
+        sender, _, task_id = payload.partition(':')
+        if sender != self._instance_id:
+            self.context_cache.invalidate(task_id)
+
     async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_task
+            self._health_task = None
+        if self._listener is not None:
+            with contextlib.suppress(Exception):
+                await self._listener.close()
+            self._listener = None
         if self._pool is not None:
             await self._pool.close()
             self._pool = None
 
     async def get_context(self, task_id: str, project_id: int = None):
-        """Получить контекст по task_id."""
-        pool = await self.get_pool()
-        async with pool.acquire() as conn:
-            if project_id:
-                row = await conn.fetchrow('SELECT data FROM context WHERE task_id = $1 AND project_id = $2', task_id, project_id)
-            else:
-                row = await conn.fetchrow('SELECT data FROM context WHERE task_id = $1', task_id)
-            return row['data'] if row else None
+        """
+        Получить контекст по task_id. Read-through: промах читает строку по ключу и кладёт её в кэш;
+        фильтр по project_id сравнивается с проектом строки.
+        """
+        cached = self.context_cache.get(task_id, project_id)
+        if cached is not MISSING:
+            return cached
+        token = self.context_cache.begin(task_id)
+        row = None
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow('SELECT data, project_id FROM context WHERE task_id = $1', task_id)
+        finally:
+            self.context_cache.end(task_id, token, (row['data'], row['project_id']) if row else None)
+        if row is None or (project_id and row['project_id'] != project_id):
+            return None
+        return row['data']
 
     async def save_context(self, task_id: str, data: str, project_id: int = None):
-        """Сохранить или обновить контекст по task_id."""
+        """
+        Сохранить или обновить контекст по task_id. Запись и NOTIFY — один оператор (уведомление уходит
+        при фиксации), затем write-through в локальный кэш; свой NOTIFY воркер пропускает.
+        """
+        payload = f'{self._instance_id}:{task_id}'
         pool = await self.get_pool()
         async with pool.acquire() as conn:
             if project_id:
-                await conn.execute('''
-                    INSERT INTO context (task_id, data, project_id) VALUES ($1, $2, $3)
-                    ON CONFLICT (task_id) DO UPDATE SET data = EXCLUDED.data, project_id = EXCLUDED.project_id
-                ''', task_id, data, project_id)
+                row = await conn.fetchrow('''
+                    WITH saved AS (
+                        INSERT INTO context (task_id, data, project_id) VALUES ($1, $2, $3)
+                        ON CONFLICT (task_id) DO UPDATE SET data = EXCLUDED.data, project_id = EXCLUDED.project_id
+                        RETURNING project_id
+                    )
+                    SELECT project_id, pg_notify($4, $5) FROM saved
+                ''', task_id, data, project_id, CONTEXT_CACHE_CHANNEL, payload)
             else:
-                await conn.execute('''
-                    INSERT INTO context (task_id, data) VALUES ($1, $2)
-                    ON CONFLICT (task_id) DO UPDATE SET data = EXCLUDED.data
-                ''', task_id, data)
+                row = await conn.fetchrow('''
+                    WITH saved AS (
+                        INSERT INTO context (task_id, data) VALUES ($1, $2)
+                        ON CONFLICT (task_id) DO UPDATE SET data = EXCLUDED.data
+                        RETURNING project_id
+                    )
+                    SELECT project_id, pg_notify($3, $4) FROM saved
+                ''', task_id, data, CONTEXT_CACHE_CHANNEL, payload)
+        self.context_cache.put(task_id, data, row['project_id'] if row else project_id)
 
     async def get_all_tasks(self, project_id: int):
         pool = await self.get_pool()
@@ -208,6 +281,25 @@ class MemoryBank:
             rows = await conn.fetch('SELECT * FROM history WHERE project_id = $1', project_id)
             return [dict(row) for row in rows]
 
+_shared_memory_bank = None
+
+def get_shared_memory_bank() -> MemoryBank:
+    """Возвращает общий для процесса экземпляр MemoryBank (один пул на воркер)."""
+    global _shared_memory_bank
+    if _shared_memory_bank is None:
+        _shared_memory_bank = MemoryBank()
+    return _shared_memory_bank
+
+@contextlib.asynccontextmanager
+async def memory_bank_lifespan(app):
+    """Lifespan для FastAPI: открывает пул и схему при старте, закрывает при остановке."""
+    memory_bank = get_shared_memory_bank()
+    await memory_bank.open()
+    try:
+        yield
+    finally:
+        await memory_bank.close()
+
 # Dependency для FastAPI
 async def get_memory_bank():
-    return MemoryBank() 
\ No newline at end of file
+    return get_shared_memory_bank()
@@ -1,3 +1,7 @@
+import argparse
+import asyncio
+import json
+import os
 import requests
 
 MCP_URL = "http://localhost:8001"
@@ -28,5 +32,107 @@ def check_status():
             status = f"ERROR {e}"
         print(f"  {ep}: {status}")
 
+async def run_migrate(dsn: str, target: int = None, status_only: bool = False):
+    import asyncpg
+    from src.mcp.memory.migrator import migrate, migration_status
+    conn = await asyncpg.connect(dsn=dsn)
+    try:
+        if not status_only:
+            applied = await migrate(conn, target=target)
+            print(f"Применено миграций: {len(applied)} {applied if applied else ''}")
+        print(json.dumps(await migration_status(conn), ensure_ascii=False, indent=2))
+    finally:
+        await conn.close()
+
+async def run_advise_indexes(dsn: str, as_json: bool = False):
+    import asyncpg
+    from src.mcp.memory.index_advisor import advise, format_report
+    conn = await asyncpg.connect(dsn=dsn)
+    try:
+        report = await advise(conn)
+    finally:
+        await conn.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2) if as_json else format_report(report))
+
+async def run_vector_index(dsn: str, action: str, method: str = 'hnsw', metric: str = 'ip', table: str = 'embeddings',
+                           quantization: str = None, dimension: int = 384, **options):
+    import asyncpg
+    from src.mcp.memory.vector_index import (create_vector_index, drop_vector_index, list_vector_indexes,
+                                             create_quantized_index, drop_quantized_index)
+    conn = await asyncpg.connect(dsn=dsn)
+    try:
+        if quantization and action == 'create':
+            print(f"Индекс создан: {await create_quantized_index(conn, quantization, dimension, metric, table, method, **options)}")
+        elif quantization and action == 'drop':
+            print(f"Индекс удалён: {await drop_quantized_index(conn, quantization, metric, table, method)}")
+        elif action == 'create':
+            print(f"Индекс создан: {await create_vector_index(conn, method, metric, table, **options)}")
+        elif action == 'drop':
+            print(f"Индекс удалён: {await drop_vector_index(conn, method, metric, table, entity_type=options.get('entity_type'))}")
+        for idx in await list_vector_indexes(conn, table):
+            print(f"  {idx['indexname']} ({idx['size_bytes']} bytes): {idx['indexdef']}")
+    finally:
+        await conn.close()
+
+async def run_tasks_sync(dsn: str, action: str, path: str, project_id: int = None):
+    import asyncpg
+    from src.mcp.memory.task_store import export_tasks_mdf, import_tasks
+    conn = await asyncpg.connect(dsn=dsn)
+    try:
+        if action == 'export':
+            print(f"Выгружено задач: {await export_tasks_mdf(conn, path, project_id)} -> {path}")
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                tasks = json.load(f)
+            print(f"Импортировано задач: {await import_tasks(conn, tasks, project_id)} из {path}")
+    finally:
+        await conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory Bank CLI')
+    sub = parser.add_subparsers(dest='cmd')
+    sub.add_parser('status', help='Проверить интеграцию endpoint\'ов MCP')
+    migrate_parser = sub.add_parser('migrate', help='Применить миграции схемы БД')
+    migrate_parser.add_argument('--dsn', default=os.getenv("DB_DSN"), help='DSN PostgreSQL (по умолчанию DB_DSN)')
+    migrate_parser.add_argument('--target', type=int, help='Мигрировать до указанной версии')
+    migrate_parser.add_argument('--status', action='store_true', help='Только показать текущую версию схемы')
+    advise_parser = sub.add_parser('advise-indexes', help='EXPLAIN горячих запросов: найти последовательные сканирования')
+    advise_parser.add_argument('--dsn', default=os.getenv("DB_DSN"), help='DSN PostgreSQL (по умолчанию DB_DSN)')
+    advise_parser.add_argument('--json', action='store_true', help='Вывести отчёт в JSON')
+    vindex_parser = sub.add_parser('vector-index', help='Управление HNSW/IVFFlat индексами embeddings')
+    vindex_parser.add_argument('action', choices=['list', 'create', 'drop'])
+    vindex_parser.add_argument('--dsn', default=os.getenv("DB_DSN"), help='DSN PostgreSQL (по умолчанию DB_DSN)')
+    vindex_parser.add_argument('--method', choices=['hnsw', 'ivfflat'], default='hnsw')
+    vindex_parser.add_argument('--metric', choices=['cosine', 'l2', 'ip'], default='ip', help='Должна совпадать с метрикой поиска (VECTOR_SEARCH_METRIC)')
+    vindex_parser.add_argument('--m', type=int, help='HNSW: число связей на узел')
+    vindex_parser.add_argument('--ef-construction', type=int, help='HNSW: ширина поиска при построении')
+    vindex_parser.add_argument('--lists', type=int, help='IVFFlat: число списков (~rows/1000 до 1M строк)')
+    vindex_parser.add_argument('--table', default='embeddings', help='Таблица модели из реестра (GET /embeddings/models)')
+    vindex_parser.add_argument('--vector-type', choices=['vector', 'halfvec'], help='Тип колонки таблицы (halfvec — float16)')
+    vindex_parser.add_argument('--entity-type', choices=['task', 'doc', 'template'], help='Частичный индекс только по строкам этого типа')
+    vindex_parser.add_argument('--quantization', choices=['binary', 'halfvec'], help='Индекс по квантованной копии вектора (поиск с quantization=...)')
+    vindex_parser.add_argument('--dimension', type=int, default=384, help='Размерность колонки (для --quantization)')
+    for action, help_text in (('export', 'Выгрузить таблицу tasks в JSON формата tasks.mdf'),
+                              ('import', 'Перенести задачи из tasks.mdf в таблицу tasks')):
+        tasks_parser = sub.add_parser(f'tasks-{action}', help=help_text)
+        tasks_parser.add_argument('--dsn', default=os.getenv("DB_DSN"), help='DSN PostgreSQL (по умолчанию DB_DSN)')
+        tasks_parser.add_argument('--path', default='tasks.mdf')
+        tasks_parser.add_argument('--project-id', type=int, help='Только задачи проекта (export) / проект для задач (import)')
+    args = parser.parse_args()
+    if args.cmd == 'migrate':
+        asyncio.run(run_migrate(args.dsn, target=args.target, status_only=args.status))
+    elif args.cmd == 'advise-indexes':
+        asyncio.run(run_advise_indexes(args.dsn, as_json=args.json))
+    elif args.cmd == 'vector-index':
+        if args.quantization and args.entity_type:
+            parser.error('--quantization и --entity-type не совместимы')
+        options = {k: v for k, v in (('m', args.m), ('ef_construction', args.ef_construction), ('lists', args.lists), ('entity_type', args.entity_type), ('vector_type', args.vector_type)) if v}
+        asyncio.run(run_vector_index(args.dsn, args.action, args.method, args.metric, args.table,
+                                     args.quantization, args.dimension, **options))
+    elif args.cmd in ('tasks-export', 'tasks-import'):
+        asyncio.run(run_tasks_sync(args.dsn, args.cmd.split('-')[1], args.path, args.project_id))
+    else:
+        check_status()
+
 if __name__ == "__main__":
-    check_status() 
\ No newline at end of file
+    main()
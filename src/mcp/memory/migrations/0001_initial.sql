@@ -0,0 +1,110 @@
+-- Базовая схема MemoryBank
+
+CREATE TABLE IF NOT EXISTS projects (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE,
+    description TEXT,
+    origin TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS context (
+    task_id TEXT PRIMARY KEY,
+    data TEXT,
+    project_id INTEGER REFERENCES projects(id)
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    command TEXT,
+    context TEXT,
+    rules JSONB,
+    status TEXT,
+    result TEXT
+);
+
+CREATE TABLE IF NOT EXISTS cursor_rules (
+    id TEXT PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    type TEXT,
+    value TEXT,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS templates (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    name TEXT,
+    repo_url TEXT,
+    tags TEXT[]
+);
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    task_id TEXT,
+    vector vector(384),
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS docs (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    type TEXT,
+    content TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS history (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    user_id TEXT,
+    action TEXT,
+    details JSONB,
+    diff JSONB,
+    resolved_by TEXT,
+    conflict_details JSONB,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS task_versions (
+    id SERIAL PRIMARY KEY,
+    task_id TEXT,
+    project_id INTEGER REFERENCES projects(id),
+    version INTEGER,
+    data JSONB,
+    user_id TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS doc_versions (
+    id SERIAL PRIMARY KEY,
+    doc_id INTEGER,
+    project_id INTEGER REFERENCES projects(id),
+    version INTEGER,
+    data JSONB,
+    user_id TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS file_versions (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER REFERENCES projects(id),
+    file_path TEXT,
+    version INTEGER,
+    hash TEXT,
+    user_id TEXT,
+    s3_url TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'user',
+    created_at TIMESTAMP DEFAULT now()
+);
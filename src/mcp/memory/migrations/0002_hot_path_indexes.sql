@@ -0,0 +1,42 @@
+-- Индексы под горячие запросы mcp_server.py
+
+-- get_all_* и выборки по проекту
+CREATE INDEX IF NOT EXISTS idx_tasks_project ON tasks (project_id);
+CREATE INDEX IF NOT EXISTS idx_cursor_rules_project ON cursor_rules (project_id);
+CREATE INDEX IF NOT EXISTS idx_templates_project ON templates (project_id);
+CREATE INDEX IF NOT EXISTS idx_docs_project ON docs (project_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_context_project ON context (project_id);
+-- /embeddings/search и /embeddings/recommend по entity_id
+CREATE INDEX IF NOT EXISTS idx_embeddings_project_task ON embeddings (project_id, task_id);
+
+-- /history: фильтры по проекту/пользователю/действию, сортировка по created_at
+CREATE INDEX IF NOT EXISTS idx_history_project_created ON history (project_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_history_user_created ON history (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_history_action_created ON history (action, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_history_created ON history (created_at DESC);
+
+-- max(version) по файлу / документу / задаче.
+-- До уникальных индексов номера версий с дублями (параллельные загрузки без блокировки)
+-- перенумеровываются по порядку (version, id): история сохраняется, порядок версий не меняется.
+UPDATE file_versions f SET version = r.rn
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY project_id, file_path ORDER BY version, id) AS rn
+    FROM file_versions
+    WHERE (project_id, file_path) IN (
+        SELECT project_id, file_path FROM file_versions
+        GROUP BY project_id, file_path, version HAVING count(*) > 1
+    )
+) r
+WHERE f.id = r.id AND f.version IS DISTINCT FROM r.rn;
+
+UPDATE doc_versions d SET version = r.rn
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY doc_id ORDER BY version, id) AS rn
+    FROM doc_versions
+    WHERE doc_id IN (SELECT doc_id FROM doc_versions GROUP BY doc_id, version HAVING count(*) > 1)
+) r
+WHERE d.id = r.id AND d.version IS DISTINCT FROM r.rn;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_file_versions_project_path_version ON file_versions (project_id, file_path, version);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_doc_versions_doc_version ON doc_versions (doc_id, version);
+CREATE INDEX IF NOT EXISTS idx_task_versions_task_version ON task_versions (task_id, version DESC);
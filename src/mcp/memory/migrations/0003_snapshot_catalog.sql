@@ -0,0 +1,15 @@
+-- Каталог снапшотов: поиск цели restore/rollback по индексу вместо git tag / glob по docs/
+CREATE TABLE IF NOT EXISTS snapshots (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    location TEXT NOT NULL,
+    format TEXT NOT NULL DEFAULT 'manifest',
+    size_bytes BIGINT,
+    checksum TEXT,
+    created_by TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_snapshots_tag ON snapshots (tag);
+CREATE INDEX IF NOT EXISTS idx_snapshots_project_created ON snapshots (project_id, created_at DESC, id DESC);
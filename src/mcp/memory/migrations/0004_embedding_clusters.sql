@@ -0,0 +1,33 @@
+-- Фоновая кластеризация эмбеддингов: задания, центроиды и метки по проекту
+CREATE TABLE IF NOT EXISTS cluster_jobs (
+    id TEXT PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    mode TEXT NOT NULL,
+    n_clusters INTEGER NOT NULL,
+    entity_type TEXT,
+    rows INTEGER,
+    inertia DOUBLE PRECISION,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_cluster_jobs_project_created ON cluster_jobs (project_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS embedding_clusters (
+    job_id TEXT NOT NULL REFERENCES cluster_jobs(id) ON DELETE CASCADE,
+    cluster INTEGER NOT NULL,
+    centroid REAL[] NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (job_id, cluster)
+);
+
+CREATE TABLE IF NOT EXISTS embedding_cluster_labels (
+    job_id TEXT NOT NULL REFERENCES cluster_jobs(id) ON DELETE CASCADE,
+    embedding_id INTEGER NOT NULL REFERENCES embeddings(id) ON DELETE CASCADE,
+    cluster INTEGER NOT NULL,
+    PRIMARY KEY (job_id, embedding_id)
+);
+-- Префильтр /embeddings/recommend по кластеру
+CREATE INDEX IF NOT EXISTS idx_embedding_cluster_labels_cluster ON embedding_cluster_labels (job_id, cluster);
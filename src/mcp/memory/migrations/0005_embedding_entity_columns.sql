@@ -0,0 +1,11 @@
+-- Типизированные поля эмбеддинга вместо поиска типа в description
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS entity_type TEXT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS entity_id TEXT;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS model TEXT;
+
+-- Старые строки: сущность эмбеддинга хранилась в task_id
+UPDATE embeddings SET entity_id = task_id WHERE entity_id IS NULL;
+
+-- Фильтр до ANN: кандидаты проекта нужного типа берутся по btree
+CREATE INDEX IF NOT EXISTS idx_embeddings_project_type ON embeddings (project_id, entity_type);
+CREATE INDEX IF NOT EXISTS idx_embeddings_project_entity ON embeddings (project_id, entity_id);
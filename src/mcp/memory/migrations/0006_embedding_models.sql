@@ -0,0 +1,11 @@
+-- Реестр моделей эмбеддингов: у каждой модели своя таблица с нужной размерностью и индексом.
+-- Таблицы моделей создаёт embedding_store.register_model (DDL зависит от размерности и типа колонки).
+CREATE TABLE IF NOT EXISTS embedding_models (
+    name TEXT PRIMARY KEY,
+    dimension INTEGER NOT NULL,
+    storage TEXT NOT NULL DEFAULT 'vector',
+    table_name TEXT NOT NULL UNIQUE,
+    index_method TEXT,
+    metric TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,13 @@
+-- Полнотекстовый поиск для /search/hybrid: tsvector хранится генерируемой колонкой, индекс — GIN.
+-- Конфигурация 'simple' (без стемминга): в базе смешаны русские и английские тексты.
+-- Должна совпадать с FULLTEXT_CONFIG в hybrid_search.py, иначе индекс не используется.
+ALTER TABLE docs ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(command, ''))) STORED;
+ALTER TABLE context ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(data, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_docs_search_tsv ON docs USING gin (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_tasks_search_tsv ON tasks USING gin (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_context_search_tsv ON context USING gin (search_tsv);
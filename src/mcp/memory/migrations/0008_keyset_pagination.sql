@@ -0,0 +1,8 @@
+-- Keyset-пагинация GraphQL-списков по (created_at, id) внутри проекта.
+-- Существующие строки получают время миграции: порядок среди них задаёт id.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT now();
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_tasks_project_created_id ON tasks (project_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_embeddings_project_created_id ON embeddings (project_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_history_project_created_id ON history (project_id, created_at, id);
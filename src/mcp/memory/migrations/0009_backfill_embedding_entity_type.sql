@@ -0,0 +1,28 @@
+-- Тип сущности для строк, записанных до 0005: тогда тип не хранился, фильтр искал его в description (LIKE).
+-- 1. Идентификатор совпадает с задачей проекта — эмбеддинг задачи
+UPDATE embeddings e SET entity_type = 'task'
+WHERE e.entity_type IS NULL
+  AND EXISTS (SELECT 1 FROM tasks t WHERE t.id = e.entity_id AND t.project_id = e.project_id);
+
+-- 2. Тип, упомянутый в description: так его находил прежний поиск
+UPDATE embeddings SET entity_type = CASE
+        WHEN description LIKE '%template%' THEN 'template'
+        WHEN description LIKE '%doc%' THEN 'doc'
+        WHEN description LIKE '%task%' THEN 'task'
+    END
+WHERE entity_type IS NULL
+  AND (description LIKE '%template%' OR description LIKE '%doc%' OR description LIKE '%task%');
+
+-- 3. Числовой идентификатор, который однозначно указывает на документ или шаблон проекта
+UPDATE embeddings e SET entity_type = m.entity_type
+FROM (
+    SELECT src.id, CASE WHEN d.id IS NOT NULL THEN 'doc' ELSE 'template' END AS entity_type
+    FROM embeddings src
+    CROSS JOIN LATERAL (SELECT CASE WHEN src.entity_id ~ '^[0-9]{1,9}$' THEN src.entity_id::integer END AS num) n
+    LEFT JOIN docs d ON d.project_id = src.project_id AND d.id = n.num
+    LEFT JOIN templates tp ON tp.project_id = src.project_id AND tp.id = n.num
+    WHERE src.entity_type IS NULL AND (d.id IS NULL) <> (tp.id IS NULL)
+) m
+WHERE e.id = m.id;
+
+-- Остальные строки остаются без типа: в GraphQL entity_type для них null, фильтр по типу их не находит
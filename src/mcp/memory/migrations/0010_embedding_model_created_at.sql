@@ -0,0 +1,12 @@
+-- created_at в таблицах моделей, созданных до того, как register_model стал его добавлять (как 0008 для embeddings).
+-- Таблицы моделей перечислены в реестре embedding_models, поэтому DDL строится динамически.
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOR t IN SELECT table_name FROM embedding_models LOOP
+        EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT now()', t);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (project_id, created_at, id)', 'idx_' || t || '_project_created_id', t);
+    END LOOP;
+END
+$$;
@@ -0,0 +1,107 @@
+import asyncpg
+import hashlib
+import logging
+import os
+import re
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("memory_bank.migrator")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+# Ключ advisory lock: мигрирует только один воркер, остальные ждут
+MIGRATION_LOCK_KEY = 7_260_001
+
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_([\w\-]+)\.sql$')
+
+CREATE_SCHEMA_VERSION_SQL = '''
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT now()
+)
+'''
+
+_migrations_cache: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Dict[str, Any]]:
+    """
+    Читает файлы NNNN_name.sql из directory, возвращает список миграций по возрастанию версии.
+    """
+    if directory in _migrations_cache:
+        return _migrations_cache[directory]
+    migrations = []
+    seen = set()
+    for fname in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(fname)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in seen:
+            raise ValueError(f"Дублирующаяся версия миграции: {version} ({fname})")
+        seen.add(version)
+        with open(os.path.join(directory, fname), 'r', encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append({
+            'version': version,
+            'name': match.group(2),
+            'sql': sql,
+            'checksum': hashlib.sha256(sql.encode('utf-8')).hexdigest(),
+        })
+    migrations.sort(key=lambda m: m['version'])
+    _migrations_cache[directory] = migrations
+    return migrations
+
+
+def latest_version(directory: str = MIGRATIONS_DIR) -> int:
+    migrations = load_migrations(directory)
+    return migrations[-1]['version'] if migrations else 0
+
+
+async def get_current_version(conn) -> int:
+    """Текущая версия схемы — один дешёвый запрос (0, если миграции ещё не применялись)."""
+    try:
+        version = await conn.fetchval('SELECT max(version) FROM schema_version')
+    except asyncpg.UndefinedTableError:
+        return 0
+    return version or 0
+
+
+async def migrate(conn, directory: str = MIGRATIONS_DIR, target: Optional[int] = None) -> List[int]:
+    """
+    Применяет недостающие миграции под advisory lock. Каждая миграция — в отдельной транзакции.
+    Возвращает список применённых версий.
+    """
+    migrations = load_migrations(directory)
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_KEY)
+    try:
+        await conn.execute(CREATE_SCHEMA_VERSION_SQL)
+        # Перечитываем после захвата lock: другой воркер мог уже всё применить
+        rows = await conn.fetch('SELECT version, checksum FROM schema_version')
+        applied = {r['version']: r['checksum'] for r in rows}
+        done = []
+        for m in migrations:
+            if target is not None and m['version'] > target:
+                break
+            if m['version'] in applied:
+                if applied[m['version']] != m['checksum']:
+                    logger.warning(f"Миграция {m['version']}_{m['name']} изменена после применения")
+                continue
+            async with conn.transaction():
+                await conn.execute(m['sql'])
+                await conn.execute(
+                    'INSERT INTO schema_version (version, name, checksum) VALUES ($1, $2, $3)',
+                    m['version'], m['name'], m['checksum']
+                )
+            logger.info(f"Применена миграция {m['version']}_{m['name']}")
+            done.append(m['version'])
+        return done
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+
+
+async def migration_status(conn, directory: str = MIGRATIONS_DIR) -> Dict[str, Any]:
+    current = await get_current_version(conn)
+    pending = [f"{m['version']}_{m['name']}" for m in load_migrations(directory) if m['version'] > current]
+    return {'current': current, 'latest': latest_version(directory), 'pending': pending}
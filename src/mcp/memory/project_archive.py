@@ -0,0 +1,143 @@
+import io
+import json
+import logging
+import os
+import zipfile
+from typing import Any, AsyncIterator, Dict, Iterator, List
+from src.mcp.memory.memory_bank import PROJECT_BUNDLE_QUERIES
+from src.mcp.memory.diff_engine import diff_rows, diff_sorted_async, collect_diff_async
+
+logger = logging.getLogger("memory_bank.project_archive")
+
+# Сколько строк курсор забирает с сервера за раз
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", "500"))
+# Порог, после которого накопленные байты архива отдаются наружу
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", str(64 * 1024)))
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Несикабельный приёмник для ZipFile: копит байты до drain()."""
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        self._chunks.append(data)
+        self._size += len(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+def _dump_row(row) -> bytes:
+    return json.dumps(dict(row), ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+
+
+async def stream_project_zip(memory_bank, project_id: int, prefetch: int = EXPORT_PREFETCH,
+                             chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Потоково формирует zip-архив проекта: <entity>.ndjson на каждую сущность.
+    Строки читаются серверным курсором в одной транзакции REPEATABLE READ,
+    в памяти держится не больше prefetch строк и chunk_size байт архива.
+    """
+    pool = await memory_bank.get_pool()
+    buf = _StreamBuffer()
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for name, sql in PROJECT_BUNDLE_QUERIES.items():
+                    with zipf.open(f'{name}.ndjson', 'w', force_zip64=True) as entry:
+                        async for row in conn.cursor(sql, project_id, prefetch=prefetch):
+                            entry.write(_dump_row(row))
+                            if buf.size >= chunk_size:
+                                yield buf.drain()
+                    if buf.size:
+                        yield buf.drain()
+    # Центральный каталог zip пишется при закрытии архива
+    tail = buf.drain()
+    if tail:
+        yield tail
+
+
+async def export_project_to_file(memory_bank, project_id: int, path: str) -> int:
+    """Пишет потоковый архив проекта в path (через временный файл). Возвращает размер в байтах."""
+    tmp_path = path + '.part'
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        async for chunk in stream_project_zip(memory_bank, project_id):
+            f.write(chunk)
+            size += len(chunk)
+    os.replace(tmp_path, path)
+    return size
+
+
+def iter_archive_rows(directory: str, entity: str) -> Iterator[dict]:
+    """
+    Построчно читает сущность из распакованного архива: <entity>.ndjson (потоковый экспорт)
+    или <entity>.json (архивы старого формата).
+    """
+    ndjson_path = os.path.join(directory, f'{entity}.ndjson')
+    if os.path.exists(ndjson_path):
+        with open(ndjson_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    json_path = os.path.join(directory, f'{entity}.json')
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def load_archive_rows(directory: str, entity: str) -> list:
+    return list(iter_archive_rows(directory, entity))
+
+
+def is_data_entry(name: str) -> bool:
+    """True для файлов данных архива (остальное — вложения docs)."""
+    return name.endswith(('.json', '.ndjson'))
+
+
+async def diff_project_archive(memory_bank, project_id: int, directory: str, keep_skipped: bool = True,
+                               prefetch: int = EXPORT_PREFETCH) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Diff распакованного архива с проектом по всем сущностям. Обе стороны читаются потоково:
+    архив — построчно с диска, проект — серверным курсором в одной транзакции REPEATABLE READ,
+    и сливаются merge-join по id (архивы экспорта отсортированы так же, как PROJECT_BUNDLE_QUERIES).
+    Архив без такой сортировки (старый формат, сборка из снапшота) сравнивается по индексу в памяти.
+    keep_skipped=False — совпавшие строки в результат не попадают.
+    """
+    diffs = {}
+    pool = await memory_bank.get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            for name, sql in PROJECT_BUNDLE_QUERIES.items():
+                try:
+                    diffs[name] = await collect_diff_async(
+                        diff_sorted_async(conn.cursor(sql, project_id, prefetch=prefetch), iter_archive_rows(directory, name)),
+                        keep_skipped=keep_skipped,
+                    )
+                except ValueError as e:
+                    logger.info(f"{name}: архив не отсортирован по id ({e}), diff по индексу в памяти")
+                    current = [dict(row) async for row in conn.cursor(sql, project_id, prefetch=prefetch)]
+                    diffs[name] = diff_rows(current, iter_archive_rows(directory, name))
+                    if not keep_skipped:
+                        diffs[name]['skipped'] = []
+    return diffs
@@ -0,0 +1,63 @@
+import datetime
+import hashlib
+from typing import Any, Dict, Optional
+
+SNAPSHOT_COLUMNS = 'id, project_id, tag, location, format, size_bytes, checksum, created_by, created_at'
+
+# Форматы снапшотов: манифест content-addressed хранилища или целый zip (старый формат)
+FORMAT_MANIFEST = 'manifest'
+FORMAT_ZIP = 'zip'
+
+
+def file_checksum(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+async def register_snapshot(conn, project_id: int, tag: str, location: str, size_bytes: int = None,
+                            checksum: str = None, created_by: str = None, fmt: str = FORMAT_MANIFEST,
+                            created_at: datetime.datetime = None) -> Dict[str, Any]:
+    """Добавляет снапшот в каталог (повторная регистрация тега обновляет запись)."""
+    row = await conn.fetchrow(
+        f'''INSERT INTO snapshots (project_id, tag, location, format, size_bytes, checksum, created_by, created_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, COALESCE($8, NOW()))
+            ON CONFLICT (tag) DO UPDATE SET location = EXCLUDED.location, format = EXCLUDED.format,
+                size_bytes = EXCLUDED.size_bytes, checksum = EXCLUDED.checksum
+            RETURNING {SNAPSHOT_COLUMNS}''',
+        project_id, tag, location, fmt, size_bytes, checksum, created_by, created_at
+    )
+    return dict(row)
+
+
+async def get_snapshot(conn, project_id: int, tag: str) -> Optional[Dict[str, Any]]:
+    """Снапшот по тегу (uq_snapshots_tag). Чужой проект — None."""
+    row = await conn.fetchrow(
+        f'SELECT {SNAPSHOT_COLUMNS} FROM snapshots WHERE tag = $1 AND project_id = $2',
+        tag, project_id
+    )
+    return dict(row) if row else None
+
+
+async def get_previous_snapshot(conn, project_id: int, offset: int = 1) -> Optional[Dict[str, Any]]:
+    """
+    offset-й снапшот проекта от последнего (1 — предпоследний, цель rollback по умолчанию).
+    Index scan по idx_snapshots_project_created, читается offset + 1 строк.
+    """
+    row = await conn.fetchrow(
+        f'''SELECT {SNAPSHOT_COLUMNS} FROM snapshots WHERE project_id = $1
+            ORDER BY created_at DESC, id DESC OFFSET $2 LIMIT 1''',
+        project_id, offset
+    )
+    return dict(row) if row else None
+
+
+async def list_snapshots(conn, project_id: int, limit: int = 50) -> list:
+    rows = await conn.fetch(
+        f'''SELECT {SNAPSHOT_COLUMNS} FROM snapshots WHERE project_id = $1
+            ORDER BY created_at DESC, id DESC LIMIT $2''',
+        project_id, limit
+    )
+    return [dict(r) for r in rows]
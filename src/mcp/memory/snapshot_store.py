@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+import zipfile
+from typing import Any, Dict, Iterator, List, Tuple
+
+from src.mcp.memory.memory_bank import PROJECT_BUNDLE_COLUMNS, TEXT_ID_ENTITIES
+
+# Хранилище снапшотов: objects/ — чанки строк по хешу содержимого, manifests/ — состав каждого снапшота
+SNAPSHOT_STORE_DIR = os.getenv("SNAPSHOT_STORE_DIR", os.path.join('docs', 'snapshots'))
+# Чанк таблицы с числовым id — диапазон из SNAPSHOT_CHUNK_ROWS id (новые строки меняют только последний чанк)
+SNAPSHOT_CHUNK_ROWS = int(os.getenv("SNAPSHOT_CHUNK_ROWS", "1000"))
+# Таблицы с текстовым id раскладываются по фиксированному числу корзин по hashtext(id)
+SNAPSHOT_TEXT_BUCKETS = int(os.getenv("SNAPSHOT_TEXT_BUCKETS", "64"))
+SNAPSHOT_PREFETCH = int(os.getenv("SNAPSHOT_PREFETCH", "500"))
+
+# Сущность архива -> (таблица, текстовый ли id); колонки — те же, что у экспорта
+SNAPSHOT_TABLES = {
+    entity: (table, entity in TEXT_ID_ENTITIES) for entity, (table, _) in PROJECT_BUNDLE_COLUMNS.items()
+}
+
+
+def new_snapshot_id(created_at) -> str:
+    """
+    Id снапшота: время с микросекундами и случайный суффикс — два снапшота одного проекта
+    в одну секунду не перезапишут манифест и тег друг друга. Сортировка строк id совпадает с хронологией.
+    """
+    return f"{created_at.strftime('%Y-%m-%dT%H-%M-%S-%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def _bucket_query(entity: str) -> str:
+    table, text_id = SNAPSHOT_TABLES[entity]
+    expr = '(hashtext(id) & 2147483647) % $2' if text_id else 'id / $2'
+    return f'SELECT {expr} AS _bucket, {PROJECT_BUNDLE_COLUMNS[entity][1]} FROM {table} WHERE project_id = $1 ORDER BY _bucket, id'
+
+
+class SnapshotStore:
+    """
+    Content-addressed хранилище снапшотов проекта.
+    Каждая сущность режется на чанки (gzip NDJSON), чанк хранится один раз под sha256 своего содержимого.
+    Снапшот — манифест со списком хешей чанков, поэтому новый снапшот пишет только изменившиеся чанки.
+    """
+    def __init__(self, root: str = SNAPSHOT_STORE_DIR):
+        self.root = root
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], f'{digest[2:]}.ndjson.gz')
+
+    def manifest_path(self, project_id: int, snapshot_id: str) -> str:
+        return os.path.join(self.root, 'manifests', f'project_{project_id}', f'{snapshot_id}.json')
+
+    def put_chunk(self, data: bytes) -> Tuple[str, str, bool]:
+        """Сохраняет чанк, если такого ещё нет. Возвращает (hash, path, создан ли новый объект)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return digest, path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.part'
+        # mtime=0 — одинаковое содержимое даёт одинаковые байты gzip
+        with open(tmp_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz:
+            gz.write(data)
+        os.replace(tmp_path, path)
+        return digest, path, True
+
+    def missing_chunks(self, manifest: Dict[str, Any]) -> List[str]:
+        """Хеши чанков манифеста, объектов которых нет в хранилище (восстановление из них невозможно)."""
+        digests = {chunk['hash'] for chunks in manifest['entities'].values() for chunk in chunks}
+        return sorted(d for d in digests if not os.path.exists(self.object_path(d)))
+
+    def read_chunk(self, digest: str) -> Iterator[Dict[str, Any]]:
+        with gzip.open(self.object_path(digest), 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def write_manifest(self, manifest: Dict[str, Any]) -> str:
+        path = self.manifest_path(manifest['project_id'], manifest['snapshot_id'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return path
+
+    def load_manifest(self, project_id: int, snapshot_id: str) -> Dict[str, Any]:
+        with open(self.manifest_path(project_id, snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def has_manifest(self, project_id: int, snapshot_id: str) -> bool:
+        return os.path.exists(self.manifest_path(project_id, snapshot_id))
+
+    async def create_snapshot(self, memory_bank, project_id: int, snapshot_id: str) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Читает проект курсором (одна транзакция REPEATABLE READ), режет на чанки и пишет только новые.
+        Возвращает (манифест, пути всех файлов снапшота: объекты манифеста + манифест).
+        В git add уходят все объекты, а не только созданные сейчас: чанк, записанный снапшотом,
+        чей commit упал, уже лежит на диске, но в git его нет. Неизменённые файлы git пропускает.
+        """
+        manifest = {'project_id': project_id, 'snapshot_id': snapshot_id, 'entities': {}}
+        paths = {}
+        stats = {'chunks': 0, 'new_chunks': 0, 'rows': 0, 'bytes': 0, 'new_bytes': 0}
+
+        def flush(entity, bucket, lines):
+            data = b''.join(lines)
+            digest, path, created = self.put_chunk(data)
+            manifest['entities'][entity].append({'bucket': bucket, 'hash': digest, 'rows': len(lines)})
+            stats['chunks'] += 1
+            stats['rows'] += len(lines)
+            stats['bytes'] += len(data)
+            paths[digest] = path
+            if created:
+                stats['new_chunks'] += 1
+                stats['new_bytes'] += len(data)
+
+        pool = await memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                for entity, (table, text_id) in SNAPSHOT_TABLES.items():
+                    manifest['entities'][entity] = []
+                    chunk_param = SNAPSHOT_TEXT_BUCKETS if text_id else SNAPSHOT_CHUNK_ROWS
+                    bucket, lines = None, []
+                    async for record in conn.cursor(_bucket_query(entity), project_id, chunk_param, prefetch=SNAPSHOT_PREFETCH):
+                        row = dict(record)
+                        row_bucket = row.pop('_bucket')
+                        if lines and row_bucket != bucket:
+                            flush(entity, bucket, lines)
+                            lines = []
+                        bucket = row_bucket
+                        lines.append(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+                    if lines:
+                        flush(entity, bucket, lines)
+        manifest['stats'] = stats
+        return manifest, [*paths.values(), self.write_manifest(manifest)]
+
+    def iter_entity_rows(self, manifest: Dict[str, Any], entity: str) -> Iterator[Dict[str, Any]]:
+        for chunk in manifest['entities'].get(entity, []):
+            yield from self.read_chunk(chunk['hash'])
+
+    def write_archive(self, manifest: Dict[str, Any], path: str) -> str:
+        """Собирает из манифеста архив формата экспорта (<entity>.ndjson) — для merge/restore."""
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for entity in SNAPSHOT_TABLES:
+                with zipf.open(f'{entity}.ndjson', 'w', force_zip64=True) as entry:
+                    for row in self.iter_entity_rows(manifest, entity):
+                        entry.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+        return path
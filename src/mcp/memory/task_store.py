@@ -0,0 +1,138 @@
+import datetime
+import json
+import os
+import tempfile
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+# Журнал изменений задач (NDJSON, только дозапись); пусто — журнал не ведётся
+TASKS_JOURNAL_PATH = os.getenv("TASKS_JOURNAL_PATH", "")
+
+TASK_COLUMNS = 'id, project_id, command, context, rules, status, result'
+
+
+def _jsonb(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _task(row) -> Dict[str, Any]:
+    task = dict(row)
+    # asyncpg отдаёт jsonb строкой (кодек в пуле не регистрируется)
+    if isinstance(task.get('rules'), str):
+        task['rules'] = json.loads(task['rules'])
+    return task
+
+
+class TaskExistsError(ValueError):
+    def __init__(self, task_id: str):
+        super().__init__(f"Задача {task_id} уже существует")
+        self.task_id = task_id
+
+
+async def insert_task(conn, task: Dict[str, Any], project_id: int = None) -> Dict[str, Any]:
+    """
+    Создаёт новую задачу (INSERT ... ON CONFLICT DO NOTHING). Задача с таким id уже есть — TaskExistsError:
+    её status/result не перезаписываются.
+    """
+    row = await conn.fetchrow(
+        f'''INSERT INTO tasks ({TASK_COLUMNS}) VALUES ($1, $2, $3, $4, $5::jsonb, $6, $7)
+            ON CONFLICT (id) DO NOTHING
+            RETURNING {TASK_COLUMNS}''',
+        task['id'], project_id if project_id is not None else task.get('project_id'), task.get('command'),
+        task.get('context'), _jsonb(task.get('rules')), task.get('status'), task.get('result')
+    )
+    if row is None:
+        raise TaskExistsError(task['id'])
+    return _task(row)
+
+
+async def upsert_task(conn, task: Dict[str, Any], project_id: int = None) -> Dict[str, Any]:
+    """Создаёт или заменяет задачу одним INSERT ... ON CONFLICT по первичному ключу (импорт tasks-import)."""
+    row = await conn.fetchrow(
+        f'''INSERT INTO tasks ({TASK_COLUMNS}) VALUES ($1, $2, $3, $4, $5::jsonb, $6, $7)
+            ON CONFLICT (id) DO UPDATE SET project_id = COALESCE(EXCLUDED.project_id, tasks.project_id),
+                command = EXCLUDED.command, context = EXCLUDED.context, rules = EXCLUDED.rules,
+                status = EXCLUDED.status, result = EXCLUDED.result
+            RETURNING {TASK_COLUMNS}''',
+        task['id'], project_id if project_id is not None else task.get('project_id'), task.get('command'),
+        task.get('context'), _jsonb(task.get('rules')), task.get('status'), task.get('result')
+    )
+    return _task(row)
+
+
+async def get_task(conn, task_id: str) -> Optional[Dict[str, Any]]:
+    row = await conn.fetchrow(f'SELECT {TASK_COLUMNS} FROM tasks WHERE id = $1', task_id)
+    return _task(row) if row else None
+
+
+async def complete_task(conn, task_id: str, result: str) -> Optional[Dict[str, Any]]:
+    """Помечает задачу выполненной (UPDATE по ключу). Нет задачи — None."""
+    row = await conn.fetchrow(
+        f"UPDATE tasks SET status = 'done', result = $2 WHERE id = $1 RETURNING {TASK_COLUMNS}",
+        task_id, result
+    )
+    return _task(row) if row else None
+
+
+async def iter_tasks(conn, project_id: int = None, prefetch: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """Задачи по id серверным курсором. Нужна открытая транзакция."""
+    if project_id is None:
+        cursor = conn.cursor(f'SELECT {TASK_COLUMNS} FROM tasks ORDER BY id', prefetch=prefetch)
+    else:
+        cursor = conn.cursor(f'SELECT {TASK_COLUMNS} FROM tasks WHERE project_id = $1 ORDER BY id', project_id, prefetch=prefetch)
+    async for row in cursor:
+        yield _task(row)
+
+
+async def export_tasks_mdf(conn, path: str, project_id: int = None) -> int:
+    """
+    Выгрузка задач в JSON-массив прежнего формата tasks.mdf. Пишется во временный файл
+    рядом с целевым и подменяется атомарно: читатели не видят частично записанный файл.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('[')
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                async for task in iter_tasks(conn, project_id):
+                    f.write((',\n  ' if count else '\n  ') + json.dumps(task, ensure_ascii=False))
+                    count += 1
+            f.write('\n]\n' if count else ']\n')
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return count
+
+
+async def import_tasks(conn, tasks: Iterable[Dict[str, Any]], project_id: int = None) -> int:
+    """Перенос задач из tasks.mdf в таблицу (повторный импорт обновляет задачи по id)."""
+    count = 0
+    async with conn.transaction():
+        for task in tasks:
+            await upsert_task(conn, task, project_id)
+            count += 1
+    return count
+
+
+class TaskJournal:
+    """
+    Журнал изменений задач: одна JSON-строка на событие, только дозапись (O(1) на изменение).
+    Совместимость с tasks.mdf — через export_tasks_mdf, журнал — для аудита и внешних читателей.
+    """
+    def __init__(self, path: str = TASKS_JOURNAL_PATH):
+        self.path = path
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def append(self, event: str, task: Dict[str, Any]):
+        if not self.enabled:
+            return
+        line = json.dumps({'ts': datetime.datetime.utcnow().isoformat(), 'event': event, 'task': task}, ensure_ascii=False)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("memory_bank.vector_cache")
+
+# Кэш векторов проекта в памяти процесса (выключен по умолчанию)
+VECTOR_CACHE_ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "0") == "1"
+# Бюджет памяти на все проекты; вытеснение — LRU по проектам
+VECTOR_CACHE_MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Вставки через другие воркеры не инвалидируют локальный кэш — TTL ограничивает устаревание
+VECTOR_CACHE_TTL = float(os.getenv("VECTOR_CACHE_TTL", "60"))
+
+# vector_send — двоичное представление pgvector: int16 размерность, int16 резерв, float4 big-endian
+LOAD_SQL = '''SELECT COALESCE(entity_id, task_id) AS entity_id, entity_type, description, vector_send(vector) AS vector
+              FROM embeddings WHERE project_id = $1 ORDER BY id'''
+VECTOR_HEADER_BYTES = 4
+
+
+class ProjectVectors:
+    """Векторы проекта одной непрерывной float32-матрицей: строки нормированы, нормы хранятся отдельно."""
+    def __init__(self, ids: List[str], descriptions: List[str], matrix: np.ndarray, entity_types: List[str] = None):
+        self.ids = ids
+        self.descriptions = descriptions
+        self.entity_types = np.array(entity_types if entity_types is not None else [None] * len(ids), dtype=object)
+        norms = np.linalg.norm(matrix, axis=1).astype(np.float32) if len(matrix) else np.zeros(0, dtype=np.float32)
+        self.norms = norms
+        self.matrix = np.ascontiguousarray(matrix / np.where(norms == 0, 1, norms)[:, None], dtype=np.float32)
+        self.positions = {task_id: i for i, task_id in enumerate(ids)}
+        self.loaded_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.norms.nbytes
+
+    def vector(self, i: int) -> np.ndarray:
+        return self.matrix[i] * self.norms[i]
+
+    def top_k(self, query, k: int, metric: str = 'ip', entity_type: str = None) -> List[int]:
+        """
+        Точный top-k одним матричным умножением и argpartition.
+        Порядок совпадает с ORDER BY соответствующего оператора pgvector (<=>, <#>, <->).
+        entity_type — маска по типу до выбора top-k (как фильтр в WHERE).
+        """
+        q = np.asarray(query, dtype=np.float32)
+        if not len(self.ids):
+            return []
+        if q.shape != (self.matrix.shape[1],):
+            raise ValueError(f"Размерность запроса {q.shape[0]} не совпадает с векторами проекта ({self.matrix.shape[1]})")
+        q_norm = float(np.linalg.norm(q)) or 1.0
+        cos = self.matrix @ (q / q_norm)
+        if metric == 'cosine':
+            scores = cos
+        elif metric == 'ip':
+            scores = cos * self.norms * q_norm
+        elif metric == 'l2':
+            scores = 2 * cos * self.norms * q_norm - self.norms ** 2
+        else:
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        if entity_type is not None:
+            mask = self.entity_types == entity_type
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if not k:
+                return []
+        k = min(k, len(scores))
+        idx = np.argpartition(-scores, k - 1)[:k]
+        return idx[np.argsort(-scores[idx], kind='stable')].tolist()
+
+
+def parse_vectors(blobs: List[bytes]) -> np.ndarray:
+    """
+    Разбирает двоичные pgvector (vector_send) без текстового парсинга:
+    одна склейка байтов, np.frombuffer и отрезание заголовков всей матрицей.
+    """
+    if not blobs:
+        return np.zeros((0, 0), dtype=np.float32)
+    if len({len(b) for b in blobs}) != 1:
+        raise ValueError("Векторы проекта разной размерности")
+    raw = np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), -1)
+    return np.ascontiguousarray(raw[:, VECTOR_HEADER_BYTES:]).view('>f4').astype(np.float32)
+
+
+class VectorCache:
+    """
+    LRU-кэш ProjectVectors по проектам с ограничением по байтам.
+    Инвалидация — invalidate(project_id) после вставки; загрузка, начатая до инвалидации, в кэш не попадает
+    и к ней не присоединяются: загрузки ключуются (project_id, поколение).
+    """
+    def __init__(self, max_bytes: int = VECTOR_CACHE_MAX_BYTES, ttl: float = VECTOR_CACHE_TTL, enabled: bool = VECTOR_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: "OrderedDict[int, ProjectVectors]" = OrderedDict()
+        self._generation: Dict[int, int] = {}
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, memory_bank, project_id: int) -> ProjectVectors:
+        entry = self._entries.get(project_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            self._entries.move_to_end(project_id)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        key = (project_id, self._generation.get(project_id, 0))
+        task = self._loading.get(key)
+        if task is None:
+            # Параллельные промахи по одному проекту в одном поколении ждут одну загрузку
+            task = asyncio.ensure_future(self._load(memory_bank, project_id, key[1]))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, memory_bank, project_id: int, generation: int) -> ProjectVectors:
+        pool = await memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(LOAD_SQL, project_id)
+        entry = ProjectVectors([r['entity_id'] for r in rows], [r['description'] for r in rows],
+                               parse_vectors([r['vector'] for r in rows]), [r['entity_type'] for r in rows])
+        if self._generation.get(project_id, 0) == generation:
+            self._store(project_id, entry)
+        return entry
+
+    def _store(self, project_id: int, entry: ProjectVectors):
+        self._drop(project_id)
+        if entry.nbytes > self.max_bytes:
+            logger.info(f"Проект {project_id} ({entry.nbytes} байт) больше бюджета кэша — не кэшируется")
+            return
+        self._entries[project_id] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _drop(self, project_id: int):
+        entry = self._entries.pop(project_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def invalidate(self, project_id: int):
+        self._generation[project_id] = self._generation.get(project_id, 0) + 1
+        self._drop(project_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled, 'projects': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+            'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+        }
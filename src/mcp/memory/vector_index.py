@@ -0,0 +1,267 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Метрика -> (operator class индекса, оператор расстояния в ORDER BY)
+VECTOR_METRICS = {
+    'cosine': ('vector_cosine_ops', '<=>'),
+    'l2': ('vector_l2_ops', '<->'),
+    'ip': ('vector_ip_ops', '<#>'),
+}
+VECTOR_INDEX_METHODS = ('hnsw', 'ivfflat')
+# Тип колонки: halfvec (pgvector >= 0.7) — float16, вдвое меньше индекс и строки
+VECTOR_TYPES = ('vector', 'halfvec')
+
+# Метрика поиска по умолчанию: исторически /embeddings/search сортирует по <#> (inner product)
+VECTOR_SEARCH_METRIC = os.getenv("VECTOR_SEARCH_METRIC", "ip")
+# Значения по умолчанию для запроса; None — настройки сервера (hnsw.ef_search=40, ivfflat.probes=1)
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "0")) or None
+VECTOR_PROBES = int(os.getenv("VECTOR_PROBES", "0")) or None
+# pgvector >= 0.8: при фильтре по project_id индекс догружает кандидатов, пока не наберёт top_k
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "")
+
+# Типы сущностей эмбеддингов: под каждый можно построить частичный индекс (WHERE entity_type = ...)
+EMBEDDING_ENTITY_TYPES = ('task', 'doc', 'template')
+# Если после фильтра кандидатов не больше порога — точный поиск по ним без ANN (ef_search/probes не действуют).
+# Порог держится малым: сортировка тысяч полных векторов сравнима по времени с проходом HNSW; 0 — всегда ANN
+VECTOR_EXACT_THRESHOLD = int(os.getenv("VECTOR_EXACT_THRESHOLD", "2000"))
+
+# Квантованный поиск: грубый top-(k*m) по индексу над квантованной копией вектора, затем точный re-rank.
+# binary — binary_quantize()::bit(D), 1 бит на измерение (x32 меньше float32), расстояние Хэмминга;
+# halfvec — скалярное квантование в float16 (x2 меньше), метрика поиска
+QUANTIZATION_MODES = ('binary', 'halfvec')
+# m: сколько кандидатов на один результат берётся из квантованного индекса для re-rank
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+# Параметры построения индексов
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
+
+def _check(method: str, metric: str, vector_type: str = 'vector'):
+    if vector_type not in VECTOR_TYPES:
+        raise ValueError(f"Неизвестный тип вектора: {vector_type} (доступны {', '.join(VECTOR_TYPES)})")
+    if method not in VECTOR_INDEX_METHODS:
+        raise ValueError(f"Неизвестный тип индекса: {method} (доступны {', '.join(VECTOR_INDEX_METHODS)})")
+    if metric not in VECTOR_METRICS:
+        raise ValueError(f"Неизвестная метрика: {metric} (доступны {', '.join(VECTOR_METRICS)})")
+
+
+def entity_type_predicate(entity_type: str) -> str:
+    """
+    Фильтр по типу литералом, а не $-параметром: частичный индекс выбирается планировщиком,
+    только если предикат известен при планировании (в generic plan подставляется параметр).
+    """
+    if entity_type not in EMBEDDING_ENTITY_TYPES:
+        raise ValueError(f"Неизвестный entity_type: {entity_type} (доступны {', '.join(EMBEDDING_ENTITY_TYPES)})")
+    return f"entity_type = '{entity_type}'"
+
+
+def opclass_for(metric: str, vector_type: str = 'vector') -> str:
+    """Operator class под метрику и тип колонки: vector_cosine_ops -> halfvec_cosine_ops."""
+    return VECTOR_METRICS[metric][0].replace('vector_', f'{vector_type}_', 1)
+
+
+def vector_literal(vector) -> str:
+    """Текстовое представление pgvector '[...]': кодек vector в пуле не регистрируется."""
+    if isinstance(vector, str):
+        return vector
+    return '[' + ','.join(repr(float(x)) for x in vector) + ']'
+
+
+def index_name(method: str, metric: str, table: str = 'embeddings', entity_type: Optional[str] = None) -> str:
+    return f'idx_{table}_vector_{method}_{metric}' + (f'_{entity_type}' if entity_type else '')
+
+
+def create_index_sql(method: str, metric: str, table: str = 'embeddings', column: str = 'vector',
+                     m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                     lists: int = IVFFLAT_LISTS, concurrently: bool = True, entity_type: Optional[str] = None,
+                     vector_type: str = 'vector') -> str:
+    """
+    entity_type — частичный индекс только по строкам этого типа (меньше и точнее при фильтре по типу).
+    vector_type — тип колонки (vector/halfvec), от него зависит operator class.
+    """
+    _check(method, metric, vector_type)
+    opclass = opclass_for(metric, vector_type)
+    if method == 'hnsw':
+        options = f'm = {int(m)}, ef_construction = {int(ef_construction)}'
+    else:
+        options = f'lists = {int(lists)}'
+    where = f' WHERE {entity_type_predicate(entity_type)}' if entity_type else ''
+    return (f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}IF NOT EXISTS {index_name(method, metric, table, entity_type)} '
+            f'ON {table} USING {method} ({column} {opclass}) WITH ({options}){where}')
+
+
+async def create_vector_index(conn, method: str, metric: str, table: str = 'embeddings', concurrently: bool = True, **options) -> str:
+    """
+    Строит HNSW/IVFFlat индекс под метрику. CONCURRENTLY не блокирует запись,
+    но не может выполняться внутри транзакции. Возвращает имя индекса.
+    IVFFlat стоит строить после загрузки данных: центроиды списков считаются по текущим строкам.
+    """
+    await conn.execute(create_index_sql(method, metric, table, concurrently=concurrently, **options))
+    return index_name(method, metric, table, options.get('entity_type'))
+
+
+async def drop_vector_index(conn, method: str, metric: str, table: str = 'embeddings', concurrently: bool = True,
+                            entity_type: Optional[str] = None) -> str:
+    _check(method, metric)
+    name = index_name(method, metric, table, entity_type)
+    await conn.execute(f'DROP INDEX {"CONCURRENTLY " if concurrently else ""}IF EXISTS {name}')
+    return name
+
+
+async def list_vector_indexes(conn, table: str = 'embeddings') -> List[Dict[str, Any]]:
+    rows = await conn.fetch(
+        '''SELECT i.indexname, i.indexdef, pg_relation_size(c.oid) AS size_bytes
+           FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname
+           WHERE i.tablename = $1 AND (i.indexdef ILIKE '%USING hnsw%' OR i.indexdef ILIKE '%USING ivfflat%')
+           ORDER BY i.indexname''',
+        table
+    )
+    return [dict(r) for r in rows]
+
+
+async def apply_search_params(conn, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                              iterative_scan: str = VECTOR_ITERATIVE_SCAN):
+    """
+    SET LOCAL параметров ANN на время текущей транзакции: компромисс recall/latency задаётся на запрос.
+    SET не принимает $-параметры, поэтому значения приводятся к int.
+    """
+    if ef_search:
+        await conn.execute(f'SET LOCAL hnsw.ef_search = {int(ef_search)}')
+    if probes:
+        await conn.execute(f'SET LOCAL ivfflat.probes = {int(probes)}')
+    if iterative_scan:
+        await conn.execute(f"SET LOCAL hnsw.iterative_scan = {'relaxed_order' if iterative_scan == 'relaxed_order' else 'strict_order'}")
+
+
+def search_sql(columns: str, where: str, n_params: int, metric: str = VECTOR_SEARCH_METRIC, table: str = 'embeddings',
+               exact: bool = False, vector_type: str = 'vector') -> str:
+    """
+    ORDER BY <оператор метрики> — только тогда планировщик выберет индекс с тем же operator class.
+    exact — сначала фильтр (MATERIALIZED CTE по btree), затем точная сортировка кандидатов без ANN.
+    Запрос приводится к типу колонки (vector_type), иначе оператор halfvec-индекса не совпадёт.
+    """
+    if metric not in VECTOR_METRICS:
+        raise ValueError(f"Неизвестная метрика: {metric} (доступны {', '.join(VECTOR_METRICS)})")
+    if vector_type not in VECTOR_TYPES:
+        raise ValueError(f"Неизвестный тип вектора: {vector_type}")
+    op = VECTOR_METRICS[metric][1]
+    order = f'ORDER BY vector {op} ${n_params + 1}::text::{vector_type} LIMIT ${n_params + 2}'
+    if exact:
+        return (f'WITH candidates AS MATERIALIZED (SELECT * FROM {table} WHERE {where}) '
+                f'SELECT {columns} FROM candidates {order}')
+    return f'SELECT {columns} FROM {table} WHERE {where} {order}'
+
+
+async def count_candidates(conn, where: str, params: List[Any], limit: int, table: str = 'embeddings') -> int:
+    """Число строк под фильтром, но не больше limit + 1 — дешёвая проверка по btree."""
+    return await conn.fetchval(f'SELECT count(*) FROM (SELECT 1 FROM {table} WHERE {where} LIMIT {int(limit) + 1}) c', *params)
+
+
+async def vector_search(conn, where: str, params: List[Any], vector, top_k: int,
+                        columns: str = 'task_id, vector, description', metric: str = VECTOR_SEARCH_METRIC,
+                        ef_search: Optional[int] = VECTOR_EF_SEARCH, probes: Optional[int] = VECTOR_PROBES,
+                        table: str = 'embeddings', exact: Optional[bool] = None,
+                        exact_threshold: int = VECTOR_EXACT_THRESHOLD, vector_type: str = 'vector') -> list:
+    """
+    top_k ближайших под фильтром where. exact=None — выбор плана по числу кандидатов:
+    до exact_threshold строк — фильтр, затем точный поиск; больше — ANN по (частичному) индексу
+    с ef_search/probes на этот запрос. exact_threshold=0 — выбор не делается, всегда ANN.
+    """
+    if exact is None:
+        exact = exact_threshold > 0 and await count_candidates(conn, where, params, exact_threshold, table) <= exact_threshold
+    if exact and (ef_search or probes):
+        logger.info("Точный поиск по %s (не больше %d кандидатов): ef_search=%s, probes=%s не применяются",
+                    table, exact_threshold, ef_search, probes)
+    sql = search_sql(columns, where, len(params), metric, table, exact=exact, vector_type=vector_type)
+    async with conn.transaction():
+        if not exact:
+            await apply_search_params(conn, ef_search, probes)
+        return await conn.fetch(sql, *params, vector_literal(vector), top_k)
+
+
+def _check_quantization(mode: str, vector_type: str = 'vector'):
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Неизвестный режим квантования: {mode} (доступны {', '.join(QUANTIZATION_MODES)})")
+    if mode == 'halfvec' and vector_type == 'halfvec':
+        raise ValueError("Колонка уже halfvec: для неё доступно только binary-квантование")
+
+
+def quantized_expression(mode: str, dimension: int, value: str = 'vector') -> str:
+    """Выражение квантования; одно и то же в индексе и в запросе, иначе планировщик не возьмёт индекс."""
+    if mode == 'binary':
+        return f'(binary_quantize({value})::bit({int(dimension)}))'
+    return f'({value}::halfvec({int(dimension)}))'
+
+
+def quantized_index_name(mode: str, metric: str, table: str = 'embeddings', method: str = 'hnsw') -> str:
+    return f'idx_{table}_vector_{method}_{mode}' + ('' if mode == 'binary' else f'_{metric}')
+
+
+def quantized_index_sql(mode: str, dimension: int, metric: str = VECTOR_SEARCH_METRIC, table: str = 'embeddings',
+                        method: str = 'hnsw', vector_type: str = 'vector', m: int = HNSW_M,
+                        ef_construction: int = HNSW_EF_CONSTRUCTION, lists: int = IVFFLAT_LISTS,
+                        concurrently: bool = True) -> str:
+    """
+    Индекс по выражению: квантованная копия хранится только в индексе, полные векторы остаются в таблице
+    для re-rank. Для binary метрика не важна (bit_hamming_ops), для halfvec — operator class метрики.
+    """
+    _check(method, metric, vector_type)
+    _check_quantization(mode, vector_type)
+    opclass = 'bit_hamming_ops' if mode == 'binary' else opclass_for(metric, 'halfvec')
+    options = f'm = {int(m)}, ef_construction = {int(ef_construction)}' if method == 'hnsw' else f'lists = {int(lists)}'
+    return (f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}IF NOT EXISTS {quantized_index_name(mode, metric, table, method)} '
+            f'ON {table} USING {method} ({quantized_expression(mode, dimension)} {opclass}) WITH ({options})')
+
+
+async def create_quantized_index(conn, mode: str, dimension: int, metric: str = VECTOR_SEARCH_METRIC,
+                                 table: str = 'embeddings', method: str = 'hnsw', **options) -> str:
+    await conn.execute(quantized_index_sql(mode, dimension, metric, table, method, **options))
+    return quantized_index_name(mode, metric, table, method)
+
+
+async def drop_quantized_index(conn, mode: str, metric: str = VECTOR_SEARCH_METRIC, table: str = 'embeddings',
+                               method: str = 'hnsw', concurrently: bool = True) -> str:
+    _check_quantization(mode)
+    name = quantized_index_name(mode, metric, table, method)
+    await conn.execute(f'DROP INDEX {"CONCURRENTLY " if concurrently else ""}IF EXISTS {name}')
+    return name
+
+
+def quantized_search_sql(columns: str, where: str, n_params: int, mode: str, dimension: int,
+                         metric: str = VECTOR_SEARCH_METRIC, table: str = 'embeddings', vector_type: str = 'vector',
+                         rerank_factor: int = VECTOR_RERANK_FACTOR) -> str:
+    """
+    Подзапрос — top-(k*m) по квантованному индексу, внешний запрос — точная сортировка кандидатов
+    по полным векторам. Параметры: ${n+1} — вектор запроса, ${n+2} — k.
+    """
+    if metric not in VECTOR_METRICS:
+        raise ValueError(f"Неизвестная метрика: {metric} (доступны {', '.join(VECTOR_METRICS)})")
+    _check_quantization(mode, vector_type)
+    query = f'${n_params + 1}::text::{vector_type}'
+    coarse_op = '<~>' if mode == 'binary' else VECTOR_METRICS[metric][1]
+    op = VECTOR_METRICS[metric][1]
+    return (f'SELECT {columns} FROM ('
+            f'SELECT * FROM {table} WHERE {where} '
+            f'ORDER BY {quantized_expression(mode, dimension)} {coarse_op} {quantized_expression(mode, dimension, query)} '
+            f'LIMIT ${n_params + 2} * {int(rerank_factor)}'
+            f') candidates ORDER BY vector {op} {query} LIMIT ${n_params + 2}')
+
+
+async def quantized_search(conn, where: str, params: List[Any], vector, top_k: int, mode: str, dimension: int,
+                           columns: str = 'task_id, vector, description', metric: str = VECTOR_SEARCH_METRIC,
+                           ef_search: Optional[int] = VECTOR_EF_SEARCH, probes: Optional[int] = VECTOR_PROBES,
+                           table: str = 'embeddings', vector_type: str = 'vector',
+                           rerank_factor: int = VECTOR_RERANK_FACTOR) -> list:
+    """
+    Квантованный поиск с re-rank. HNSW возвращает не больше ef_search кандидатов,
+    поэтому ef_search поднимается до k*m (в пределах максимума pgvector 1000).
+    """
+    sql = quantized_search_sql(columns, where, len(params), mode, dimension, metric, table, vector_type, rerank_factor)
+    async with conn.transaction():
+        await apply_search_params(conn, min(max(ef_search or 40, top_k * rerank_factor), 1000), probes)
+        return await conn.fetch(sql, *params, vector_literal(vector), top_k)
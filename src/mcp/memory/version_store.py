@@ -0,0 +1,33 @@
+import logging
+import os
+from typing import Any, Dict
+
+logger = logging.getLogger("memory_bank.version_store")
+
+# Сколько раз повторить вставку, если параллельный запрос занял тот же номер версии
+VERSION_INSERT_RETRIES = int(os.getenv("VERSION_INSERT_RETRIES", "5"))
+
+
+async def insert_next_version(conn, table: str, key: Dict[str, Any], values: Dict[str, Any],
+                              retries: int = VERSION_INSERT_RETRIES) -> int:
+    """
+    Вставляет строку со следующим номером версии (max(version) + 1 по key) одним оператором.
+    Два параллельных запроса могут взять один номер: второй упирается в уникальный индекс
+    (миграция 0002), ON CONFLICT DO NOTHING ничего не вставляет, и номер пересчитывается заново.
+    Возвращает присвоенную версию.
+    """
+    key_columns = list(key)
+    columns = key_columns + ['version'] + list(values)
+    params = list(key.values()) + list(values.values())
+    where = ' AND '.join(f'{column} = ${i}' for i, column in enumerate(key_columns, 1))
+    placeholders = [f'${i}' for i in range(1, len(key_columns) + 1)]
+    placeholders.append(f'(SELECT coalesce(max(version), 0) + 1 FROM {table} WHERE {where})')
+    placeholders += [f'${i}' for i in range(len(key_columns) + 1, len(params) + 1)]
+    sql = f'''INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(placeholders)})
+              ON CONFLICT ({', '.join(key_columns)}, version) DO NOTHING RETURNING version'''
+    for attempt in range(retries):
+        version = await conn.fetchval(sql, *params)
+        if version is not None:
+            return version
+        logger.info(f"Версия {table} {key} занята параллельной вставкой, повтор {attempt + 1}/{retries}")
+    raise RuntimeError(f"Не удалось выделить номер версии {table} {key} за {retries} попыток")
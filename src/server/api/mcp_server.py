@@ -1,13 +1,15 @@
 from fastapi import FastAPI, HTTPException, Depends, Request, Query, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Header, Body, status
 from pydantic import BaseModel
 from src.mcp.core.core import get_cacd
-from src.mcp.memory.memory_bank import get_memory_bank
+from src.mcp.memory.memory_bank import get_memory_bank, memory_bank_lifespan
+from src.mcp.memory.project_archive import export_project_to_file
+from src.mcp.memory.version_store import insert_next_version
+from src.mcp.memory.task_store import TaskExistsError
 from typing import Optional, List, Any
 import json
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 import logging
 import os
-import pync
 import io
 import zipfile
 import tempfile
@@ -23,6 +25,7 @@ import strawberry
 from strawberry.fastapi import GraphQLRouter
 from strawberry.subscriptions import GRAPHQL_TRANSPORT_WS_PROTOCOL, GRAPHQL_WS_PROTOCOL
 import asyncio
+import contextlib
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -35,6 +38,10 @@ import importlib.util
 import yaml
 import filecmp
 from src.server.schemas.graphql_schema import schema
+from src.server.schemas.graphql_loaders import get_graphql_context
+from src.server.schemas.graphql_pubsub import broker as graphql_broker
+from src.server.schemas.graphql_extensions import cost_budget, document_cache, operation_metrics
+from src.server.utils.notifications import notifier
 
 # Импортируем генератор memory-bank
 from src.mcp.memory.generate_memory_bank import generate_memory_bank, TEMPLATES
@@ -42,7 +49,17 @@ from src.mcp.memory.generate_memory_bank import generate_memory_bank, TEMPLATES
 # Импортируем и монтируем все endpoint'ы из fastmcp_api.py
 from src.server.api.fastmcp_api import app as fastmcp_app
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Пул MemoryBank, LISTEN-соединение подписок GraphQL и диспетчер уведомлений закрываются при остановке
+    async with memory_bank_lifespan(app):
+        try:
+            yield
+        finally:
+            await graphql_broker.close()
+            await notifier.close()
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/api", fastmcp_app)
 
 API_KEY = os.getenv("API_KEY", "supersecretkey")
@@ -52,8 +69,6 @@ SECRET_KEY = os.getenv("JWT_SECRET", "supersecretjwtkey")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp_server")
 
-# Хранилище подключённых WebSocket-клиентов
-ws_clients = set()
 
 S3_ENDPOINT = os.getenv("S3_ENDPOINT")
 S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
@@ -64,7 +79,7 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-WHITELIST_PATHS = {'/auth/login', '/auth/register'}
+WHITELIST_PATHS = {'/auth/login', '/auth/register', '/health/db'}
 
 # In-memory хранилище webhook-URL (можно заменить на БД)
 registered_webhooks = set()
@@ -160,10 +175,12 @@ DEFAULT_TEMPLATES = [
 async def create_task(req: TaskRequest, memory_bank=Depends(get_memory_bank)):
     cacd = get_cacd(memory_bank)
     logger.info(f"Создание задачи: {req.task_id}")
-    task = await cacd.process_command(req.command, req.task_id)
+    try:
+        task = await cacd.process_command(req.command, req.task_id)
+    except TaskExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     msg = f"Создана задача {task['id']} для проекта {task.get('project_id', '')}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "created", "task": task}
 
 @app.get('/context/{task_id}', dependencies=[Depends(verify_api_key)])
@@ -199,8 +216,7 @@ async def update_rules(req: RuleRequest, user_id: str = Header(None, alias="X-US
             path = create_rule(meta, body, filename=filename, user_id=user_id, reason=reason, on_change=cb)
             results.append({'status': 'created', 'path': path})
     msg = "Обновлены правила (MDC)"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     return {"status": "rules updated", "results": results}
 
 @app.get('/rules', dependencies=[Depends(verify_api_key)])
@@ -244,6 +260,13 @@ async def create_project(req: ProjectCreateRequest, memory_bank=Depends(get_memo
             )
         return {"project_id": project_id}
 
+@app.get('/health/db')
+async def db_health(memory_bank=Depends(get_memory_bank)):
+    health = await memory_bank.health_check()
+    if health["status"] != "ok":
+        return JSONResponse(status_code=503, content=health)
+    return health
+
 @app.get('/projects/by_origin')
 async def get_project_by_origin(origin: str = Query(...), memory_bank=Depends(get_memory_bank)):
     pool = await memory_bank.get_pool()
@@ -256,31 +279,19 @@ async def get_project_by_origin(origin: str = Query(...), memory_bank=Depends(ge
 @app.websocket('/ws/notify')
 async def websocket_notify(websocket: WebSocket):
     await websocket.accept()
-    ws_clients.add(websocket)
+    client = notifier.register(websocket)
     try:
         while True:
             await websocket.receive_text()  # ping/pong или просто держим соединение
     except WebSocketDisconnect:
-        ws_clients.remove(websocket)
+        pass
+    finally:
+        notifier.unregister(client)
 
-# Функция для отправки уведомления всем WebSocket-клиентам
-async def notify_ws_clients(message: str):
-    for ws in list(ws_clients):
-        try:
-            await ws.send_text(message)
-        except Exception:
-            ws_clients.discard(ws)
-
-# Функция для отправки push-уведомления на Mac
-def notify_mac(title: str, message: str):
-    try:
-        pync.notify(message, title=title)
-    except Exception as e:
-        print(f"Push notification error: {e}")
-
-# Пример использования уведомлений (можно вызывать из endpoint'ов)
-# await notify_ws_clients("Новая задача создана!")
-# notify_mac("MCP", "Новая задача создана!")
+# Уведомления (WebSocket и macOS) рассылает фоновый диспетчер; обработчики только вызывают notifier.publish(msg)
+@app.get('/metrics/notifications', dependencies=[Depends(verify_api_key)])
+async def notification_metrics():
+    return notifier.stats()
 
 @app.post('/docs', dependencies=[Depends(verify_api_key)])
 async def create_doc(project_id: int, type: str, content: str, user_id: str = Header(None, alias="X-USER-ID"), memory_bank=Depends(get_memory_bank)):
@@ -292,14 +303,11 @@ async def create_doc(project_id: int, type: str, content: str, user_id: str = He
         )
         doc_id = row['id']
     msg = f"Добавлен документ типа {type} для проекта {project_id}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     # --- Автосохранение версии ---
     async with pool.acquire() as conn:
-        vrow = await conn.fetchrow('SELECT max(version) as v FROM doc_versions WHERE doc_id = $1', doc_id)
-        version = (vrow['v'] or 0) + 1
-        await conn.execute('''INSERT INTO doc_versions (doc_id, project_id, version, data, user_id) VALUES ($1, $2, $3, $4, $5)''',
-            doc_id, project_id, version, json.dumps({"type": type, "content": content}), user_id)
+        await insert_next_version(conn, 'doc_versions', {'doc_id': doc_id},
+                                  {'project_id': project_id, 'data': json.dumps({"type": type, "content": content}), 'user_id': user_id})
     return {"status": "doc created", "doc_id": doc_id}
 
 @app.get('/docs/{doc_id}/versions')
@@ -322,10 +330,8 @@ async def rollback_doc(doc_id: int, version: int, user_id: str = Header(None, al
         await conn.execute('''UPDATE docs SET type=$1, content=$2 WHERE id=$3''',
             data.get('type'), data.get('content'), doc_id)
         # Сохраняем новую версию (rollback)
-        vrow = await conn.fetchrow('SELECT max(version) as v FROM doc_versions WHERE doc_id = $1', doc_id)
-        new_version = (vrow['v'] or 0) + 1
-        await conn.execute('''INSERT INTO doc_versions (doc_id, project_id, version, data, user_id) VALUES ($1, $2, $3, $4, $5)''',
-            doc_id, project_id, new_version, json.dumps(data), user_id)
+        await insert_next_version(conn, 'doc_versions', {'doc_id': doc_id},
+                                  {'project_id': project_id, 'data': json.dumps(data), 'user_id': user_id})
     return {"status": "rolled_back", "doc_id": doc_id, "version": version}
 
 @app.get('/projects/{project_id}/export', dependencies=[Depends(verify_api_key)])
@@ -333,32 +339,12 @@ async def export_project(project_id: int, user_id: str = Header(None, alias="X-U
     """
     Экспортирует проект и все связанные сущности в zip-архив в archive/<origin>/.
     """
-    # Получаем все данные
-    tasks = await memory_bank.get_all_tasks(project_id)
-    rules = await memory_bank.get_all_rules(project_id)
-    templates = await memory_bank.get_all_templates(project_id)
-    embeddings = await memory_bank.get_all_embeddings(project_id)
-    docs = await memory_bank.get_all_docs(project_id)
-    history = await memory_bank.get_all_history(project_id)
-
-    # Формируем zip-архив в памяти
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr('tasks.json', json.dumps(tasks, ensure_ascii=False, indent=2))
-        zipf.writestr('rules.json', json.dumps(rules, ensure_ascii=False, indent=2))
-        zipf.writestr('templates.json', json.dumps(templates, ensure_ascii=False, indent=2))
-        zipf.writestr('embeddings.json', json.dumps(embeddings, ensure_ascii=False, indent=2))
-        zipf.writestr('docs.json', json.dumps(docs, ensure_ascii=False, indent=2))
-        zipf.writestr('history.json', json.dumps(history, ensure_ascii=False, indent=2))
-    zip_buffer.seek(0)
-
-    # Сохраняем архив в archive/<origin>/
+    # Потоково пишем архив в archive/<origin>/ (строки читаются курсором, без сборки в памяти)
     now = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
     archive_dir = os.path.join('archive', str(project_id))
     os.makedirs(archive_dir, exist_ok=True)
     archive_path = os.path.join(archive_dir, f'export_{now}.zip')
-    with open(archive_path, 'wb') as f:
-        f.write(zip_buffer.getvalue())
+    await export_project_to_file(memory_bank, project_id, archive_path)
 
     # Логируем экспорт в changelog (history)
     pool = await memory_bank.get_pool()
@@ -369,8 +355,7 @@ async def export_project(project_id: int, user_id: str = Header(None, alias="X-U
         )
 
     msg = f"Проект {project_id} экспортирован в архив {archive_path}"
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
 
     return {
         "status": "exported",
@@ -401,8 +386,7 @@ async def merge_project(
         # ...
     # Логирование merge
     msg = f"Merge архива {archive_path} в проект {project_id} завершён."
-    await notify_ws_clients(msg)
-    notify_mac("MCP", msg)
+    notifier.publish(msg)
     # ...
     return {"status": "merged", "archive_path": archive_path}
 
@@ -728,9 +712,19 @@ async def federation_push_template(origin: str, file: UploadFile = File(...)):
     return {'status': 'uploaded', 'file': file.filename}
 
 # Подключение GraphQL схемы
-graphql_app = GraphQLRouter(schema)
+graphql_app = GraphQLRouter(schema, context_getter=get_graphql_context)
 app.include_router(graphql_app, prefix="/graphql")
 
+@app.get('/metrics/graphql', dependencies=[Depends(verify_api_key)])
+async def graphql_metrics():
+    # Латентность по операциям (самые затратные по суммарному времени — первыми) и кэш документов
+    return {'operations': operation_metrics.stats(), 'documents': document_cache.stats(),
+            'throttled': cost_budget.throttled}
+
+@app.get('/metrics/graphql_pubsub', dependencies=[Depends(verify_api_key)])
+async def graphql_pubsub_metrics():
+    return graphql_broker.stats()
+
 @app.get('/backlog')
 async def get_backlog(origin: str):
     path = os.path.join('archive', origin, 'federation_backlog.md')
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from graphql import (
+    DocumentNode, FieldNode, FragmentSpreadNode, GraphQLError, GraphQLList, GraphQLSchema, OperationType,
+    SelectionSetNode, get_named_type, get_nullable_type, get_operation_ast, parse, value_from_ast_untyped,
+)
+from strawberry.extensions import SchemaExtension
+from strawberry.schema.schema import validate_document
+from strawberry.types.graphql import OperationType as StrawberryOperationType
+
+from src.server.schemas.graphql_pagination import GRAPHQL_MAX_PAGE_SIZE, GRAPHQL_PAGE_SIZE
+
+# Разобранные и провалидированные документы по sha256 текста запроса (общие для обычных и persisted-запросов)
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", "1000"))
+# Предельная вложенность полей и стоимость операции
+GRAPHQL_MAX_DEPTH = int(os.getenv("GRAPHQL_MAX_DEPTH", "10"))
+GRAPHQL_MAX_COST = int(os.getenv("GRAPHQL_MAX_COST", "20000"))
+# Оценка размера списков без пагинации (projects, docs, Project.tasks, ...)
+GRAPHQL_LIST_SIZE = int(os.getenv("GRAPHQL_LIST_SIZE", "20"))
+# Бюджет стоимости на клиента: пополнение в секунду и запас (0 — без троттлинга)
+GRAPHQL_COST_RATE = float(os.getenv("GRAPHQL_COST_RATE", "0"))
+GRAPHQL_COST_BURST = float(os.getenv("GRAPHQL_COST_BURST", str(GRAPHQL_MAX_COST)))
+# Предел числа различных операций в гистограммах (имена операций задаёт клиент)
+GRAPHQL_METRICS_MAX_OPERATIONS = int(os.getenv("GRAPHQL_METRICS_MAX_OPERATIONS", "200"))
+
+# Поля дороже единицы: вектор — сотни чисел на узел
+FIELD_COSTS = {('Embedding', 'vector'): 10}
+# Верхние границы корзин гистограммы латентности, мс (последняя корзина — всё, что больше)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Документ-заглушка для ошибок persisted query: strawberry нужен документ, чтобы вернуть ошибку в теле ответа
+_ERROR_DOCUMENT = parse('{ __typename }')
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache:
+    """LRU: sha256 запроса -> {'query', 'document', 'errors'}; errors — результат валидации (None — ещё не проверен)."""
+    def __init__(self, maxsize: int = GRAPHQL_DOCUMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry
+
+    def put(self, digest: str, query: str, document: DocumentNode) -> Dict[str, Any]:
+        entry = {'query': query, 'document': document, 'errors': None}
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self._entries), 'max_size': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class CostBudget:
+    """Token bucket стоимости на клиента: запрос дороже остатка отклоняется с retry_after."""
+    def __init__(self, rate: float = GRAPHQL_COST_RATE, burst: float = GRAPHQL_COST_BURST, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.throttled = 0
+
+    def take(self, client: str, cost: float) -> float:
+        """Списывает cost; возвращает 0 или через сколько секунд бюджета хватит."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if cost > tokens:
+            wait = (cost - tokens) / self.rate
+            self.throttled += 1
+        else:
+            tokens -= cost
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class OperationMetrics:
+    """Гистограммы латентности по операциям ('query Name'): счётчики по корзинам, сумма, число ошибок."""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, max_operations: int = GRAPHQL_METRICS_MAX_OPERATIONS):
+        self.buckets = tuple(buckets)
+        self.max_operations = max_operations
+        self._operations: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, operation: str, elapsed_ms: float, error: bool = False):
+        if operation not in self._operations and len(self._operations) >= self.max_operations:
+            operation = 'other'
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = {'count': 0, 'errors': 0, 'sum_ms': 0.0, 'max_ms': 0.0,
+                                                   'buckets': [0] * (len(self.buckets) + 1)}
+        stats['count'] += 1
+        stats['errors'] += int(error)
+        stats['sum_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        i = next((i for i, bound in enumerate(self.buckets) if elapsed_ms <= bound), len(self.buckets))
+        stats['buckets'][i] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f'le_{b}' for b in self.buckets] + ['inf']
+        return {
+            name: {'count': s['count'], 'errors': s['errors'], 'sum_ms': round(s['sum_ms'], 3),
+                   'avg_ms': round(s['sum_ms'] / s['count'], 3), 'max_ms': round(s['max_ms'], 3),
+                   'buckets': dict(zip(labels, s['buckets']))}
+            for name, s in sorted(self._operations.items(), key=lambda item: -item[1]['sum_ms'])
+        }
+
+
+document_cache = DocumentCache()
+cost_budget = CostBudget()
+operation_metrics = OperationMetrics()
+
+
+# --- Оценка стоимости ---
+
+def _argument(node: FieldNode, name: str, variables: Optional[Dict[str, Any]]):
+    for argument in node.arguments or ():
+        if argument.name.value == name:
+            return value_from_ast_untyped(argument.value, variables)
+    return None
+
+
+def _list_size(node: FieldNode, field_type, parent_name: str, variables) -> int:
+    if get_named_type(field_type).name.endswith('Connection'):
+        size = _argument(node, 'first', variables)
+        if size is None:
+            size = _argument(node, 'last', variables)
+        return min(GRAPHQL_PAGE_SIZE if size is None else max(int(size), 0), GRAPHQL_MAX_PAGE_SIZE)
+    # edges/nodes уже умножены на размер страницы самого connection-поля
+    if isinstance(get_nullable_type(field_type), GraphQLList) and not parent_name.endswith('Connection'):
+        return GRAPHQL_LIST_SIZE
+    return 1
+
+
+def _selection_cost(schema: GraphQLSchema, parent_type, selection_set: SelectionSetNode, fragments,
+                    variables, depth: int) -> Tuple[int, int]:
+    cost, max_depth = 0, depth
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            field = getattr(parent_type, 'fields', {}).get(name)
+            # __typename и интроспекция не считаются
+            if field is None:
+                continue
+            child_cost, child_depth = 0, depth + 1
+            if selection.selection_set is not None:
+                child_cost, child_depth = _selection_cost(schema, get_named_type(field.type), selection.selection_set,
+                                                          fragments, variables, depth + 1)
+            size = _list_size(selection, field.type, parent_type.name, variables)
+            cost += FIELD_COSTS.get((parent_type.name, name), 1) + size * child_cost
+            max_depth = max(max_depth, child_depth)
+        else:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = fragments[selection.name.value]
+                condition, selections = fragment.type_condition, fragment.selection_set
+            else:
+                condition, selections = selection.type_condition, selection.selection_set
+            fragment_type = schema.get_type(condition.name.value) if condition is not None else parent_type
+            fragment_cost, fragment_depth = _selection_cost(schema, fragment_type, selections, fragments, variables, depth)
+            cost += fragment_cost
+            max_depth = max(max_depth, fragment_depth)
+    return cost, max_depth
+
+
+def query_cost(schema: GraphQLSchema, document: DocumentNode, operation_name: Optional[str] = None,
+               variables: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+    """
+    (стоимость, глубина) операции по провалидированному документу. Поле стоит 1 (или FIELD_COSTS)
+    плюс стоимость вложенной выборки, умноженная на размер списка: first/last у connection-полей,
+    GRAPHQL_LIST_SIZE у списков без пагинации.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0, 0
+    root = {OperationType.QUERY: schema.query_type, OperationType.MUTATION: schema.mutation_type,
+            OperationType.SUBSCRIPTION: schema.subscription_type}[operation.operation]
+    fragments = {f.name.value: f for f in document.definitions if f.kind == 'fragment_definition'}
+    return _selection_cost(schema, root, operation.selection_set, fragments, variables or {}, 0)
+
+
+def _client_key(context) -> str:
+    request = getattr(context, 'request', None)
+    if request is None:
+        return 'local'
+    api_key = request.headers.get('X-API-KEY')
+    if api_key:
+        return 'key:' + query_hash(api_key)[:16]
+    return 'ip:' + (request.client.host if request.client else 'unknown')
+
+
+# --- Расширения strawberry ---
+
+class PersistedQueryCache(SchemaExtension):
+    """
+    Automatic persisted queries (протокол Apollo: extensions.persistedQuery.sha256Hash) и кэш
+    разбора/валидации. Запрос только с хешем берёт текст и документ из кэша; неизвестный хеш —
+    ошибка PersistedQueryNotFound, клиент повторяет запрос с текстом. Обычные запросы кэшируются
+    по тому же хешу, так что повторный текст не разбирается и не валидируется заново.
+    """
+    def __init__(self, *, execution_context=None):
+        super().__init__(execution_context=execution_context)
+        self._entry = None
+        self._digest = None
+
+    def _reject(self, message: str, code: str):
+        ctx = self.execution_context
+        ctx.graphql_document = _ERROR_DOCUMENT
+        ctx.pre_execution_errors = [GraphQLError(message, extensions={'code': code})]
+
+    def on_operation(self) -> Iterator[None]:
+        ctx = self.execution_context
+        persisted = (ctx.operation_extensions or {}).get('persistedQuery')
+        if persisted:
+            digest = persisted.get('sha256Hash')
+            if ctx.query:
+                if query_hash(ctx.query) != digest:
+                    self._reject('provided sha does not match query', 'PERSISTED_QUERY_HASH_MISMATCH')
+            else:
+                entry = document_cache.get(digest) if digest else None
+                if entry is None:
+                    self._reject('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+                else:
+                    ctx.query = entry['query']
+                    self._digest, self._entry = digest, entry
+        if ctx.query and self._entry is None and not ctx.pre_execution_errors:
+            self._digest = query_hash(ctx.query)
+            self._entry = document_cache.get(self._digest)
+        yield
+
+    def on_parse(self) -> Iterator[None]:
+        ctx = self.execution_context
+        if self._entry is not None:
+            ctx.graphql_document = self._entry['document']
+        yield
+        if self._entry is None and self._digest is not None and ctx.graphql_document is not None:
+            self._entry = document_cache.put(self._digest, ctx.query, ctx.graphql_document)
+
+    def on_validate(self) -> Iterator[None]:
+        ctx = self.execution_context
+        # Валидация здесь, до стандартной: strawberry пропускает свою, если pre_execution_errors уже заданы
+        if self._entry is not None and ctx.pre_execution_errors is None and ctx.validation_rules:
+            if self._entry['errors'] is None:
+                self._entry['errors'] = list(validate_document(ctx.schema._schema, self._entry['document'],
+                                                               ctx.validation_rules))
+            ctx.pre_execution_errors = list(self._entry['errors'])
+        yield
+
+
+class QueryCostLimiter(SchemaExtension):
+    """
+    Отклоняет операции глубже GRAPHQL_MAX_DEPTH или дороже GRAPHQL_MAX_COST и списывает стоимость из бюджета клиента.
+    Ошибки нужно выставить до выхода из фазы валидации (strawberry проверяет их внутри неё), поэтому
+    оценка идёт перед стандартной валидацией — по результату PersistedQueryCache (он в списке раньше)
+    или собственной валидации документа.
+    """
+    def on_validate(self) -> Iterator[None]:
+        self._check()
+        yield
+
+    def _check(self):
+        ctx = self.execution_context
+        if ctx.graphql_document is None:
+            return
+        if ctx.pre_execution_errors is None and ctx.validation_rules:
+            ctx.pre_execution_errors = list(validate_document(ctx.schema._schema, ctx.graphql_document,
+                                                              ctx.validation_rules))
+        if ctx.pre_execution_errors:
+            return
+        cost, depth = query_cost(ctx.schema._schema, ctx.graphql_document, ctx.operation_name, ctx.variables)
+        if depth > GRAPHQL_MAX_DEPTH:
+            ctx.pre_execution_errors = [GraphQLError(
+                f'Глубина запроса {depth} больше допустимой {GRAPHQL_MAX_DEPTH}',
+                extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth, 'max_depth': GRAPHQL_MAX_DEPTH})]
+        elif cost > GRAPHQL_MAX_COST:
+            ctx.pre_execution_errors = [GraphQLError(
+                f'Стоимость запроса {cost} больше допустимой {GRAPHQL_MAX_COST}',
+                extensions={'code': 'QUERY_TOO_COMPLEX', 'cost': cost, 'max_cost': GRAPHQL_MAX_COST})]
+        else:
+            retry_after = cost_budget.take(_client_key(ctx.context), cost)
+            if retry_after:
+                ctx.pre_execution_errors = [GraphQLError(
+                    'Превышен бюджет стоимости запросов',
+                    extensions={'code': 'RATE_LIMITED', 'cost': cost, 'retry_after': round(retry_after, 3)})]
+
+
+class OperationLatency(SchemaExtension):
+    """Время операции от начала разбора до результата — в operation_metrics (подписки не учитываются)."""
+    def on_operation(self) -> Iterator[None]:
+        started = time.perf_counter()
+        yield
+        ctx = self.execution_context
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Неразобранный запрос и промах persisted query — одной строкой
+        if ctx.graphql_document is None or ctx.graphql_document is _ERROR_DOCUMENT:
+            operation_metrics.observe('invalid', elapsed_ms, error=True)
+            return
+        try:
+            operation_type = ctx.operation_type
+        except RuntimeError:
+            operation_metrics.observe('invalid', elapsed_ms, error=True)
+            return
+        if operation_type == StrawberryOperationType.SUBSCRIPTION:
+            return
+        error = bool(ctx.pre_execution_errors) or bool(ctx.result is not None and ctx.result.errors)
+        operation_metrics.observe(f'{operation_type.value} {ctx.operation_name or "anonymous"}', elapsed_ms, error)
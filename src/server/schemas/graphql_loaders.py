@@ -0,0 +1,47 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence
+
+from strawberry.dataloader import DataLoader
+from strawberry.fastapi import BaseContext
+
+from src.mcp.memory.memory_bank import MemoryBank, get_shared_memory_bank
+
+# Выборки по списку проектов: один запрос на все project_id, собранные за тик event loop
+PROJECT_LOADER_QUERIES = {
+    'tasks': 'SELECT id, project_id, command, status, result, created_at FROM tasks WHERE project_id = ANY($1) ORDER BY id',
+    'rules': 'SELECT id, project_id, type, value, description FROM cursor_rules WHERE project_id = ANY($1) ORDER BY id',
+    'templates': 'SELECT id, project_id, name, repo_url, tags FROM templates WHERE project_id = ANY($1) ORDER BY id',
+    'docs': 'SELECT id, project_id, type, content FROM docs WHERE project_id = ANY($1) ORDER BY id',
+}
+
+
+def project_loader(memory_bank: MemoryBank, sql: str) -> DataLoader:
+    """DataLoader project_id -> строки: ключи всех резолверов одного тика уходят одним запросом WHERE project_id = ANY($1)."""
+    async def load(project_ids: Sequence[int]) -> List[List[Dict[str, Any]]]:
+        pool = await memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(sql, list(project_ids))
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row['project_id']].append(dict(row))
+        return [grouped[project_id] for project_id in project_ids]
+    return DataLoader(load_fn=load)
+
+
+class Loaders:
+    """Набор DataLoader'ов на один запрос: кэш загрузчика не переживает запрос и не отдаёт устаревшие данные."""
+    def __init__(self, memory_bank: MemoryBank):
+        for name, sql in PROJECT_LOADER_QUERIES.items():
+            setattr(self, name, project_loader(memory_bank, sql))
+
+
+class GraphQLContext(BaseContext):
+    def __init__(self, memory_bank: MemoryBank):
+        super().__init__()
+        self.memory_bank = memory_bank
+        self.loaders = Loaders(memory_bank)
+
+
+async def get_graphql_context() -> GraphQLContext:
+    """context_getter для GraphQLRouter: общий пул процесса, новые загрузчики на каждый запрос."""
+    return GraphQLContext(get_shared_memory_bank())
@@ -0,0 +1,103 @@
+import base64
+import datetime
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from strawberry.types import Info
+from strawberry.types.nodes import SelectedField
+
+# Размер страницы без first/last и верхняя граница запрошенного
+GRAPHQL_PAGE_SIZE = int(os.getenv("GRAPHQL_PAGE_SIZE", "50"))
+GRAPHQL_MAX_PAGE_SIZE = int(os.getenv("GRAPHQL_MAX_PAGE_SIZE", "500"))
+
+
+def encode_cursor(created_at: datetime.datetime, id: Any) -> str:
+    """Непрозрачный курсор Relay: base64 от [created_at, id] — ключа сортировки строки."""
+    payload = json.dumps([created_at.isoformat() if created_at is not None else None, id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime.datetime], Any]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.datetime.fromisoformat(created_at) if created_at is not None else None), id
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError(f"Некорректный курсор: {cursor}")
+
+
+def _walk(selections: Iterable, path: Tuple[str, ...]) -> Iterable[SelectedField]:
+    """Поля по пути (edges -> node) с раскрытием фрагментов."""
+    for selection in selections:
+        if not isinstance(selection, SelectedField):
+            yield from _walk(selection.selections, path)
+        elif not path:
+            yield selection
+        elif selection.name == path[0]:
+            yield from _walk(selection.selections, path[1:])
+
+
+def selected_node_fields(info: Info) -> Set[str]:
+    """Имена полей узла, запрошенные в edges { node { ... } } и nodes { ... } текущего connection-поля."""
+    # info.selected_fields — само connection-поле; путь идёт от его выборки
+    selections = [s for field in info.selected_fields for s in field.selections]
+    names = set()
+    for path in (('edges', 'node'), ('nodes',)):
+        names.update(field.name for field in _walk(selections, path))
+    return names
+
+
+def project_columns(fields: Set[str], columns: Dict[str, str]) -> List[str]:
+    """
+    SQL-выражения для запрошенных полей (columns: GraphQL-имя -> выражение) плюс ключ курсора.
+    Порядок стабилен — по columns, чтобы одинаковые выборки давали один текст запроса.
+    """
+    selected = [sql for name, sql in columns.items() if name in fields]
+    return ['id', 'created_at'] + [sql for sql in selected if sql not in ('id', 'created_at')]
+
+
+def page_window(first: Optional[int], last: Optional[int]) -> Tuple[int, bool]:
+    """(размер страницы, назад ли): first/after — вперёд от курсора, last/before — хвост перед курсором."""
+    if first is not None and last is not None:
+        raise ValueError("first и last взаимоисключающие")
+    size = first if first is not None else last if last is not None else GRAPHQL_PAGE_SIZE
+    if size < 0:
+        raise ValueError("first/last должны быть >= 0")
+    return min(size, GRAPHQL_MAX_PAGE_SIZE), last is not None
+
+
+def keyset_sql(table: str, columns: List[str], where: str, param_count: int,
+               cursor: bool, backward: bool) -> str:
+    """
+    Страница по (created_at, id): сравнение кортежей в WHERE и ORDER BY по тем же ключам
+    идут по индексу (project_id, created_at, id), без OFFSET и без чтения пропущенных строк.
+    LIMIT на одну строку больше страницы — по лишней строке определяется наличие следующей.
+    """
+    op, order = ('<', 'DESC') if backward else ('>', 'ASC')
+    if cursor:
+        where += f' AND (created_at, id) {op} (${param_count + 1}, ${param_count + 2})'
+        param_count += 2
+    return (f'SELECT {", ".join(columns)} FROM {table} WHERE {where} '
+            f'ORDER BY created_at {order}, id {order} LIMIT ${param_count + 1}')
+
+
+async def fetch_page(conn, table: str, columns: List[str], where: str, params: List[Any],
+                     first: Optional[int] = None, after: Optional[str] = None,
+                     last: Optional[int] = None, before: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Keyset-страница Relay. Возвращает {'rows', 'has_next_page', 'has_previous_page'};
+    строки всегда в порядке возрастания (created_at, id), в том числе для last/before.
+    """
+    size, backward = page_window(first, last)
+    cursor = before if backward else after
+    args = list(params)
+    if cursor is not None:
+        args.extend(decode_cursor(cursor))
+    sql = keyset_sql(table, columns, where, len(params), cursor is not None, backward)
+    rows = await conn.fetch(sql, *args, size + 1)
+    more = len(rows) > size
+    rows = rows[:size]
+    if backward:
+        rows = rows[::-1]
+        return {'rows': rows, 'has_next_page': before is not None, 'has_previous_page': more}
+    return {'rows': rows, 'has_next_page': more, 'has_previous_page': after is not None}
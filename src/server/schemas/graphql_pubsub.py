@@ -0,0 +1,266 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+import asyncpg
+
+logger = logging.getLogger("memory_bank.graphql_pubsub")
+
+# Сколько событий ждёт в буфере одного подписчика; сверх — политика вытеснения
+GRAPHQL_SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("GRAPHQL_SUBSCRIPTION_QUEUE_SIZE", "100"))
+# coalesce — в буфере остаётся последнее состояние каждой сущности; drop_oldest — очередь, старые вытесняются
+GRAPHQL_SUBSCRIPTION_POLICY = os.getenv("GRAPHQL_SUBSCRIPTION_POLICY", "coalesce")
+# Канал NOTIFY между воркерами
+GRAPHQL_PUBSUB_CHANNEL = os.getenv("GRAPHQL_PUBSUB_CHANNEL", "memory_bank_graphql")
+
+# Переподключение LISTEN после разрыва: первая пауза и её потолок (пауза удваивается)
+GRAPHQL_PUBSUB_RECONNECT_DELAY = float(os.getenv("GRAPHQL_PUBSUB_RECONNECT_DELAY", "1"))
+GRAPHQL_PUBSUB_RECONNECT_MAX_DELAY = float(os.getenv("GRAPHQL_PUBSUB_RECONNECT_MAX_DELAY", "30"))
+
+SUBSCRIPTION_POLICIES = ('coalesce', 'drop_oldest')
+# Вид события: upsert — строка создана или изменена, delete — удалена (row — последнее состояние)
+EVENT_OPS = ('upsert', 'delete')
+# Лимит payload NOTIFY — 8000 байт; строки крупнее отправляются ссылкой и перечитываются получателем
+NOTIFY_MAX_PAYLOAD = 7900
+
+Topic = Tuple[str, int]
+
+
+class Subscriber:
+    """
+    Ограниченный буфер одного подписчика. offer() не блокирует публикацию: медленный клиент
+    теряет (drop_oldest) или склеивает (coalesce, по id сущности) события, а не тормозит остальных.
+    Событие — {'op', 'row'}: при склейке остаётся последнее, так что удаление вытесняет ожидающее
+    обновление той же строки и подписчик видит итог — строка удалена. ops — какие виды событий принимать.
+    """
+    def __init__(self, maxsize: int = GRAPHQL_SUBSCRIPTION_QUEUE_SIZE, policy: str = GRAPHQL_SUBSCRIPTION_POLICY,
+                 ops=EVENT_OPS):
+        if policy not in SUBSCRIPTION_POLICIES:
+            raise ValueError(f"Неизвестная политика подписки: {policy} (доступны {', '.join(SUBSCRIPTION_POLICIES)})")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ops = frozenset(ops)
+        self._buffer: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def offer(self, key: Any, value: Dict[str, Any]):
+        if self.policy == 'coalesce':
+            if key in self._buffer:
+                # Место в очереди сохраняется, значение — самое свежее
+                self._buffer[key] = value
+                self.coalesced += 1
+                return
+        else:
+            key, self._seq = self._seq, self._seq + 1
+        if len(self._buffer) >= self.maxsize:
+            self._buffer.popitem(last=False)
+            self.dropped += 1
+        self._buffer[key] = value
+        self._ready.set()
+
+    async def get(self) -> Dict[str, Any]:
+        while not self._buffer:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._buffer.popitem(last=False)[1]
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+
+class Broker:
+    """
+    Pub/sub подписок GraphQL с индексом по теме (entity, project_id): событие проекта получают
+    только подписчики этого проекта. Между воркерами — LISTEN/NOTIFY на отдельном соединении
+    вне пула; без LISTEN (нет БД, разрыв) события доставляются в пределах воркера, а соединение
+    переподключается в фоне с экспоненциальной паузой, пока есть подписчики.
+    """
+    def __init__(self, channel: str = GRAPHQL_PUBSUB_CHANNEL, maxsize: int = GRAPHQL_SUBSCRIPTION_QUEUE_SIZE,
+                 policy: str = GRAPHQL_SUBSCRIPTION_POLICY, reconnect_delay: float = GRAPHQL_PUBSUB_RECONNECT_DELAY,
+                 reconnect_max_delay: float = GRAPHQL_PUBSUB_RECONNECT_MAX_DELAY):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.policy = policy
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._topics: Dict[Topic, Set[Subscriber]] = {}
+        # entity -> SQL перечитывания строки по id (для событий, пришедших ссылкой)
+        self._fetch_sql: Dict[str, str] = {}
+        self._instance_id = uuid.uuid4().hex[:12]
+        self._memory_bank = None
+        self._listener = None
+        self._listener_lock = asyncio.Lock()
+        self._reconnect: Optional[asyncio.Task] = None
+        self.reconnects = 0
+        self._pending: Set[asyncio.Task] = set()
+        self.published = 0
+        self.delivered = 0
+        self.remote = 0
+        # Потери и склейки отключившихся подписчиков
+        self.dropped = 0
+        self.coalesced = 0
+
+    def register(self, entity: str, fetch_sql: str):
+        """fetch_sql — SELECT строки сущности по id ($1) в том же виде, в каком её публикуют мутации."""
+        self._fetch_sql[entity] = fetch_sql
+
+    def _fanout(self, entity: str, project_id: int, op: str, row: Dict[str, Any]) -> int:
+        subscribers = [s for s in self._topics.get((entity, project_id), ()) if op in s.ops]
+        event = {'op': op, 'row': row}
+        for subscriber in subscribers:
+            subscriber.offer(row.get('id'), event)
+        self.delivered += len(subscribers)
+        return len(subscribers)
+
+    async def publish(self, memory_bank, entity: str, project_id: int, row: Dict[str, Any], op: str = 'upsert'):
+        """
+        Локальная раздача (без ожидания подписчиков) и NOTIFY для остальных воркеров.
+        op='delete' — row удалена; вид события идёт и в NOTIFY, чтобы удаление не выглядело правкой.
+        Ошибка NOTIFY не роняет мутацию: событие уже доставлено локально, остальное — в лог.
+        """
+        if op not in EVENT_OPS:
+            raise ValueError(f"Неизвестный вид события: {op} (доступны {', '.join(EVENT_OPS)})")
+        self.published += 1
+        self._fanout(entity, project_id, op, row)
+        message = {'s': self._instance_id, 'e': entity, 'p': project_id, 'o': op, 'r': row}
+        payload = json.dumps(message, default=str, ensure_ascii=False)
+        if len(payload.encode('utf-8')) > NOTIFY_MAX_PAYLOAD:
+            payload = json.dumps({'s': self._instance_id, 'e': entity, 'p': project_id, 'o': op, 'id': row.get('id')}, default=str)
+        try:
+            pool = await memory_bank.get_pool()
+            async with pool.acquire() as conn:
+                await conn.execute('SELECT pg_notify($1, $2)', self.channel, payload)
+        except Exception as e:
+            logger.warning(f"NOTIFY {self.channel} ({entity}, project {project_id}) не отправлен: {e}")
+
+    async def subscribe(self, memory_bank, entity: str, project_id: int, policy: Optional[str] = None,
+                        ops=EVENT_OPS) -> AsyncIterator[Dict[str, Any]]:
+        """События темы {'op', 'row'}; ops — только эти виды (например, ('delete',))."""
+        await self._ensure_listener(memory_bank)
+        subscriber = Subscriber(self.maxsize, policy or self.policy, ops)
+        topic = (entity, project_id)
+        self._topics.setdefault(topic, set()).add(subscriber)
+        try:
+            while True:
+                yield await subscriber.get()
+        finally:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[topic]
+            self.dropped += subscriber.dropped
+            self.coalesced += subscriber.coalesced
+
+    async def _ensure_listener(self, memory_bank):
+        if self._listener is not None and not self._listener.is_closed():
+            return
+        async with self._listener_lock:
+            if self._listener is not None and not self._listener.is_closed():
+                return
+            self._memory_bank = memory_bank
+            try:
+                listener = await asyncpg.connect(dsn=memory_bank.dsn)
+                await listener.add_listener(self.channel, self._on_notify)
+                listener.add_termination_listener(self._on_terminate)
+                self._listener = listener
+            except Exception as e:
+                logger.warning(f"LISTEN {self.channel} недоступен, подписки GraphQL только в пределах воркера: {e}")
+                self._schedule_reconnect()
+
+    def _on_terminate(self, connection):
+        if self._listener is connection:
+            self._listener = None
+            logger.warning(f"Соединение LISTEN {self.channel} разорвано, переподключение")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        if self._reconnect is None or self._reconnect.done():
+            self._reconnect = asyncio.ensure_future(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """Повторяет LISTEN, пока он не восстановится или не останется подписчиков (тогда — при следующей подписке)."""
+        delay = self.reconnect_delay
+        while True:
+            await asyncio.sleep(delay)
+            if not self._topics or self._memory_bank is None:
+                return
+            await self._ensure_listener(self._memory_bank)
+            if self._listener is not None:
+                self.reconnects += 1
+                logger.info(f"LISTEN {self.channel} восстановлен")
+                return
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Некорректное уведомление {channel}: {payload[:200]}")
+            return
+        if message.get('s') == self._instance_id:
+            return
+        entity, project_id = message['e'], message['p']
+        if (entity, project_id) not in self._topics:
+            return
+        self.remote += 1
+        # Уведомления без 'o' — от воркеров до появления вида события
+        op = message.get('o', 'upsert')
+        if 'r' in message:
+            self._fanout(entity, project_id, op, message['r'])
+        elif op == 'delete':
+            # Удалённую строку не перечитать — подписчики получают её id
+            self._fanout(entity, project_id, op, {'id': message['id'], 'project_id': project_id})
+        else:
+            task = asyncio.ensure_future(self._fetch_and_fanout(entity, project_id, message['id']))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _fetch_and_fanout(self, entity: str, project_id: int, id: Any):
+        sql = self._fetch_sql.get(entity)
+        if sql is None or self._memory_bank is None:
+            return
+        try:
+            pool = await self._memory_bank.get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(sql, id)
+        except Exception as e:
+            logger.warning(f"Не удалось перечитать {entity} {id} для подписчиков: {e}")
+            return
+        # Удалённая к этому моменту строка не рассылается
+        if row is not None:
+            self._fanout(entity, project_id, 'upsert', dict(row))
+
+    async def close(self):
+        for task in list(self._pending):
+            task.cancel()
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        # Сначала сбрасываем ссылку: закрытие вызовет _on_terminate, переподключаться не нужно
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            with contextlib.suppress(Exception):
+                await listener.close()
+
+    def stats(self) -> Dict[str, Any]:
+        subscribers = [s for subs in self._topics.values() for s in subs]
+        return {
+            'listening': self._listener is not None and not self._listener.is_closed(),
+            'topics': len(self._topics), 'subscribers': len(subscribers),
+            'buffered': sum(len(s) for s in subscribers),
+            'published': self.published, 'delivered': self.delivered, 'remote': self.remote, 'reconnects': self.reconnects,
+            'dropped': self.dropped + sum(s.dropped for s in subscribers),
+            'coalesced': self.coalesced + sum(s.coalesced for s in subscribers),
+        }
+
+
+broker = Broker()
@@ -1,27 +1,13 @@
 import strawberry
-from typing import List, Optional
-import asyncio
-
-# In-memory pubsub для подписок по сущностям
-class PubSub:
-    def __init__(self):
-        self.subscribers = []
-    async def publish(self, value):
-        for queue in self.subscribers:
-            await queue.put(value)
-    async def subscribe(self):
-        queue = asyncio.Queue()
-        self.subscribers.append(queue)
-        try:
-            while True:
-                value = await queue.get()
-                yield value
-        finally:
-            self.subscribers.remove(queue)
-
-doc_pubsub = PubSub()
-rule_pubsub = PubSub()
-template_pubsub = PubSub()
+from strawberry.types import Info
+from typing import Generic, List, Optional, TypeVar
+import json
+
+from src.mcp.memory.vector_index import vector_literal, EMBEDDING_ENTITY_TYPES
+from src.mcp.memory.embedding_store import check_dimension, resolve_model
+from src.server.schemas.graphql_pagination import encode_cursor, fetch_page, project_columns, selected_node_fields
+from src.server.schemas.graphql_pubsub import broker
+from src.server.schemas.graphql_extensions import OperationLatency, PersistedQueryCache, QueryCostLimiter
 
 @strawberry.type
 class Project:
@@ -30,13 +16,31 @@ class Project:
     description: str
     origin: str
 
+    # Вложенные выборки идут через DataLoader: N проектов в ответе — один запрос на поле, а не N
+    @strawberry.field
+    async def tasks(self, info: Info) -> List["Task"]:
+        return [_task(r) for r in await info.context.loaders.tasks.load(self.id)]
+
+    @strawberry.field
+    async def rules(self, info: Info) -> List["Rule"]:
+        return [_rule(r) for r in await info.context.loaders.rules.load(self.id)]
+
+    @strawberry.field
+    async def templates(self, info: Info) -> List["Template"]:
+        return [_template(r) for r in await info.context.loaders.templates.load(self.id)]
+
+    @strawberry.field
+    async def docs(self, info: Info) -> List["Doc"]:
+        return [_doc(r) for r in await info.context.loaders.docs.load(self.id)]
+
 @strawberry.type
 class Task:
     id: str
-    project_id: int
+    project_id: Optional[int]
     command: str
     status: str
     result: Optional[str]
+    created_at: Optional[str] = None
 
 @strawberry.type
 class Rule:
@@ -65,20 +69,44 @@ class Template:
 class Embedding:
     id: int
     project_id: int
-    model: str
+    # Строки общей таблицы без модели и строки до 0005, тип которых не восстановился, — null
+    model: Optional[str]
     vector: List[float]
-    entity_type: str
+    entity_type: Optional[str]
     entity_id: str
+    created_at: Optional[str] = None
 
 @strawberry.type
 class History:
     id: int
     project_id: int
-    user_id: str
+    # Системные события (импорт, снапшот без X-USER-ID) пишутся без пользователя
+    user_id: Optional[str]
     action: str
     details: str
     created_at: str
 
+# Relay-connection: keyset-страница по (created_at, id)
+T = TypeVar('T')
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    has_previous_page: bool
+    start_cursor: Optional[str]
+    end_cursor: Optional[str]
+
+@strawberry.type
+class Edge(Generic[T]):
+    cursor: str
+    node: T
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    nodes: List[T]
+    page_info: PageInfo
+
 @strawberry.type
 class ArchiveOrigin:
     origin: str
@@ -148,220 +176,298 @@ class EmbeddingInput:
     entity_type: str
     entity_id: str
 
+# Строки БД -> GraphQL-типы
+def _project(r) -> Project:
+    return Project(id=r['id'], name=r['name'], description=r['description'], origin=r['origin'])
+
+# Строки connection-запросов содержат только запрошенные колонки — поэтому r.get
+def _str(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+def _task(r) -> Task:
+    return Task(id=r['id'], project_id=r.get('project_id'), command=r.get('command'), status=r.get('status'),
+                result=r.get('result'), created_at=_str(r.get('created_at')))
+
+def _rule(r) -> Rule:
+    return Rule(id=r['id'], project_id=r['project_id'], type=r['type'], value=r['value'], description=r['description'])
+
+def _doc(r) -> Doc:
+    return Doc(id=r['id'], project_id=r['project_id'], type=r['type'], content=r['content'])
+
+def _template(r) -> Template:
+    # templates.tags — TEXT[], в схеме — строка через запятую
+    tags = r['tags']
+    return Template(id=r['id'], project_id=r['project_id'], name=r['name'], repo_url=r['repo_url'],
+                    tags=','.join(tags) if isinstance(tags, list) else tags)
+
+def _tags_array(tags: Optional[str]) -> Optional[List[str]]:
+    return [t.strip() for t in tags.split(',') if t.strip()] if tags is not None else None
+
+def _embedding(r) -> Embedding:
+    # vector читается текстом '[...]' (кодек vector в пуле не регистрируется)
+    vector = r.get('vector')
+    return Embedding(id=r['id'], project_id=r.get('project_id'), model=r.get('model'),
+                     vector=json.loads(vector) if vector is not None else None,
+                     entity_type=r.get('entity_type'), entity_id=r.get('entity_id'), created_at=_str(r.get('created_at')))
+
+def _history(r) -> History:
+    return History(id=r['id'], project_id=r.get('project_id'), user_id=r.get('user_id'), action=r.get('action'),
+                   details=r.get('details'), created_at=_str(r.get('created_at')))
+
+async def _fetchrow(info: Info, sql: str, *args):
+    pool = await info.context.memory_bank.get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(sql, *args)
+
+async def _publish(info: Info, entity: str, row, op: str = 'upsert') -> None:
+    # Событие для подписчиков темы (entity, project_id) во всех воркерах; op='delete' — строка удалена
+    row = dict(row)
+    await broker.publish(info.context.memory_bank, entity, row['project_id'], row, op)
+
+def _found(row, what: str):
+    if row is None:
+        raise ValueError(f"{what} не найден(а)")
+    return row
+
+TEMPLATE_COLUMNS = 'id, project_id, name, repo_url, tags'
+RULE_COLUMNS = 'id, project_id, type, value, description'
+DOC_COLUMNS = 'id, project_id, type, content'
+TASK_COLUMNS = 'id, project_id, command, status, result, created_at'
+# Без vector: событие удаления эмбеддинга не должно упираться в лимит NOTIFY
+EMBEDDING_COLUMNS = 'id, project_id, model, entity_type, COALESCE(entity_id, task_id) AS entity_id'
+
+# GraphQL-поле узла -> SQL-выражение: connection-запросы читают только запрошенные колонки
+TASK_FIELDS = {'id': 'id', 'projectId': 'project_id', 'command': 'command', 'status': 'status',
+               'result': 'result', 'createdAt': 'created_at'}
+EMBEDDING_FIELDS = {'id': 'id', 'projectId': 'project_id', 'model': 'model', 'vector': 'vector::text AS vector',
+                    'entityType': 'entity_type', 'entityId': 'COALESCE(entity_id, task_id) AS entity_id',
+                    'createdAt': 'created_at'}
+HISTORY_FIELDS = {'id': 'id', 'projectId': 'project_id', 'userId': 'user_id', 'action': 'action',
+                  'details': 'details', 'createdAt': 'created_at'}
+
+async def _connection(info: Info, table: str, fields: dict, convert, project_id: int, first: Optional[int],
+                      after: Optional[str], last: Optional[int], before: Optional[str]) -> Connection:
+    columns = project_columns(selected_node_fields(info), fields)
+    pool = await info.context.memory_bank.get_pool()
+    async with pool.acquire() as conn:
+        page = await fetch_page(conn, table, columns, 'project_id = $1', [project_id], first, after, last, before)
+    edges = [Edge(cursor=encode_cursor(r['created_at'], r['id']), node=convert(r)) for r in page['rows']]
+    return Connection(
+        edges=edges, nodes=[e.node for e in edges],
+        page_info=PageInfo(has_next_page=page['has_next_page'], has_previous_page=page['has_previous_page'],
+                           start_cursor=edges[0].cursor if edges else None,
+                           end_cursor=edges[-1].cursor if edges else None),
+    )
+
 # Query, Mutation, Subscription
 @strawberry.type
 class Query:
     @strawberry.field
-    def projects(self) -> List[Project]:
-        # Получение проектов из CACD/memory_bank
-        # TODO: заменить на асинхронный вызов при необходимости
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, name, description, origin FROM projects')
-            return [Project(id=r['id'], name=r['name'], description=r['description'], origin=r['origin']) for r in rows]
+    async def projects(self, info: Info) -> List[Project]:
+        pool = await info.context.memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch('SELECT id, name, description, origin FROM projects ORDER BY id')
+        return [_project(r) for r in rows]
 
+    # Списки, которые растут без границы (tasks, embeddings, history), — keyset-страницами (first/after, last/before)
     @strawberry.field
-    def tasks(self, project_id: int) -> List[Task]:
-        # Получение задач по проекту
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, project_id, command, status, result FROM tasks WHERE project_id = $1', project_id)
-            return [Task(id=r['id'], project_id=r['project_id'], command=r['command'], status=r['status'], result=r['result']) for r in rows]
+    async def tasks(self, info: Info, project_id: int, first: Optional[int] = None, after: Optional[str] = None,
+                    last: Optional[int] = None, before: Optional[str] = None) -> Connection[Task]:
+        return await _connection(info, 'tasks', TASK_FIELDS, _task, project_id, first, after, last, before)
 
+    # Остальные поля по project_id — через DataLoader: несколько полей одного запроса (алиасы) — один SQL
     @strawberry.field
-    def docs(self, project_id: int) -> List[Doc]:
-        # TODO: реализовать получение документов
-        return []
+    async def docs(self, info: Info, project_id: int) -> List[Doc]:
+        return [_doc(r) for r in await info.context.loaders.docs.load(project_id)]
 
     @strawberry.field
-    def rules(self, project_id: int) -> List[Rule]:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, project_id, type, value, description FROM cursor_rules WHERE project_id = $1', project_id)
-            return [Rule(id=r['id'], project_id=r['project_id'], type=r['type'], value=r['value'], description=r['description']) for r in rows]
+    async def rules(self, info: Info, project_id: int) -> List[Rule]:
+        return [_rule(r) for r in await info.context.loaders.rules.load(project_id)]
 
     @strawberry.field
-    def templates(self, project_id: int) -> List[Template]:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, project_id, name, repo_url, tags FROM templates WHERE project_id = $1', project_id)
-            return [Template(id=r['id'], project_id=r['project_id'], name=r['name'], repo_url=r['repo_url'], tags=r['tags']) for r in rows]
+    async def templates(self, info: Info, project_id: int) -> List[Template]:
+        return [_template(r) for r in await info.context.loaders.templates.load(project_id)]
 
     @strawberry.field
-    def embeddings(self, project_id: int) -> List[Embedding]:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, project_id, model, vector, entity_type, entity_id FROM embeddings WHERE project_id = $1', project_id)
-            return [Embedding(id=r['id'], project_id=r['project_id'], model=r['model'], vector=r['vector'], entity_type=r['entity_type'], entity_id=r['entity_id']) for r in rows]
+    async def embeddings(self, info: Info, project_id: int, first: Optional[int] = None, after: Optional[str] = None,
+                         last: Optional[int] = None, before: Optional[str] = None) -> Connection[Embedding]:
+        return await _connection(info, 'embeddings', EMBEDDING_FIELDS, _embedding, project_id, first, after, last, before)
 
     @strawberry.field
-    def history(self, project_id: int) -> List[History]:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            rows = conn.fetch('SELECT id, project_id, user_id, action, details, created_at FROM history WHERE project_id = $1', project_id)
-            return [History(id=r['id'], project_id=r['project_id'], user_id=r['user_id'], action=r['action'], details=r['details'], created_at=r['created_at']) for r in rows]
+    async def history(self, info: Info, project_id: int, first: Optional[int] = None, after: Optional[str] = None,
+                      last: Optional[int] = None, before: Optional[str] = None) -> Connection[History]:
+        return await _connection(info, 'history', HISTORY_FIELDS, _history, project_id, first, after, last, before)
 
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    def create_task(self, input: TaskInput) -> Task:
-        # Создание задачи в базе
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('INSERT INTO tasks (id, project_id, command, status, result) VALUES ($1, $2, $3, $4, $5)',
-                         input.id, input.project_id, input.command, input.status, input.result)
-        return Task(id=input.id, project_id=input.project_id, command=input.command, status=input.status, result=input.result)
+    async def create_task(self, info: Info, input: TaskInput) -> Task:
+        row = await _fetchrow(info, f'''INSERT INTO tasks (id, project_id, command, status, result) VALUES ($1, $2, $3, $4, $5)
+                                      RETURNING {TASK_COLUMNS}''',
+                              input.id, input.project_id, input.command, input.status, input.result)
+        task = _task(row)
+        await _publish(info, 'task', row)
+        return task
 
     @strawberry.mutation
-    def update_task(self, id: str, input: TaskUpdateInput) -> Task:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('UPDATE tasks SET status=$1, result=$2 WHERE id=$3', input.status, input.result, id)
-            row = conn.fetchrow('SELECT id, project_id, command, status, result FROM tasks WHERE id=$1', id)
-        task = Task(id=row['id'], project_id=row['project_id'], command=row['command'], status=row['status'], result=row['result'])
-        # Публикуем событие для подписчиков
-        asyncio.create_task(pubsub.publish(task))
+    async def update_task(self, info: Info, id: str, input: TaskUpdateInput) -> Task:
+        row = await _fetchrow(info, f'UPDATE tasks SET status=$1, result=$2 WHERE id=$3 RETURNING {TASK_COLUMNS}',
+                              input.status, input.result, id)
+        task = _task(_found(row, f"Задача {id}"))
+        await _publish(info, 'task', row)
         return task
 
     @strawberry.mutation
-    def delete_task(self, id: str) -> bool:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('DELETE FROM tasks WHERE id=$1', id)
+    async def delete_task(self, info: Info, id: str) -> bool:
+        row = await _fetchrow(info, f'DELETE FROM tasks WHERE id=$1 RETURNING {TASK_COLUMNS}', id)
+        if row:
+            await _publish(info, 'task', row, 'delete')
         return True
 
     @strawberry.mutation
-    def create_rule(self, input: RuleInput) -> Rule:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('INSERT INTO cursor_rules (id, project_id, type, value, description) VALUES ($1, $2, $3, $4, $5)',
-                         input.id, input.project_id, input.type, input.value, input.description)
-        rule = Rule(id=input.id, project_id=input.project_id, type=input.type, value=input.value, description=input.description)
-        asyncio.create_task(rule_pubsub.publish(rule))
+    async def create_rule(self, info: Info, input: RuleInput) -> Rule:
+        row = await _fetchrow(info, f'''INSERT INTO cursor_rules (id, project_id, type, value, description) VALUES ($1, $2, $3, $4, $5)
+                                      RETURNING {RULE_COLUMNS}''',
+                              input.id, input.project_id, input.type, input.value, input.description)
+        rule = _rule(row)
+        await _publish(info, 'rule', row)
         return rule
 
     @strawberry.mutation
-    def update_rule(self, id: str, input: RuleUpdateInput) -> Rule:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('UPDATE cursor_rules SET value=$1, description=$2 WHERE id=$3', input.value, input.description, id)
-            row = conn.fetchrow('SELECT id, project_id, type, value, description FROM cursor_rules WHERE id=$1', id)
-        rule = Rule(id=row['id'], project_id=row['project_id'], type=row['type'], value=row['value'], description=row['description'])
-        asyncio.create_task(rule_pubsub.publish(rule))
+    async def update_rule(self, info: Info, id: str, input: RuleUpdateInput) -> Rule:
+        row = await _fetchrow(info, f'UPDATE cursor_rules SET value=$1, description=$2 WHERE id=$3 RETURNING {RULE_COLUMNS}',
+                              input.value, input.description, id)
+        rule = _rule(_found(row, f"Правило {id}"))
+        await _publish(info, 'rule', row)
         return rule
 
     @strawberry.mutation
-    def delete_rule(self, id: str) -> bool:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('SELECT id, project_id, type, value, description FROM cursor_rules WHERE id=$1', id)
-            if row:
-                rule = Rule(id=row['id'], project_id=row['project_id'], type=row['type'], value=row['value'], description=row['description'])
-                asyncio.create_task(rule_pubsub.publish(rule))
-            conn.execute('DELETE FROM cursor_rules WHERE id=$1', id)
+    async def delete_rule(self, info: Info, id: str) -> bool:
+        row = await _fetchrow(info, f'DELETE FROM cursor_rules WHERE id=$1 RETURNING {RULE_COLUMNS}', id)
+        if row:
+            await _publish(info, 'rule', row, 'delete')
         return True
 
     @strawberry.mutation
-    def create_template(self, input: TemplateInput) -> Template:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('INSERT INTO templates (project_id, name, repo_url, tags) VALUES ($1, $2, $3, $4) RETURNING id',
-                               input.project_id, input.name, input.repo_url, input.tags)
-        template = Template(id=row['id'], project_id=input.project_id, name=input.name, repo_url=input.repo_url, tags=input.tags)
-        asyncio.create_task(template_pubsub.publish(template))
+    async def create_template(self, info: Info, input: TemplateInput) -> Template:
+        row = await _fetchrow(info, f'''INSERT INTO templates (project_id, name, repo_url, tags) VALUES ($1, $2, $3, $4)
+                                      RETURNING {TEMPLATE_COLUMNS}''',
+                              input.project_id, input.name, input.repo_url, _tags_array(input.tags))
+        template = _template(row)
+        await _publish(info, 'template', row)
         return template
 
     @strawberry.mutation
-    def update_template(self, id: int, input: TemplateUpdateInput) -> Template:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('UPDATE templates SET name=$1, repo_url=$2, tags=$3 WHERE id=$4', input.name, input.repo_url, input.tags, id)
-            row = conn.fetchrow('SELECT id, project_id, name, repo_url, tags FROM templates WHERE id=$1', id)
-        template = Template(id=row['id'], project_id=row['project_id'], name=row['name'], repo_url=row['repo_url'], tags=row['tags'])
-        asyncio.create_task(template_pubsub.publish(template))
+    async def update_template(self, info: Info, id: int, input: TemplateUpdateInput) -> Template:
+        row = await _fetchrow(info, f'UPDATE templates SET name=$1, repo_url=$2, tags=$3 WHERE id=$4 RETURNING {TEMPLATE_COLUMNS}',
+                              input.name, input.repo_url, _tags_array(input.tags), id)
+        template = _template(_found(row, f"Шаблон {id}"))
+        await _publish(info, 'template', row)
         return template
 
     @strawberry.mutation
-    def delete_template(self, id: int) -> bool:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('SELECT id, project_id, name, repo_url, tags FROM templates WHERE id=$1', id)
-            if row:
-                template = Template(id=row['id'], project_id=row['project_id'], name=row['name'], repo_url=row['repo_url'], tags=row['tags'])
-                asyncio.create_task(template_pubsub.publish(template))
-            conn.execute('DELETE FROM templates WHERE id=$1', id)
+    async def delete_template(self, info: Info, id: int) -> bool:
+        row = await _fetchrow(info, f'DELETE FROM templates WHERE id=$1 RETURNING {TEMPLATE_COLUMNS}', id)
+        if row:
+            await _publish(info, 'template', row, 'delete')
         return True
 
     @strawberry.mutation
-    def create_embedding(self, input: EmbeddingInput) -> Embedding:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('INSERT INTO embeddings (project_id, model, vector, entity_type, entity_id) VALUES ($1, $2, $3, $4, $5) RETURNING id',
-                               input.project_id, input.model, input.vector, input.entity_type, input.entity_id)
+    async def create_embedding(self, info: Info, input: EmbeddingInput) -> Embedding:
+        # Те же правила, что у POST /embeddings/add: таблица модели из реестра, её размерность и известный entity_type
+        if input.entity_type not in EMBEDDING_ENTITY_TYPES:
+            raise ValueError(f"Неизвестный entity_type: {input.entity_type} (доступны {', '.join(EMBEDDING_ENTITY_TYPES)})")
+        pool = await info.context.memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            store = await resolve_model(conn, input.model)
+            check_dimension(store, input.model, len(input.vector))
+            row = await conn.fetchrow(f'''INSERT INTO {store['table_name']} (project_id, task_id, model, vector, entity_type, entity_id)
+                                         VALUES ($1, $5, $2, $3::text::{store['storage']}, $4, $5) RETURNING id''',
+                                      input.project_id, input.model, vector_literal(input.vector), input.entity_type, input.entity_id)
         return Embedding(id=row['id'], project_id=input.project_id, model=input.model, vector=input.vector, entity_type=input.entity_type, entity_id=input.entity_id)
 
     @strawberry.mutation
-    def delete_embedding(self, id: int) -> bool:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('DELETE FROM embeddings WHERE id=$1', id)
+    async def delete_embedding(self, info: Info, id: int, model: Optional[str] = None) -> bool:
+        # id уникален в пределах таблицы модели — model указывает, из какой удалять
+        pool = await info.context.memory_bank.get_pool()
+        async with pool.acquire() as conn:
+            store = await resolve_model(conn, model)
+            row = await conn.fetchrow(f"DELETE FROM {store['table_name']} WHERE id=$1 RETURNING {EMBEDDING_COLUMNS}", id)
+        if row:
+            await _publish(info, 'embedding', row, 'delete')
         return True
 
     @strawberry.mutation
-    def update_doc(self, id: int, input: DocUpdateInput) -> Doc:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            conn.execute('UPDATE docs SET content=$1 WHERE id=$2', input.content, id)
-            row = conn.fetchrow('SELECT id, project_id, type, content FROM docs WHERE id=$1', id)
-        doc = Doc(id=row['id'], project_id=row['project_id'], type=row['type'], content=row['content'])
-        asyncio.create_task(doc_pubsub.publish(doc))
+    async def update_doc(self, info: Info, id: int, input: DocUpdateInput) -> Doc:
+        row = await _fetchrow(info, f'UPDATE docs SET content=$1 WHERE id=$2 RETURNING {DOC_COLUMNS}', input.content, id)
+        doc = _doc(_found(row, f"Документ {id}"))
+        await _publish(info, 'doc', row)
         return doc
 
     @strawberry.mutation
-    def create_doc(self, input: DocInput) -> Doc:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('INSERT INTO docs (project_id, type, content) VALUES ($1, $2, $3) RETURNING id',
-                               input.project_id, input.type, input.content)
-        doc = Doc(id=row['id'], project_id=input.project_id, type=input.type, content=input.content)
-        asyncio.create_task(doc_pubsub.publish(doc))
+    async def create_doc(self, info: Info, input: DocInput) -> Doc:
+        row = await _fetchrow(info, f'INSERT INTO docs (project_id, type, content) VALUES ($1, $2, $3) RETURNING {DOC_COLUMNS}',
+                              input.project_id, input.type, input.content)
+        doc = _doc(row)
+        await _publish(info, 'doc', row)
         return doc
 
     @strawberry.mutation
-    def delete_doc(self, id: int) -> bool:
-        pool = cacd.memory._get_pool_sync()
-        with pool.acquire() as conn:
-            row = conn.fetchrow('SELECT id, project_id, type, content FROM docs WHERE id=$1', id)
-            if row:
-                doc = Doc(id=row['id'], project_id=row['project_id'], type=row['type'], content=row['content'])
-                asyncio.create_task(doc_pubsub.publish(doc))
-            conn.execute('DELETE FROM docs WHERE id=$1', id)
+    async def delete_doc(self, info: Info, id: int) -> bool:
+        row = await _fetchrow(info, f'DELETE FROM docs WHERE id=$1 RETURNING {DOC_COLUMNS}', id)
+        if row:
+            await _publish(info, 'doc', row, 'delete')
         return True
 
+# Подписчик получает события только своего проекта; медленный клиент не тормозит публикацию.
+# on_*_update — создание и изменение, on_*_delete — id удалённых строк
 @strawberry.type
 class Subscription:
     @strawberry.subscription
-    async def on_task_update(self, project_id: int) -> Task:
-        async for task in pubsub.subscribe():
-            if task.project_id == project_id:
-                yield task
+    async def on_task_update(self, info: Info, project_id: int) -> Task:
+        async for event in broker.subscribe(info.context.memory_bank, 'task', project_id, ops=('upsert',)):
+            yield _task(event['row'])
 
     @strawberry.subscription
-    async def on_doc_update(self, project_id: int) -> Doc:
-        async for doc in doc_pubsub.subscribe():
-            if doc.project_id == project_id:
-                yield doc
+    async def on_task_delete(self, info: Info, project_id: int) -> str:
+        async for event in broker.subscribe(info.context.memory_bank, 'task', project_id, ops=('delete',)):
+            yield event['row']['id']
 
     @strawberry.subscription
-    async def on_rule_update(self, project_id: int) -> Rule:
-        async for rule in rule_pubsub.subscribe():
-            if rule.project_id == project_id:
-                yield rule
+    async def on_doc_update(self, info: Info, project_id: int) -> Doc:
+        async for event in broker.subscribe(info.context.memory_bank, 'doc', project_id, ops=('upsert',)):
+            yield _doc(event['row'])
 
     @strawberry.subscription
-    async def on_template_update(self, project_id: int) -> Template:
-        async for template in template_pubsub.subscribe():
-            if template.project_id == project_id:
-                yield template
+    async def on_doc_delete(self, info: Info, project_id: int) -> int:
+        async for event in broker.subscribe(info.context.memory_bank, 'doc', project_id, ops=('delete',)):
+            yield event['row']['id']
 
-schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription) 
\ No newline at end of file
+    @strawberry.subscription
+    async def on_rule_update(self, info: Info, project_id: int) -> Rule:
+        async for event in broker.subscribe(info.context.memory_bank, 'rule', project_id, ops=('upsert',)):
+            yield _rule(event['row'])
+
+    @strawberry.subscription
+    async def on_rule_delete(self, info: Info, project_id: int) -> str:
+        async for event in broker.subscribe(info.context.memory_bank, 'rule', project_id, ops=('delete',)):
+            yield event['row']['id']
+
+    @strawberry.subscription
+    async def on_template_update(self, info: Info, project_id: int) -> Template:
+        async for event in broker.subscribe(info.context.memory_bank, 'template', project_id, ops=('upsert',)):
+            yield _template(event['row'])
+
+    @strawberry.subscription
+    async def on_template_delete(self, info: Info, project_id: int) -> int:
+        async for event in broker.subscribe(info.context.memory_bank, 'template', project_id, ops=('delete',)):
+            yield event['row']['id']
+
+broker.register('task', f'SELECT {TASK_COLUMNS} FROM tasks WHERE id = $1')
+broker.register('doc', f'SELECT {DOC_COLUMNS} FROM docs WHERE id = $1')
+broker.register('rule', f'SELECT {RULE_COLUMNS} FROM cursor_rules WHERE id = $1')
+broker.register('template', f'SELECT {TEMPLATE_COLUMNS} FROM templates WHERE id = $1')
+
+# Латентность снаружи: в неё входят разбор, валидация и оценка стоимости
+schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription,
+                           extensions=[OperationLatency, PersistedQueryCache, QueryCostLimiter])
@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger("mcp.notifications")
+
+# Общая очередь уведомлений от обработчиков к диспетчеру
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+# Буфер одного WebSocket-клиента; переполнение — клиент не успевает читать и отключается
+NOTIFY_CLIENT_BUFFER = int(os.getenv("NOTIFY_CLIENT_BUFFER", "100"))
+# Таймаут отправки одного сообщения клиенту (и одного системного уведомления)
+NOTIFY_SEND_TIMEOUT = float(os.getenv("NOTIFY_SEND_TIMEOUT", "5"))
+# Системные уведомления macOS через pync (на Linux/в контейнере — выключить)
+NOTIFY_DESKTOP_ENABLED = os.getenv("NOTIFY_DESKTOP_ENABLED", "1") == "1"
+
+# WebSocket-код закрытия для медленного клиента: "попробуйте позже"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def _desktop_notify(title: str, message: str):
+    # pync — только macOS; импорт в потоке, чтобы сервер поднимался и без него
+    import pync
+    pync.notify(message, title=title)
+
+
+class NotificationClient:
+    """WebSocket-подписчик: свой ограниченный буфер и своя задача отправки."""
+    def __init__(self, websocket, buffer_size: int = NOTIFY_CLIENT_BUFFER):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+
+
+class NotificationDispatcher:
+    """
+    Уведомления вне пути запроса: обработчик только кладёт сообщение в очередь (publish не ждёт),
+    фоновый диспетчер раскладывает его по буферам клиентов, у каждого клиента — своя задача отправки
+    с таймаутом, так что медленный сокет не задерживает ни ответ, ни остальных клиентов.
+    Переполненный буфер или таймаут отправки — клиент отключается. pync выполняется в отдельном потоке.
+    """
+    def __init__(self, queue_size: int = NOTIFY_QUEUE_SIZE, buffer_size: int = NOTIFY_CLIENT_BUFFER,
+                 send_timeout: float = NOTIFY_SEND_TIMEOUT, desktop: bool = NOTIFY_DESKTOP_ENABLED):
+        self.queue_size = queue_size
+        self.buffer_size = buffer_size
+        self.send_timeout = send_timeout
+        self.desktop = desktop
+        self.clients: Set[NotificationClient] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._desktop_queue: Optional[asyncio.Queue] = None
+        self._desktop_task: Optional[asyncio.Task] = None
+        self._desktop_executor: Optional[ThreadPoolExecutor] = None
+        self._loop = None
+        self._closing: Set[asyncio.Task] = set()
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self.desktop_failed = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        # Первый вызов или другой event loop (TestClient без lifespan) — очереди и задачи заново
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = loop.create_task(self._dispatch())
+        if self.desktop:
+            self._desktop_queue = asyncio.Queue(maxsize=self.buffer_size)
+            self._desktop_task = loop.create_task(self._desktop_worker())
+
+    def publish(self, message: str, title: str = "MCP") -> bool:
+        """Ставит уведомление в очередь и сразу возвращается; False — очередь полна, сообщение отброшено."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((title, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Очередь уведомлений переполнена ({self.queue_size}), сообщение отброшено")
+            return False
+        self.published += 1
+        return True
+
+    def register(self, websocket) -> NotificationClient:
+        self._ensure_started()
+        client = NotificationClient(websocket, self.buffer_size)
+        client.writer = asyncio.get_running_loop().create_task(self._write(client))
+        self.clients.add(client)
+        return client
+
+    def unregister(self, client: NotificationClient):
+        if client in self.clients:
+            self.clients.discard(client)
+            if client.writer is not None and client.writer is not asyncio.current_task():
+                client.writer.cancel()
+
+    async def _dispatch(self):
+        while True:
+            title, message = await self._queue.get()
+            for client in list(self.clients):
+                try:
+                    client.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    logger.warning(f"WebSocket-клиент не успевает читать уведомления (буфер {self.buffer_size}) — отключаем")
+                    self._disconnect(client)
+            if self._desktop_queue is not None:
+                with contextlib.suppress(asyncio.QueueFull):
+                    self._desktop_queue.put_nowait((title, message))
+
+    async def _write(self, client: NotificationClient):
+        while True:
+            message = await client.queue.get()
+            try:
+                await asyncio.wait_for(client.websocket.send_text(message), self.send_timeout)
+                client.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info(f"Отправка уведомления не удалась ({type(e).__name__}) — клиент отключён")
+                self._disconnect(client)
+                return
+
+    def _disconnect(self, client: NotificationClient):
+        # Закрытие сокета — отдельной задачей: диспетчер не ждёт медленного клиента
+        if client not in self.clients:
+            return
+        self.unregister(client)
+        self.disconnected += 1
+        task = asyncio.get_running_loop().create_task(self._close(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, client: NotificationClient):
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(client.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), self.send_timeout)
+
+    async def _desktop_worker(self):
+        # Один поток: pync запускает внешний процесс, параллельные вызовы ничего не ускоряют
+        if self._desktop_executor is None:
+            self._desktop_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notify-desktop")
+        loop = asyncio.get_running_loop()
+        while True:
+            title, message = await self._desktop_queue.get()
+            try:
+                await asyncio.wait_for(loop.run_in_executor(self._desktop_executor, _desktop_notify, title, message),
+                                       self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except ImportError:
+                logger.warning("pync не установлен — системные уведомления отключены")
+                self._desktop_queue = None
+                return
+            except Exception as e:
+                self.desktop_failed += 1
+                logger.warning(f"Push notification error: {e}")
+
+    async def close(self):
+        tasks = [t for t in (self._task, self._desktop_task) if t is not None]
+        tasks += [c.writer for c in self.clients if c.writer is not None] + list(self._closing)
+        self.clients.clear()
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+        self._task = self._desktop_task = None
+        if self._desktop_executor is not None:
+            self._desktop_executor.shutdown(wait=False)
+            self._desktop_executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'clients': len(self.clients), 'queued': self._queue.qsize() if self._queue is not None else 0,
+            'buffered': sum(c.queue.qsize() for c in self.clients),
+            'published': self.published, 'dropped': self.dropped, 'disconnected': self.disconnected,
+            'desktop_failed': self.desktop_failed,
+        }
+
+
+notifier = NotificationDispatcher()
@@ -1,5 +1,6 @@
 import pytest
 import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
 from jose import jwt
 from datetime import datetime, timedelta
 import os
@@ -28,4 +29,65 @@ def valid_jwt_token():
 async def memory_bank():
     mb = MemoryBank()
     yield mb
-    await mb.close() 
\ No newline at end of file
+    await mb.close() 
+
+
+class FakeCursor:
+    """Серверный курсор asyncpg (conn.cursor(...)): async for по заданным строкам."""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __aiter__(self):
+        self._it = iter(self.rows)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def async_context(value=None):
+    """Асинхронный контекстный менеджер-заглушка: async with ... as value."""
+    ctx = MagicMock()
+    ctx.__aenter__ = AsyncMock(return_value=value)
+    ctx.__aexit__ = AsyncMock(return_value=False)
+    return ctx
+
+
+@pytest.fixture
+def fake_cursor():
+    """Фабрика курсоров: conn.cursor = lambda *args, **kwargs: fake_cursor(rows)."""
+    return FakeCursor
+
+
+@pytest.fixture
+def fake_conn():
+    """Соединение asyncpg: execute/fetch*/copy_records_to_table — AsyncMock, transaction() — async with."""
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    conn.executemany = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[])
+    conn.fetchrow = AsyncMock(return_value=None)
+    conn.fetchval = AsyncMock(return_value=None)
+    conn.copy_records_to_table = AsyncMock()
+    conn.transaction.return_value = async_context()
+    return conn
+
+
+@pytest.fixture
+def fake_pool(fake_conn):
+    """Пул, у которого pool.acquire() отдаёт fake_conn."""
+    pool = MagicMock()
+    pool.acquire.return_value = async_context(fake_conn)
+    pool.close = AsyncMock()
+    return pool
+
+
+@pytest.fixture
+def fake_memory_bank(fake_pool):
+    """MemoryBank без БД: get_pool() возвращает fake_pool."""
+    memory_bank = MagicMock()
+    memory_bank.get_pool = AsyncMock(return_value=fake_pool)
+    return memory_bank
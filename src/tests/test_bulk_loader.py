@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory.bulk_loader import bulk_load
+
+
+@pytest.mark.asyncio
+async def test_bulk_load_uses_copy_in_batches_and_reports_progress():
+    conn = MagicMock()
+    conn.copy_records_to_table = AsyncMock()
+    conn.executemany = AsyncMock()
+    progress = []
+    tasks = ({'id': f't{i}', 'command': 'c', 'rules': [{'type': 'priority'}], 'status': 'pending'} for i in range(5))
+    counts = await bulk_load(conn, 42, {
+        'tasks': tasks,
+        'history': [{'action': 'export', 'details': '{"a": 1}'}],
+        'embeddings': [{'task_id': 't0', 'vector': [0.5, 1.0], 'description': 'd'}],
+    }, user_id='u', on_progress=lambda entity, loaded: progress.append((entity, loaded)), batch_size=2)
+
+    assert counts == {'tasks': 5, 'history': 1, 'embeddings': 1}
+    assert progress == [('tasks', 2), ('tasks', 4), ('tasks', 5), ('history', 1), ('embeddings', 1)]
+    task_calls = [c for c in conn.copy_records_to_table.await_args_list if c.args[0] == 'tasks']
+    assert [len(c.kwargs['records']) for c in task_calls] == [2, 2, 1]
+    first = task_calls[0].kwargs['records'][0]
+    assert first[:3] == ('t0', 42, 'c')
+    assert json.loads(first[4]) == [{'type': 'priority'}]
+    history_record = conn.copy_records_to_table.await_args_list[-1].kwargs['records'][0]
+    # jsonb из экспорта уже строка — повторно не кодируется
+    assert history_record == (42, 'u', 'export', '{"a": 1}')
+    sql, records = conn.executemany.await_args.args
+    assert '$3::text::vector' in sql
+    assert records == [(42, 't0', '[0.5,1.0]', 'd', None, 't0', None)]
@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import struct
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from src.mcp.memory import clustering
+
+
+def two_blobs(n=60, dim=8):
+    rng = np.random.default_rng(1)
+    X = np.concatenate([rng.normal(-5, 0.1, (n // 2, dim)), rng.normal(5, 0.1, (n // 2, dim))]).astype(np.float32)
+    # Векторы в двоичном формате vector_send: размерность, резерв, float4 big-endian
+    return [{'id': i + 1, 'vector': struct.pack(f'>hh{dim}f', dim, 0, *v)} for i, v in enumerate(X)]
+
+
+def test_assign_labels_picks_nearest_center():
+    centers = np.array([[0, 0], [10, 10]], dtype=np.float32)
+    labels, dist = clustering.assign_labels(centers, np.array([[1, 0], [9, 10]], dtype=np.float32))
+    assert labels.tolist() == [0, 1]
+    assert np.allclose(dist, [1, 1])
+
+
+def keyset_fetch(rows):
+    # Эмулирует WHERE id > $2 ORDER BY id LIMIT $3
+    async def fetch(sql, project_id, last_id, limit):
+        return [r for r in rows if r['id'] > last_id][:limit]
+    return fetch
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mode', ['minibatch', 'stream'])
+async def test_run_job_persists_centroids_and_labels(monkeypatch, mode, fake_memory_bank, fake_pool, fake_conn):
+    acquired = fake_pool.acquire.return_value
+
+    async def inline(fn, *args):
+        # Обучение и разметка идут без взятого соединения
+        assert acquired.__aenter__.await_count == acquired.__aexit__.await_count
+        return fn(*args)
+    monkeypatch.setattr(clustering, '_in_pool', inline)
+    fake_conn.fetch.side_effect = keyset_fetch(two_blobs())
+    memory_bank, conn = fake_memory_bank, fake_conn
+    job = {'id': 'job1', 'project_id': 1, 'n_clusters': 2, 'mode': mode, 'entity_type': None}
+    await clustering.run_job(memory_bank, job, batch_size=16)
+
+    centroids = conn.executemany.call_args.args[1]
+    assert sorted(c[3] for c in centroids) == [30, 30]
+    # Метки пишутся по пачке: 60 строк пачками по 16
+    copies = conn.copy_records_to_table.call_args_list
+    assert len(copies) == 4
+    labels = [record for call in copies for record in call.kwargs['records']]
+    assert len(labels) == 60
+    first, second = {l for _, i, l in labels if i <= 30}, {l for _, i, l in labels if i > 30}
+    assert len(first) == 1 and len(second) == 1 and first != second
+    assert "status = 'done'" in conn.execute.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_run_job_marks_failure_when_too_few_rows(monkeypatch, fake_memory_bank, fake_conn):
+    async def inline(fn, *args):
+        return fn(*args)
+    monkeypatch.setattr(clustering, '_in_pool', inline)
+    fake_conn.fetch.side_effect = keyset_fetch(two_blobs(n=2))
+    memory_bank, conn = fake_memory_bank, fake_conn
+    await clustering.run_job(memory_bank, {'id': 'j', 'project_id': 1, 'n_clusters': 5, 'mode': 'minibatch', 'entity_type': None})
+    assert conn.execute.call_args_list[-2].args == ('DELETE FROM embedding_cluster_labels WHERE job_id = $1', 'j')
+    sql, *args = conn.execute.call_args.args
+    assert 'status = $2' in sql and args[1] == 'failed'
+    conn.copy_records_to_table.assert_not_called()
+
+
+def test_shutdown_executor_resets_pool(monkeypatch):
+    executor = MagicMock()
+    monkeypatch.setattr(clustering, '_executor', executor)
+    clustering.shutdown_executor()
+    executor.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+    assert clustering._executor is None
+    clustering.shutdown_executor()
+
+
+def test_source_query_filters_by_entity_type_column():
+    assert "entity_type = 'doc'" in clustering._source_query('doc')
+    assert 'LIKE' not in clustering._source_query('doc')
+    with pytest.raises(ValueError):
+        clustering._source_query('unknown')
@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.mcp.memory.context_cache import ContextCache, MISSING
+
+
+def test_lru_ttl_and_project_filter(monkeypatch):
+    cache = ContextCache(max_size=2, ttl=10)
+    now = [100.0]
+    monkeypatch.setattr('src.mcp.memory.context_cache.time.monotonic', lambda: now[0])
+    cache.put('t1', 'a', 1)
+    cache.put('t2', 'b', 1)
+    assert cache.get('t1') == 'a'
+    cache.put('t3', 'c', 2)  # вытесняет t2 (давно не читался)
+    assert cache.get('t2') is MISSING
+    assert cache.get('t3', project_id=1) is None
+    now[0] += 10
+    assert cache.get('t1') is MISSING
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 2 and cache.stats()['evictions'] == 1
+
+
+def test_read_started_before_write_does_not_overwrite_cache():
+    cache = ContextCache(max_size=10, ttl=60)
+    token = cache.begin('t1')
+    cache.put('t1', 'new', 1)
+    cache.end('t1', token, ('old', 1))
+    assert cache.get('t1') == 'new'
+
+    token = cache.begin('t2')
+    cache.invalidate('t2')
+    cache.end('t2', token, ('stale', 1))
+    assert cache.get('t2') is MISSING
+    assert not cache._reading
+
+    token = cache.begin('t3')
+    cache.clear()
+    cache.end('t3', token, ('stale', 1))
+    assert cache.get('t3') is MISSING
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ContextCache(max_size=0)
+    cache.put('t1', 'a', 1)
+    assert cache.get('t1') is MISSING and not cache.enabled
@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import datetime
+import pytest
+from src.mcp.memory.diff_engine import row_hash, diff_rows, diff_sorted, diff_sorted_async, collect_diff, collect_diff_async
+
+
+CURRENT = [
+    {'id': 1, 'project_id': 5, 'content': 'a', 'created_at': datetime.datetime(2025, 1, 1)},
+    {'id': 2, 'project_id': 5, 'content': 'b', 'created_at': datetime.datetime(2025, 1, 1)},
+    {'id': 4, 'project_id': 5, 'content': 'only current', 'created_at': None},
+]
+# Строки архива: другой project_id, даты строкой (как после экспорта в NDJSON)
+INCOMING = [
+    {'id': 1, 'project_id': 9, 'content': 'a', 'created_at': '2025-01-01 00:00:00'},
+    {'id': 2, 'project_id': 9, 'content': 'changed', 'created_at': '2025-01-01 00:00:00'},
+    {'id': 3, 'project_id': 9, 'content': 'new', 'created_at': None},
+]
+
+
+def test_row_hash_is_stable_and_ignores_project_id():
+    assert row_hash({'a': 1, 'b': 2, 'project_id': 1}) == row_hash({'b': 2, 'a': 1, 'project_id': 2})
+    assert row_hash({'a': 1}) != row_hash({'a': 2})
+
+
+def test_row_hash_ignores_generated_search_tsv():
+    # Архив старого формата (SELECT *) несёт search_tsv, строка БД после явного списка колонок — нет
+    assert row_hash({'id': 't1', 'command': 'run', 'search_tsv': "'run':1"}) == row_hash({'id': 't1', 'command': 'run'})
+
+
+def test_diff_rows_classifies_in_one_pass():
+    diff = diff_rows(CURRENT, INCOMING)
+    assert [r['id'] for r in diff['added']] == [3]
+    assert [r['id'] for r in diff['updated']] == [2]
+    assert diff['conflicted'] == [{'id': '2', 'current': CURRENT[1], 'incoming': INCOMING[1]}]
+    assert diff['skipped'] == [CURRENT[0]]
+
+
+def test_diff_sorted_matches_diff_rows():
+    assert collect_diff(diff_sorted(iter(CURRENT), iter(INCOMING))) == diff_rows(CURRENT, INCOMING)
+
+
+def test_diff_sorted_rejects_unsorted_input():
+    with pytest.raises(ValueError):
+        list(diff_sorted(CURRENT, list(reversed(INCOMING))))
+
+
+def test_diff_sorted_text_keys_in_bytewise_order():
+    # ORDER BY id COLLATE "C": заглавные раньше строчных, '_' между ними — как сравнение str в Python
+    keys = ['Task-2', 'task-1', 'task_1', 'задача']
+    current = [{'id': k, 'v': 1} for k in keys]
+    incoming = [{'id': k, 'v': 1 if k != 'task_1' else 2} for k in keys] + [{'id': 'я', 'v': 1}]
+    diff = collect_diff(diff_sorted(current, incoming))
+    assert [r['id'] for r in diff['skipped']] == ['Task-2', 'task-1', 'задача']
+    assert [r['id'] for r in diff['updated']] == ['task_1']
+    assert [r['id'] for r in diff['added']] == ['я']
+    with pytest.raises(ValueError):
+        list(diff_sorted(list(reversed(current)), incoming))
+
+
+@pytest.mark.asyncio
+async def test_diff_sorted_async_streams_current_side(fake_cursor):
+    diff = await collect_diff_async(diff_sorted_async(fake_cursor(CURRENT), iter(INCOMING)), keep_skipped=False)
+    expected = diff_rows(CURRENT, INCOMING)
+    assert diff['added'] == expected['added'] and diff['conflicted'] == expected['conflicted']
+    assert diff['skipped'] == []
@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import json
+import struct
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory.embedding_batch import (
+    iter_ndjson_batches, iter_packed_batches, pack_vectors, ingest_batches, _encode_vector, _decode_vector, VECTOR_CODECS,
+    DimensionError
+)
+
+
+async def chunked(data: bytes, size: int = 1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(batches):
+    return [b async for b in batches]
+
+
+@pytest.mark.asyncio
+async def test_packed_batches_roundtrip():
+    matrix = np.arange(5 * 384, dtype=np.float32).reshape(5, 384)
+    body = pack_vectors(matrix, [f'e{i}' for i in range(5)], [f'd{i}' for i in range(5)])
+    batches = await collect(iter_packed_batches(chunked(body), batch_size=2))
+    assert [len(b[0]) for b in batches] == [2, 2, 1]
+    assert np.array_equal(np.concatenate([b[2] for b in batches]), matrix)
+    assert batches[2][0] == ['e4'] and batches[2][1] == ['d4']
+
+
+@pytest.mark.asyncio
+async def test_packed_batches_reject_bad_payloads():
+    matrix = np.zeros((2, 384), dtype=np.float32)
+    with pytest.raises(ValueError):
+        await collect(iter_packed_batches(chunked(pack_vectors(matrix, ['a', 'b'])[:-4])))
+    with pytest.raises(DimensionError) as e:
+        await collect(iter_packed_batches(chunked(pack_vectors(np.zeros((2, 10)), ['a', 'b']))))
+    assert e.value.dimension == 10
+    matrix[1, 3] = np.nan
+    with pytest.raises(ValueError, match='#1'):
+        await collect(iter_packed_batches(chunked(pack_vectors(matrix, ['a', 'b']))))
+
+
+@pytest.mark.asyncio
+async def test_ndjson_batches():
+    lines = [json.dumps({'entity_id': i, 'vector': [float(i)] * 384}) for i in range(3)]
+    batches = await collect(iter_ndjson_batches(chunked('\n'.join(lines).encode(), 500), batch_size=2))
+    assert [b[0] for b in batches] == [['0', '1'], ['2']]
+    assert batches[1][2].shape == (1, 384)
+    bad = json.dumps({'entity_id': 'x', 'vector': [1.0] * 10}).encode()
+    with pytest.raises(DimensionError):
+        await collect(iter_ndjson_batches(chunked(bad)))
+
+
+def test_vector_binary_codec():
+    data = _encode_vector(np.array([1.5, -2.0], dtype=np.float32))
+    assert data[:4] == struct.pack('>HH', 2, 0)
+    assert _decode_vector(data) == '[1.5,-2.0]'
+
+
+@pytest.mark.asyncio
+async def test_ingest_batches_copies_and_resets_codec():
+    conn = MagicMock()
+    conn.set_type_codec = AsyncMock()
+    conn.reset_type_codec = AsyncMock()
+    conn.copy_records_to_table = AsyncMock()
+    matrix = np.ones((3, 384), dtype=np.float32)
+    body = pack_vectors(matrix, ['a', 'b', 'c'], entity_types=['doc', None, None])
+    assert await ingest_batches(conn, 9, iter_packed_batches(chunked(body), batch_size=2), entity_type='task', model='m') == 3
+    assert conn.copy_records_to_table.await_count == 2
+    records = conn.copy_records_to_table.call_args_list[0].kwargs['records']
+    assert records[0][:2] == (9, 'a') and records[0][3] is None
+    assert records[0][4:] == ('doc', 'a', 'm') and records[1][4] == 'task'
+    conn.reset_type_codec.assert_awaited_once_with('vector', schema='public')
+
+
+def test_halfvec_codec_roundtrip():
+    encoder, decoder = VECTOR_CODECS['halfvec']
+    data = encoder([0.5, -1.25, 2.0])
+    assert len(data) == 4 + 3 * 2
+    assert decoder(data) == '[0.5,-1.25,2.0]'
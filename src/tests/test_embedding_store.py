@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory import embedding_store
+from src.mcp.memory.embedding_store import model_table, register_model, resolve_model, check_dimension, ModelNotRegisteredError, DEFAULT_MODEL
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    embedding_store._models.clear()
+    yield
+    embedding_store._models.clear()
+
+
+def make_conn(existing=None):
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    conn.fetchrow = AsyncMock(side_effect=lambda sql, *args: existing if 'SELECT' in sql else {
+        'name': args[0], 'dimension': args[1], 'storage': args[2], 'table_name': args[3],
+        'index_method': args[4], 'metric': args[5], 'created_at': None,
+    })
+    tx = MagicMock()
+    tx.__aenter__ = AsyncMock(return_value=tx)
+    tx.__aexit__ = AsyncMock(return_value=False)
+    conn.transaction = MagicMock(return_value=tx)
+    return conn
+
+
+def test_model_table_is_stable_and_distinct():
+    assert model_table('text-embedding-3-large') == model_table('text-embedding-3-large')
+    assert model_table('text-embedding-3-large').startswith('embeddings_text_embedding_3_large_')
+    assert model_table('a.b') != model_table('a-b')
+
+
+@pytest.mark.asyncio
+async def test_register_model_creates_halfvec_table_and_index():
+    conn = make_conn()
+    model = await register_model(conn, 'large', 3072, storage='halfvec', metric='cosine')
+    ddl = [c.args[0] for c in conn.execute.await_args_list]
+    assert 'vector halfvec(3072)' in ddl[0]
+    assert 'created_at TIMESTAMP NOT NULL DEFAULT now()' in ddl[0]
+    assert any('(project_id, created_at, id)' in sql for sql in ddl)
+    assert any('USING hnsw (vector halfvec_cosine_ops)' in sql for sql in ddl)
+    assert model['table_name'] == model_table('large') and model['storage'] == 'halfvec'
+
+
+@pytest.mark.asyncio
+async def test_register_model_rejects_conflicts_and_oversized_vectors():
+    conn = make_conn(existing={'name': 'm', 'dimension': 768, 'storage': 'vector', 'table_name': 't'})
+    assert (await register_model(conn, 'm', 768))['table_name'] == 't'
+    with pytest.raises(ValueError):
+        await register_model(conn, 'm', 1024)
+    with pytest.raises(ValueError):
+        await register_model(make_conn(), 'big', 3072, storage='vector')
+
+
+@pytest.mark.asyncio
+async def test_resolve_model_falls_back_to_default_table():
+    conn = make_conn()
+    assert await resolve_model(conn, None) is DEFAULT_MODEL
+    assert await resolve_model(conn, 'unknown') is DEFAULT_MODEL
+
+
+def test_check_dimension_distinguishes_unregistered_models():
+    registered = {'name': 'large', 'dimension': 768, 'storage': 'vector', 'table_name': 't'}
+    # Незарегистрированное имя с размерностью общей таблицы пишется в неё, как до реестра
+    check_dimension(DEFAULT_MODEL, 'legacy-384', 384)
+    check_dimension(registered, 'large', 768)
+    with pytest.raises(ModelNotRegisteredError):
+        check_dimension(DEFAULT_MODEL, 'legacy-768', 768)
+    with pytest.raises(ValueError) as e:
+        check_dimension(registered, 'large', 384)
+    assert not isinstance(e.value, ModelNotRegisteredError)
+    with pytest.raises(ValueError) as e:
+        check_dimension(DEFAULT_MODEL, None, 768)
+    assert not isinstance(e.value, ModelNotRegisteredError)
@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from graphql import parse
+from src.server.schemas import graphql_extensions
+from src.server.schemas.graphql_extensions import CostBudget, OperationMetrics, query_cost, query_hash
+from src.server.schemas.graphql_loaders import GraphQLContext
+from src.server.schemas.graphql_schema import schema
+
+
+@pytest.fixture
+def context(fake_memory_bank, fake_conn):
+    def make(rows=()):
+        fake_conn.fetch.return_value = list(rows)
+        return GraphQLContext(fake_memory_bank)
+    return make
+
+
+PROJECTS = [{'id': 1, 'name': 'p', 'description': '', 'origin': 'local'}]
+
+
+@pytest.mark.asyncio
+async def test_automatic_persisted_query_roundtrip(context):
+    query = 'query ApqProjects { projects { id name } }'
+    persisted = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(query)}}
+
+    miss = await schema.execute(None, context_value=context(), operation_extensions=persisted)
+    assert miss.errors[0].message == 'PersistedQueryNotFound'
+    assert miss.errors[0].extensions['code'] == 'PERSISTED_QUERY_NOT_FOUND'
+
+    registered = await schema.execute(query, context_value=context(PROJECTS), operation_extensions=persisted)
+    assert registered.errors is None
+
+    hit = await schema.execute(None, context_value=context(PROJECTS), operation_extensions=persisted)
+    assert hit.errors is None and hit.data == {'projects': [{'id': 1, 'name': 'p'}]}
+
+    mismatch = await schema.execute('{ projects { id } }', context_value=context(),
+                                    operation_extensions=persisted)
+    assert mismatch.errors[0].extensions['code'] == 'PERSISTED_QUERY_HASH_MISMATCH'
+
+
+@pytest.mark.asyncio
+async def test_document_is_parsed_and_validated_once(context):
+    query = '{ projects { id unknownField } }'
+    first = await schema.execute(query, context_value=context(PROJECTS))
+    entry = graphql_extensions.document_cache.get(query_hash(query))
+    assert entry is not None and len(entry['errors']) == 1
+    hits = graphql_extensions.document_cache.hits
+    second = await schema.execute(query, context_value=context(PROJECTS))
+    assert graphql_extensions.document_cache.hits == hits + 1
+    assert [e.message for e in second.errors] == [e.message for e in first.errors]
+
+
+def test_query_cost_multiplies_by_page_size_and_list_size(monkeypatch):
+    monkeypatch.setattr(graphql_extensions, 'GRAPHQL_LIST_SIZE', 20)
+    gql_schema = schema._schema
+    cost, depth = query_cost(gql_schema, parse('{ history(projectId: 1, first: 10) { edges { node { id action } } } }'))
+    # history + 10 * (edges + node + id + action)
+    assert (cost, depth) == (1 + 10 * 4, 4)
+    cost, _ = query_cost(gql_schema, parse('query($n: Int) { embeddings(projectId: 1, first: $n) { nodes { vector } } }'),
+                         variables={'n': 5})
+    assert cost == 1 + 5 * (1 + 10)
+    cost, depth = query_cost(gql_schema, parse('{ projects { ...P } } fragment P on Project { tasks { id } }'))
+    assert (cost, depth) == (1 + 20 * (1 + 20 * 1), 3)
+
+
+@pytest.mark.asyncio
+async def test_expensive_and_deep_queries_are_rejected(monkeypatch, context):
+    monkeypatch.setattr(graphql_extensions, 'GRAPHQL_MAX_COST', 100)
+    result = await schema.execute('{ embeddings(projectId: 1, first: 500) { nodes { id vector } } }', context_value=context())
+    assert result.errors[0].extensions['code'] == 'QUERY_TOO_COMPLEX'
+
+    monkeypatch.setattr(graphql_extensions, 'GRAPHQL_MAX_DEPTH', 2)
+    result = await schema.execute('{ projects { tasks { id } } }', context_value=context())
+    assert result.errors[0].extensions['code'] == 'QUERY_TOO_DEEP'
+
+
+def test_cost_budget_throttles_per_client():
+    budget = CostBudget(rate=10, burst=100)
+    assert budget.take('a', 80) == 0
+    assert budget.take('a', 80) > 0
+    assert budget.take('b', 80) == 0
+    assert budget.throttled == 1
+    assert CostBudget(rate=0).take('a', 10 ** 9) == 0
+
+
+@pytest.mark.asyncio
+async def test_operation_latency_histogram(monkeypatch, context):
+    metrics = OperationMetrics(buckets=(1, 1000), max_operations=2)
+    monkeypatch.setattr(graphql_extensions, 'operation_metrics', metrics)
+    await schema.execute('query Dashboard { projects { id } }', context_value=context(PROJECTS))
+    await schema.execute('{ nope }', context_value=context())
+    stats = metrics.stats()
+    assert stats['query Dashboard']['count'] == 1 and stats['query Dashboard']['errors'] == 0
+    assert sum(stats['query Dashboard']['buckets'].values()) == 1
+    assert stats['query anonymous']['errors'] == 1
+    metrics.observe('query Third', 5)
+    assert 'other' in metrics.stats()
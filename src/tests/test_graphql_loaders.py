@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from src.server.schemas.graphql_loaders import GraphQLContext
+from src.server.schemas.graphql_schema import schema
+from src.mcp.memory import embedding_store
+
+
+@pytest.fixture
+def context(fake_memory_bank, fake_conn):
+    def make(fetch):
+        fake_conn.fetch.side_effect = fetch
+        return GraphQLContext(fake_memory_bank), fake_conn
+    return make
+
+
+@pytest.mark.asyncio
+async def test_nested_tasks_are_batched_into_one_query(context):
+    async def fetch(sql, *args):
+        if 'FROM projects' in sql:
+            return [{'id': i, 'name': f'p{i}', 'description': '', 'origin': 'local'} for i in (1, 2, 3)]
+        assert 'ANY($1)' in sql
+        return [{'id': f't{p}', 'project_id': p, 'command': 'c', 'status': 'done', 'result': None} for p in args[0] if p != 2]
+
+    context, conn = context(fetch)
+    result = await schema.execute('{ projects { id tasks { id } } }', context_value=context)
+    assert result.errors is None
+    assert [p['tasks'] for p in result.data['projects']] == [[{'id': 't1'}], [], [{'id': 't3'}]]
+    task_queries = [c for c in conn.fetch.call_args_list if 'FROM tasks' in c.args[0]]
+    assert len(task_queries) == 1
+    assert task_queries[0].args[1] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_aliased_fields_share_loader_and_template_tags_are_joined(context):
+    async def fetch(sql, ids):
+        return [{'id': 5, 'project_id': p, 'name': 'n', 'repo_url': 'u', 'tags': ['a', 'b']} for p in ids]
+
+    context, conn = context(fetch)
+    result = await schema.execute('{ a: templates(projectId: 1) { tags } b: templates(projectId: 2) { tags } }',
+                                  context_value=context)
+    assert result.errors is None
+    assert result.data == {'a': [{'tags': 'a,b'}], 'b': [{'tags': 'a,b'}]}
+    conn.fetch.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_task_create_and_delete_publish_to_subscribers(context, monkeypatch):
+    published = []
+
+    async def publish(memory_bank, entity, project_id, row, op='upsert'):
+        published.append((entity, project_id, row['id'], op))
+    monkeypatch.setattr('src.server.schemas.graphql_schema.broker.publish', publish)
+    context, conn = context(None)
+    conn.fetchrow.return_value = {'id': 't1', 'project_id': 4, 'command': 'c', 'status': 'new', 'result': None}
+    created = await schema.execute('mutation { createTask(input: {id: "t1", projectId: 4, command: "c", status: "new"}) { id } }',
+                                   context_value=context)
+    deleted = await schema.execute('mutation { deleteTask(id: "t1") }', context_value=context)
+    assert created.errors is None and deleted.errors is None
+    assert 'RETURNING' in conn.fetchrow.call_args.args[0]
+    assert published == [('task', 4, 't1', 'upsert'), ('task', 4, 't1', 'delete')]
+
+
+@pytest.mark.asyncio
+async def test_create_embedding_goes_through_model_registry(context, monkeypatch):
+    monkeypatch.setitem(embedding_store._models, 'large', {'name': 'large', 'dimension': 768, 'storage': 'halfvec', 'table_name': 'emb_large'})
+    context, conn = context(None)
+    conn.fetchrow.return_value = {'id': 7}
+    mutation = 'mutation($model: String!, $vector: [Float!]!, $type: String!) { createEmbedding(input: {projectId: 1, model: $model, vector: $vector, entityType: $type, entityId: "e1"}) { id } }'
+
+    result = await schema.execute(mutation, variable_values={'model': 'large', 'vector': [0.1] * 768, 'type': 'doc'}, context_value=context)
+    assert result.errors is None and result.data['createEmbedding']['id'] == 7
+    assert 'INSERT INTO emb_large' in conn.fetchrow.call_args.args[0] and '::text::halfvec' in conn.fetchrow.call_args.args[0]
+
+    conn.fetchrow.reset_mock()
+    conn.fetchrow.return_value = None
+    # Незарегистрированная модель с размерностью не общей таблицы и неизвестный entity_type не доходят до INSERT
+    unregistered = await schema.execute(mutation, variable_values={'model': 'other', 'vector': [0.1] * 768, 'type': 'doc'}, context_value=context)
+    assert 'не зарегистрирована' in unregistered.errors[0].message
+    bad_type = await schema.execute(mutation, variable_values={'model': 'large', 'vector': [0.1] * 768, 'type': 'file'}, context_value=context)
+    assert 'entity_type' in bad_type.errors[0].message
+    assert not any('INSERT' in c.args[0] for c in conn.fetchrow.call_args_list)
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import datetime
+import pytest
+from src.server.schemas.graphql_loaders import GraphQLContext
+from src.server.schemas.graphql_pagination import decode_cursor, encode_cursor, keyset_sql, page_window
+from src.server.schemas.graphql_schema import schema
+
+T0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def context(fake_memory_bank, fake_conn):
+    def make(rows):
+        fake_conn.fetch.return_value = rows
+        return GraphQLContext(fake_memory_bank), fake_conn
+    return make
+
+
+def test_cursor_roundtrip_and_validation():
+    assert decode_cursor(encode_cursor(T0, 42)) == (T0, 42)
+    assert decode_cursor(encode_cursor(T0, 'task-1')) == (T0, 'task-1')
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_keyset_sql_compares_row_tuples():
+    sql = keyset_sql('history', ['id', 'created_at'], 'project_id = $1', 1, cursor=True, backward=False)
+    assert sql == ('SELECT id, created_at FROM history WHERE project_id = $1 AND (created_at, id) > ($2, $3) '
+                   'ORDER BY created_at ASC, id ASC LIMIT $4')
+    sql = keyset_sql('history', ['id', 'created_at'], 'project_id = $1', 1, cursor=False, backward=True)
+    assert sql.endswith('WHERE project_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2')
+    with pytest.raises(ValueError):
+        page_window(1, 1)
+
+
+@pytest.mark.asyncio
+async def test_history_page_fetches_only_requested_columns(context):
+    rows = [{'id': i, 'created_at': T0, 'action': f'a{i}'} for i in (1, 2, 3)]
+    context, conn = context(rows)
+    result = await schema.execute(
+        'query { history(projectId: 7, first: 2) { edges { cursor node { action } } pageInfo { hasNextPage endCursor } } }',
+        context_value=context)
+    assert result.errors is None
+    sql, *params = conn.fetch.call_args.args
+    assert sql.startswith('SELECT id, created_at, action FROM history WHERE project_id = $1')
+    assert params == [7, 3]
+    page = result.data['history']
+    assert [e['node']['action'] for e in page['edges']] == ['a1', 'a2']
+    assert page['pageInfo'] == {'hasNextPage': True, 'endCursor': encode_cursor(T0, 2)}
+
+
+@pytest.mark.asyncio
+async def test_embeddings_without_vector_and_backward_page(context):
+    rows = [{'id': 9, 'created_at': T0}, {'id': 8, 'created_at': T0}]
+    context, conn = context(rows)
+    query = '''query($before: String) { embeddings(projectId: 1, last: 5, before: $before) {
+                 nodes { ...ids } pageInfo { hasNextPage hasPreviousPage } } }
+               fragment ids on Embedding { id }'''
+    result = await schema.execute(query, variable_values={'before': encode_cursor(T0, 10)}, context_value=context)
+    assert result.errors is None
+    sql, *params = conn.fetch.call_args.args
+    assert 'vector' not in sql
+    assert '(created_at, id) < ($2, $3) ORDER BY created_at DESC, id DESC' in sql
+    assert params == [1, T0, 10, 6]
+    assert result.data['embeddings'] == {'nodes': [{'id': 8}, {'id': 9}],
+                                         'pageInfo': {'hasNextPage': True, 'hasPreviousPage': False}}
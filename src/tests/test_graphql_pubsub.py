@@ -0,0 +1,176 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.server.schemas.graphql_pubsub import Broker, Subscriber, NOTIFY_MAX_PAYLOAD
+
+
+@pytest.fixture
+def memory_bank(fake_memory_bank, fake_conn):
+    def make(fetchrow=None):
+        fake_conn.fetchrow.return_value = fetchrow
+        return fake_memory_bank, fake_conn
+    return make
+
+
+def _broker():
+    broker = Broker(maxsize=3)
+    # Без БД: подписки работают в пределах процесса
+    broker._ensure_listener = AsyncMock()
+    return broker
+
+
+@pytest.mark.asyncio
+async def test_subscriber_coalesces_by_id_and_drops_oldest():
+    s = Subscriber(maxsize=2, policy='coalesce')
+    s.offer(1, {'id': 1, 'v': 'a'})
+    s.offer(2, {'id': 2, 'v': 'a'})
+    s.offer(1, {'id': 1, 'v': 'b'})
+    assert [await s.get(), await s.get()] == [{'id': 1, 'v': 'b'}, {'id': 2, 'v': 'a'}]
+    assert s.coalesced == 1
+
+    s = Subscriber(maxsize=2, policy='drop_oldest')
+    for v in 'abc':
+        s.offer(1, {'id': 1, 'v': v})
+    assert [await s.get(), await s.get()] == [{'id': 1, 'v': 'b'}, {'id': 1, 'v': 'c'}]
+    assert s.dropped == 1
+    with pytest.raises(ValueError):
+        Subscriber(policy='block')
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_only_topic_subscribers_and_notifies(memory_bank):
+    broker = _broker()
+    memory_bank, conn = memory_bank()
+    mine = broker.subscribe(memory_bank, 'doc', 1)
+    other = broker.subscribe(memory_bank, 'doc', 2)
+    got = asyncio.ensure_future(mine.__anext__())
+    pending = asyncio.ensure_future(other.__anext__())
+    await asyncio.sleep(0)
+    await broker.publish(memory_bank, 'doc', 1, {'id': 5, 'project_id': 1, 'content': 'x'})
+    assert await asyncio.wait_for(got, 1) == {'op': 'upsert', 'row': {'id': 5, 'project_id': 1, 'content': 'x'}}
+    assert not pending.done()
+    channel, payload = conn.execute.call_args.args[1:]
+    assert channel == broker.channel and json.loads(payload)['r']['content'] == 'x' and json.loads(payload)['o'] == 'upsert'
+    pending.cancel()
+    await mine.aclose()
+    assert broker.stats()['topics'] == 1
+
+
+@pytest.mark.asyncio
+async def test_notify_failure_does_not_fail_publish(memory_bank):
+    broker = _broker()
+    memory_bank, conn = memory_bank()
+    conn.execute.side_effect = OSError('connection lost')
+    await broker.publish(memory_bank, 'task', 1, {'id': 't1', 'project_id': 1})
+    assert broker.stats()['published'] == 1
+
+
+@pytest.mark.asyncio
+async def test_remote_events_inline_or_by_reference(memory_bank):
+    broker = _broker()
+    memory_bank, conn = memory_bank(fetchrow={'id': 7, 'project_id': 1, 'content': 'big'})
+    sub = broker.subscribe(memory_bank, 'doc', 1)
+    got = asyncio.ensure_future(sub.__anext__())
+    await asyncio.sleep(0)
+    broker._memory_bank = memory_bank
+    broker.register('doc', 'SELECT * FROM docs WHERE id = $1')
+
+    # Свои уведомления и темы без подписчиков пропускаются
+    broker._on_notify(None, 0, broker.channel, json.dumps({'s': broker._instance_id, 'e': 'doc', 'p': 1, 'r': {'id': 1}}))
+    broker._on_notify(None, 0, broker.channel, json.dumps({'s': 'w2', 'e': 'doc', 'p': 9, 'r': {'id': 1}}))
+    assert broker.remote == 0
+
+    broker._on_notify(None, 0, broker.channel, json.dumps({'s': 'w2', 'e': 'doc', 'p': 1, 'id': 7}))
+    assert await asyncio.wait_for(got, 1) == {'op': 'upsert', 'row': {'id': 7, 'project_id': 1, 'content': 'big'}}
+    conn.fetchrow.assert_awaited_once_with('SELECT * FROM docs WHERE id = $1', 7)
+    await sub.aclose()
+
+
+@pytest.mark.asyncio
+async def test_oversized_row_is_notified_by_reference(memory_bank):
+    broker = _broker()
+    memory_bank, conn = memory_bank()
+    await broker.publish(memory_bank, 'doc', 1, {'id': 3, 'project_id': 1, 'content': 'x' * NOTIFY_MAX_PAYLOAD})
+    assert json.loads(conn.execute.call_args.args[2]) == {'s': broker._instance_id, 'e': 'doc', 'p': 1, 'o': 'upsert', 'id': 3}
+
+
+@pytest.mark.asyncio
+async def test_delete_events_are_marked_and_filtered_by_op(memory_bank):
+    broker = _broker()
+    memory_bank, conn = memory_bank()
+    updates = broker.subscribe(memory_bank, 'doc', 1, ops=('upsert',))
+    deletes = broker.subscribe(memory_bank, 'doc', 1, ops=('delete',))
+    everything = broker.subscribe(memory_bank, 'doc', 1)
+    got_update, got_delete = asyncio.ensure_future(updates.__anext__()), asyncio.ensure_future(deletes.__anext__())
+    got_any = asyncio.ensure_future(everything.__anext__())
+    await asyncio.sleep(0)
+    await broker.publish(memory_bank, 'doc', 1, {'id': 5, 'project_id': 1, 'content': 'x'}, op='delete')
+    assert await asyncio.wait_for(got_delete, 1) == {'op': 'delete', 'row': {'id': 5, 'project_id': 1, 'content': 'x'}}
+    assert (await asyncio.wait_for(got_any, 1))['op'] == 'delete'
+    assert not got_update.done()
+    assert json.loads(conn.execute.call_args.args[2])['o'] == 'delete'
+
+    # Удаление, пришедшее ссылкой, не перечитывается — строки уже нет
+    got_delete = asyncio.ensure_future(deletes.__anext__())
+    await asyncio.sleep(0)
+    broker._on_notify(None, 0, broker.channel, json.dumps({'s': 'w2', 'e': 'doc', 'p': 1, 'o': 'delete', 'id': 6}))
+    assert await asyncio.wait_for(got_delete, 1) == {'op': 'delete', 'row': {'id': 6, 'project_id': 1}}
+    conn.fetchrow.assert_not_awaited()
+    got_update.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await got_update
+    for sub in (deletes, everything):
+        await sub.aclose()
+
+
+def test_coalesced_delete_replaces_pending_update():
+    s = Subscriber(maxsize=5, policy='coalesce')
+    s.offer(1, {'op': 'upsert', 'row': {'id': 1, 'v': 'a'}})
+    s.offer(1, {'op': 'delete', 'row': {'id': 1, 'v': 'a'}})
+    assert len(s) == 1 and s.coalesced == 1
+    assert s._buffer[1]['op'] == 'delete'
+
+
+@pytest.mark.asyncio
+async def test_listener_reconnects_after_termination_with_backoff(memory_bank, monkeypatch):
+    memory_bank, _ = memory_bank()
+    listener = MagicMock()
+    listener.add_listener = AsyncMock()
+    listener.close = AsyncMock()
+    listener.is_closed.return_value = False
+    connect = AsyncMock(side_effect=[OSError('refused'), listener])
+    monkeypatch.setattr('src.server.schemas.graphql_pubsub.asyncpg.connect', connect)
+    broker = Broker(reconnect_delay=0, reconnect_max_delay=0)
+    broker._memory_bank = memory_bank
+    broker._topics[('doc', 1)] = {Subscriber()}
+    lost = MagicMock()
+    broker._listener = lost
+
+    broker._on_terminate(lost)
+    await asyncio.wait_for(broker._reconnect, 1)
+    assert connect.await_count == 2 and broker._listener is listener
+    listener.add_termination_listener.assert_called_once_with(broker._on_terminate)
+    assert broker.stats()['listening'] and broker.stats()['reconnects'] == 1
+
+    await broker.close()
+    listener.close.assert_awaited_once()
+    assert broker._listener is None and broker._reconnect is None
+
+
+@pytest.mark.asyncio
+async def test_no_reconnect_without_subscribers(memory_bank, monkeypatch):
+    memory_bank, _ = memory_bank()
+    connect = AsyncMock()
+    monkeypatch.setattr('src.server.schemas.graphql_pubsub.asyncpg.connect', connect)
+    broker = Broker(reconnect_delay=0)
+    broker._memory_bank = memory_bank
+    lost = MagicMock()
+    broker._listener = lost
+    broker._on_terminate(lost)
+    await asyncio.wait_for(broker._reconnect, 1)
+    connect.assert_not_awaited()
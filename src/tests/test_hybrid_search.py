@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import re
+import pytest
+from unittest.mock import AsyncMock
+from src.mcp.memory.hybrid_search import hybrid_search_sql, hybrid_search
+
+
+def used_params(sql):
+    return {int(n) for n in re.findall(r'\$(\d+)', sql)}
+
+
+def test_text_only_query_has_no_vector_params():
+    sql, params = hybrid_search_sql(7, text='deploy rollback', sources=['doc', 'task'], limit=10, offset=30)
+    assert params == [7, 100, 'deploy rollback', 60, 10, 30]
+    assert used_params(sql) == set(range(1, len(params) + 1))
+    assert "websearch_to_tsquery('simple', $3)" in sql and 'FROM docs' in sql and 'FROM context' not in sql
+    assert 'semantic AS (SELECT NULL::text' in sql
+
+
+def test_hybrid_query_fuses_both_lists_with_filters():
+    sql, params = hybrid_search_sql(7, text='deploy', vector=[0.5, 1.0], filters={'doc': 'adr', 'task': None},
+                                    limit=5, offset=200, metric='cosine')
+    assert used_params(sql) == set(range(1, len(params) + 1))
+    assert params[1] == 205  # глубина списков покрывает страницу
+    assert 'adr' in params and '[0.5,1.0]' in params
+    assert "(entity_type = 'doc' OR entity_type = 'task')" in sql
+    assert 'ORDER BY vector <=> $' in sql
+    assert 'FULL OUTER JOIN semantic s ON l.source = s.source AND l.id = s.id' in sql
+
+
+def test_hybrid_query_validates_arguments():
+    with pytest.raises(ValueError):
+        hybrid_search_sql(7)
+    with pytest.raises(ValueError):
+        hybrid_search_sql(7, text='x', sources=['files'])
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_returns_page_with_candidate_count(fake_conn):
+    conn = fake_conn
+    conn.fetch = AsyncMock(return_value=[
+        {'source': 'doc', 'id': '3', 'text': 'deploy guide', 'lexical_rank': 1, 'vector_rank': 2, 'score': 0.0325, 'candidates': 12},
+    ])
+    page = await hybrid_search(conn, 7, 'deploy', [0.1], ef_search=80)
+    assert page['candidates'] == 12 and 'total' not in page
+    assert page['items'][0]['source'] == 'doc' and page['items'][0]['score'] == pytest.approx(0.0325)
+    conn.execute.assert_awaited_once_with('SET LOCAL hnsw.ef_search = 80')
@@ -0,0 +1,38 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory.index_advisor import advise, find_seq_scans, format_report
+
+
+SEQ_PLAN = [{'Plan': {'Node Type': 'Limit', 'Total Cost': 10.0, 'Plans': [
+    {'Node Type': 'Sort', 'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'history', 'Plan Rows': 5000, 'Filter': '(user_id = $1)'}
+    ]}
+]}}]
+INDEX_PLAN = [{'Plan': {'Node Type': 'Index Scan', 'Relation Name': 'tasks', 'Total Cost': 1.5}}]
+
+
+def test_find_seq_scans_nested():
+    scans = find_seq_scans(SEQ_PLAN[0]['Plan'])
+    assert scans == [{'relation': 'history', 'rows': 5000, 'filter': '(user_id = $1)'}]
+    assert find_seq_scans(INDEX_PLAN[0]['Plan']) == []
+
+
+@pytest.mark.asyncio
+async def test_advise_reports_seq_scans():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(side_effect=[json.dumps(SEQ_PLAN), json.dumps(INDEX_PLAN)])
+    shapes = [
+        {'name': 'history_by_user', 'sql': 'SELECT * FROM history WHERE user_id = $1', 'params': ['u']},
+        {'name': 'get_all_tasks', 'sql': 'SELECT * FROM tasks WHERE project_id = $1', 'params': [1]},
+    ]
+    report = await advise(conn, shapes)
+    assert conn.fetchval.await_args_list[0].args[0].startswith('EXPLAIN (FORMAT JSON) ')
+    assert report[0]['seq_scan'] and not report[1]['seq_scan']
+    text = format_report(report)
+    assert '[SEQ SCAN] history_by_user: history (~5000 rows)' in text
+    assert '[OK] get_all_tasks' in text
@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.mcp.memory import memory_bank as mb_module
+from src.mcp.memory.memory_bank import MemoryBank, get_memory_bank
+from src.mcp.memory.migrator import latest_version
+from src.mcp.memory.context_cache import MISSING
+
+
+@pytest.fixture
+def fake_conn(fake_conn):
+    # Схема актуальна: проверка версии возвращает последнюю миграцию
+    fake_conn.fetchval.return_value = latest_version()
+    return fake_conn
+
+
+@pytest.mark.asyncio
+async def test_get_memory_bank_returns_shared_instance():
+    mb_module._shared_memory_bank = None
+    first = await get_memory_bank()
+    second = await get_memory_bank()
+    assert first is second
+
+
+@pytest.mark.asyncio
+async def test_pool_created_once_and_schema_checked_once(fake_pool, fake_conn):
+    pool, conn = fake_pool, fake_conn
+    with patch.object(mb_module.asyncpg, 'create_pool', AsyncMock(return_value=pool)) as create_pool:
+        mb = MemoryBank(dsn="postgresql://test", min_size=1, max_size=3, statement_cache_size=0)
+        assert await mb.get_pool() is pool
+        assert await mb.get_pool() is pool
+        create_pool.assert_awaited_once()
+        kwargs = create_pool.call_args.kwargs
+        assert kwargs["min_size"] == 1
+        assert kwargs["max_size"] == 3
+        assert kwargs["statement_cache_size"] == 0
+        # Схема актуальна: одна проверка версии и ни одного DDL
+        conn.fetchval.assert_awaited_once()
+        conn.execute.assert_not_awaited()
+        await mb.close()
+        pool.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_pool_from_other_event_loop_is_terminated(fake_pool):
+    stale, pool = MagicMock(), fake_pool
+    with patch.object(mb_module.asyncpg, 'create_pool', AsyncMock(return_value=pool)):
+        mb = MemoryBank(dsn="postgresql://test")
+        mb._pool, mb._loop, mb._schema_ready = stale, object(), True
+        assert await mb.get_pool() is pool
+    stale.terminate.assert_called_once()
+
+
+def test_project_bundle_queries_use_explicit_sorted_columns():
+    queries = mb_module.PROJECT_BUNDLE_QUERIES
+    assert list(queries) == ['tasks', 'rules', 'templates', 'embeddings', 'docs', 'history']
+    assert queries['rules'] == 'SELECT id, project_id, type, value, description FROM cursor_rules WHERE project_id = $1 ORDER BY id COLLATE "C"'
+    # Генерируемый tsvector (0007) не выгружается
+    assert not any('*' in sql or 'search_tsv' in sql for sql in queries.values())
+    # created_at задач и эмбеддингов (0008) — время вставки в проект, в архив не выгружается
+    assert 'created_at' not in queries['tasks'] + queries['embeddings']
+
+
+@pytest.mark.asyncio
+async def test_get_context_read_through_and_write_through(fake_pool, fake_conn):
+    pool, conn = fake_pool, fake_conn
+    conn.fetchrow = AsyncMock(return_value={'data': 'ctx', 'project_id': 7})
+    with patch.object(mb_module.asyncpg, 'create_pool', AsyncMock(return_value=pool)):
+        mb = MemoryBank(dsn="postgresql://test")
+        assert await mb.get_context('t1') == 'ctx'
+        assert await mb.get_context('t1') == 'ctx'
+        assert await mb.get_context('t1', project_id=8) is None
+        conn.fetchrow.assert_awaited_once()
+
+        conn.fetchrow = AsyncMock(return_value={'project_id': 7, 'pg_notify': ''})
+        await mb.save_context('t1', 'new')
+        sql, *args = conn.fetchrow.call_args.args
+        assert 'pg_notify($3, $4)' in sql and args[3] == f'{mb._instance_id}:t1'
+        assert await mb.get_context('t1', project_id=7) == 'new'
+    assert mb.context_cache.stats()['misses'] == 1
+
+
+def test_context_notify_from_other_worker_invalidates():
+    mb = MemoryBank(dsn="postgresql://test")
+    mb.context_cache.put('t1', 'a', 1)
+    mb._on_context_notify(None, 1, 'memory_bank_context', f'{mb._instance_id}:t1')
+    assert mb.context_cache.get('t1') == 'a'
+    mb._on_context_notify(None, 1, 'memory_bank_context', 'other:t1')
+    assert mb.context_cache.get('t1') is MISSING
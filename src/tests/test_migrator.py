@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from src.mcp.memory.migrator import load_migrations, latest_version, migrate, MIGRATION_LOCK_KEY
+
+
+def write_migrations(tmp_path, files):
+    for name, sql in files.items():
+        (tmp_path / name).write_text(sql, encoding='utf-8')
+    return str(tmp_path)
+
+
+def test_load_migrations_sorted_and_filtered(tmp_path):
+    directory = write_migrations(tmp_path, {
+        '0002_indexes.sql': 'CREATE INDEX a ON t (x);',
+        '0001_initial.sql': 'CREATE TABLE t (x INT);',
+        'README.md': 'not a migration',
+    })
+    migrations = load_migrations(directory)
+    assert [m['version'] for m in migrations] == [1, 2]
+    assert migrations[0]['name'] == 'initial'
+    assert latest_version(directory) == 2
+
+
+def test_bundled_migrations_start_at_one():
+    migrations = load_migrations()
+    assert migrations[0]['version'] == 1
+    assert 'CREATE TABLE IF NOT EXISTS projects' in migrations[0]['sql']
+
+
+@pytest.mark.asyncio
+async def test_migrate_applies_only_pending_under_lock(tmp_path, fake_conn):
+    directory = write_migrations(tmp_path, {
+        '0001_initial.sql': 'CREATE TABLE t (x INT);',
+        '0002_more.sql': 'ALTER TABLE t ADD COLUMN y INT;',
+    })
+    first = load_migrations(directory)[0]
+    conn = fake_conn
+    conn.fetch.return_value = [{'version': 1, 'checksum': first['checksum']}]
+    applied = await migrate(conn, directory=directory)
+    assert applied == [2]
+    executed = [c.args[0] for c in conn.execute.await_args_list]
+    assert executed[0] == 'SELECT pg_advisory_lock($1)'
+    assert 'ALTER TABLE t ADD COLUMN y INT;' in executed
+    assert 'CREATE TABLE t (x INT);' not in executed
+    assert conn.execute.await_args_list[-1].args == ('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+
+
+def test_bundled_migrations_backfill_legacy_entity_type():
+    backfill = [m for m in load_migrations() if m['name'] == 'backfill_embedding_entity_type']
+    assert backfill and backfill[0]['version'] > 5
+    assert 'SET entity_type' in backfill[0]['sql'] and 'entity_type IS NULL' in backfill[0]['sql']
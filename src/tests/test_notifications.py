@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.server.utils import notifications
+from src.server.utils.notifications import NotificationDispatcher, SLOW_CONSUMER_CLOSE_CODE
+
+
+def _socket(send=None):
+    ws = MagicMock()
+    ws.send_text = AsyncMock(side_effect=send)
+    ws.close = AsyncMock()
+    return ws
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_times_out_without_delaying_others():
+    async def hang(message):
+        await asyncio.sleep(10)
+
+    dispatcher = NotificationDispatcher(send_timeout=0.05, desktop=False)
+    fast, slow = _socket(), _socket(hang)
+    dispatcher.register(fast)
+    dispatcher.register(slow)
+
+    assert dispatcher.publish('задача создана') is True
+    await _settle()
+    fast.send_text.assert_awaited_once_with('задача создана')
+
+    await asyncio.sleep(0.1)
+    assert dispatcher.stats()['clients'] == 1 and dispatcher.disconnected == 1
+    slow.close.assert_awaited_once_with(code=SLOW_CONSUMER_CLOSE_CODE)
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_full_client_buffer_disconnects_consumer():
+    blocked = asyncio.Event()
+
+    async def block(message):
+        await blocked.wait()
+
+    dispatcher = NotificationDispatcher(buffer_size=2, send_timeout=10, desktop=False)
+    ws = _socket(block)
+    dispatcher.register(ws)
+    for i in range(4):
+        dispatcher.publish(f'm{i}')
+        await _settle()
+    assert dispatcher.stats()['clients'] == 0
+    ws.close.assert_awaited_once()
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_publish_drops_when_queue_is_full():
+    dispatcher = NotificationDispatcher(queue_size=1, desktop=False)
+    assert dispatcher.publish('a') is True
+    assert dispatcher.publish('b') is False
+    assert dispatcher.stats()['dropped'] == 1
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_desktop_notification_runs_off_event_loop(monkeypatch):
+    calls = []
+    done = threading.Event()
+
+    def fake_notify(title, message):
+        calls.append((title, message, threading.current_thread() is threading.main_thread()))
+        done.set()
+
+    monkeypatch.setattr(notifications, '_desktop_notify', fake_notify)
+    dispatcher = NotificationDispatcher(desktop=True)
+    dispatcher.publish('экспорт завершён')
+    for _ in range(50):
+        if done.is_set():
+            break
+        await asyncio.sleep(0.01)
+    assert calls == [('MCP', 'экспорт завершён', False)]
+    await dispatcher.close()
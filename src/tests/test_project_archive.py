@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import datetime
+import io
+import json
+import zipfile
+import pytest
+from src.mcp.memory.project_archive import stream_project_zip, load_archive_rows, is_data_entry, diff_project_archive
+
+
+def table_rows(fake_cursor, rows_by_table):
+    # conn.cursor(sql, project_id, prefetch=...) -> строки таблицы из FROM
+    return lambda sql, project_id, prefetch: fake_cursor(rows_by_table.get(sql.split(' FROM ')[1].split()[0], []))
+
+
+@pytest.mark.asyncio
+async def test_stream_project_zip_writes_ndjson_in_chunks(fake_memory_bank, fake_conn, fake_cursor):
+    history = [{'id': i, 'action': 'export', 'created_at': datetime.datetime(2025, 1, 1)} for i in range(2000)]
+    fake_conn.cursor = table_rows(fake_cursor, {
+        'tasks': [{'id': 't1', 'command': 'cmd'}],
+        'history': history,
+    })
+    chunks = [c async for c in stream_project_zip(fake_memory_bank, 1, chunk_size=1024)]
+    assert len(chunks) > 2
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zipf:
+        names = zipf.namelist()
+        assert names == ['tasks.ndjson', 'rules.ndjson', 'templates.ndjson', 'embeddings.ndjson', 'docs.ndjson', 'history.ndjson']
+        lines = zipf.read('history.ndjson').decode('utf-8').splitlines()
+        assert len(lines) == 2000
+        assert json.loads(lines[0])['created_at'] == '2025-01-01 00:00:00'
+        assert zipf.read('rules.ndjson') == b''
+
+
+def test_load_archive_rows_supports_ndjson_and_legacy_json(tmp_path):
+    (tmp_path / 'tasks.ndjson').write_text('{"id": "a"}\n{"id": "b"}\n', encoding='utf-8')
+    (tmp_path / 'rules.json').write_text(json.dumps([{'id': 'r'}]), encoding='utf-8')
+    assert [r['id'] for r in load_archive_rows(str(tmp_path), 'tasks')] == ['a', 'b']
+    assert load_archive_rows(str(tmp_path), 'rules') == [{'id': 'r'}]
+    assert load_archive_rows(str(tmp_path), 'docs') == []
+    assert is_data_entry('tasks.ndjson') and not is_data_entry('attachment.png')
+
+
+@pytest.mark.asyncio
+async def test_diff_project_archive_streams_sorted_and_falls_back_for_unsorted(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    fake_conn.cursor = table_rows(fake_cursor, {
+        'tasks': [{'id': 'A', 'command': 'x'}, {'id': 'b', 'command': 'y'}],
+        'history': [{'id': 1, 'action': 'a'}, {'id': 2, 'action': 'b'}],
+    })
+    (tmp_path / 'tasks.ndjson').write_text('{"id": "A", "command": "x"}\n{"id": "c", "command": "z"}\n', encoding='utf-8')
+    # Архив старого формата: порядок id произвольный
+    (tmp_path / 'history.json').write_text(json.dumps([{'id': 3, 'action': 'c'}, {'id': 2, 'action': 'changed'}]), encoding='utf-8')
+    diffs = await diff_project_archive(fake_memory_bank, 1, str(tmp_path), keep_skipped=False)
+    assert [r['id'] for r in diffs['tasks']['added']] == ['c'] and diffs['tasks']['skipped'] == []
+    assert [r['id'] for r in diffs['history']['added']] == [3]
+    assert diffs['history']['conflicted'][0]['current'] == {'id': 2, 'action': 'b'}
+    assert diffs['rules'] == {'added': [], 'updated': [], 'conflicted': [], 'skipped': []}
+    fake_conn.transaction.assert_called_once_with(isolation='repeatable_read', readonly=True)
+
+
+@pytest.mark.asyncio
+async def test_merge_diff_ignores_created_at_of_other_project(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    # Та же задача и тот же эмбеддинг, вставленные в исходный проект в другое время
+    fake_conn.cursor = table_rows(fake_cursor, {
+        'tasks': [{'id': 't1', 'project_id': 2, 'command': 'run', 'created_at': datetime.datetime(2025, 6, 1)}],
+        'embeddings': [{'id': 1, 'project_id': 2, 'task_id': 't1', 'vector': '[1,0]', 'created_at': datetime.datetime(2025, 6, 1)}],
+    })
+    (tmp_path / 'tasks.ndjson').write_text(
+        json.dumps({'id': 't1', 'project_id': 1, 'command': 'run', 'created_at': '2024-01-01 00:00:00'}) + '\n', encoding='utf-8')
+    (tmp_path / 'embeddings.ndjson').write_text(
+        json.dumps({'id': 1, 'project_id': 1, 'task_id': 't1', 'vector': '[1,0]', 'created_at': '2024-01-01 00:00:00'}) + '\n', encoding='utf-8')
+    diffs = await diff_project_archive(fake_memory_bank, 2, str(tmp_path))
+    for entity in ('tasks', 'embeddings'):
+        assert diffs[entity]['updated'] == [] and diffs[entity]['conflicted'] == []
+        assert len(diffs[entity]['skipped']) == 1
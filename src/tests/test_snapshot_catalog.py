@@ -0,0 +1,39 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import hashlib
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory.snapshot_catalog import register_snapshot, get_snapshot, get_previous_snapshot, file_checksum
+
+
+@pytest.mark.asyncio
+async def test_register_snapshot_upserts_by_tag():
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value={'id': 1, 'tag': 'snapshot-1-a'})
+    row = await register_snapshot(conn, 1, 'snapshot-1-a', 'docs/m.json', size_bytes=10, checksum='c', created_by='u')
+    assert row == {'id': 1, 'tag': 'snapshot-1-a'}
+    sql, *args = conn.fetchrow.call_args.args
+    assert 'ON CONFLICT (tag)' in sql
+    assert args == [1, 'snapshot-1-a', 'docs/m.json', 'manifest', 10, 'c', 'u', None]
+
+
+@pytest.mark.asyncio
+async def test_lookups_are_scoped_to_project_and_ordered():
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value=None)
+    assert await get_snapshot(conn, 2, 'snapshot-1-a') is None
+    sql, *args = conn.fetchrow.call_args.args
+    assert 'tag = $1 AND project_id = $2' in sql and args == ['snapshot-1-a', 2]
+
+    conn.fetchrow = AsyncMock(return_value={'tag': 'snapshot-2-b'})
+    assert (await get_previous_snapshot(conn, 2))['tag'] == 'snapshot-2-b'
+    sql, *args = conn.fetchrow.call_args.args
+    assert 'ORDER BY created_at DESC, id DESC OFFSET $2 LIMIT 1' in sql and args == [2, 1]
+
+
+def test_file_checksum(tmp_path):
+    path = tmp_path / 'm.json'
+    path.write_bytes(b'{}')
+    assert file_checksum(str(path)) == hashlib.sha256(b'{}').hexdigest()
@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import asyncio
+import datetime
+import zipfile
+import pytest
+from src.mcp.memory.snapshot_store import SnapshotStore, new_snapshot_id
+from src.mcp.core.vcs import GitRepo
+
+
+def bucketed(rows, size):
+    # Эмулирует SELECT id / $2 AS _bucket, * ... ORDER BY _bucket, id
+    return [{'_bucket': r['id'] // size, **r} for r in sorted(rows, key=lambda r: r['id'])]
+
+
+def history_cursor(fake_cursor, history):
+    def cursor(sql, project_id, chunk_param, prefetch):
+        table = sql.split(' FROM ')[1].split()[0]
+        return fake_cursor(bucketed(history, chunk_param) if table == 'history' else [])
+    return cursor
+
+
+@pytest.mark.asyncio
+async def test_second_snapshot_writes_only_changed_chunks(tmp_path, monkeypatch, fake_memory_bank, fake_conn, fake_cursor):
+    monkeypatch.setattr('src.mcp.memory.snapshot_store.SNAPSHOT_CHUNK_ROWS', 100)
+    store = SnapshotStore(str(tmp_path))
+    history = [{'id': i, 'action': 'a'} for i in range(1000)]
+    fake_conn.cursor = history_cursor(fake_cursor, history)
+    first, first_paths = await store.create_snapshot(fake_memory_bank, 1, 's1')
+    assert first['stats']['chunks'] == 10 and first['stats']['new_chunks'] == 10
+    assert len(first_paths) == 11  # 10 объектов + манифест
+
+    history[5]['action'] = 'changed'
+    history.append({'id': 1000, 'action': 'new'})
+    second, second_paths = await store.create_snapshot(fake_memory_bank, 1, 's2')
+    assert second['stats']['chunks'] == 11
+    assert second['stats']['new_chunks'] == 2
+    # В git add уходят все объекты манифеста: неизменённые git пропустит сам
+    assert len(second_paths) == 12
+    assert set(first_paths[:-1]) - set(second_paths) == {store.object_path(first['entities']['history'][0]['hash'])}
+
+
+@pytest.mark.asyncio
+async def test_restore_rebuilds_rows_from_manifest(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    store = SnapshotStore(str(tmp_path))
+    history = [{'id': i, 'action': f'a{i}'} for i in range(50)]
+    fake_conn.cursor = history_cursor(fake_cursor, history)
+    await store.create_snapshot(fake_memory_bank, 3, 's1')
+    assert store.has_manifest(3, 's1') and not store.has_manifest(3, 's2')
+    manifest = store.load_manifest(3, 's1')
+    assert list(store.iter_entity_rows(manifest, 'history')) == history
+
+    archive = store.write_archive(manifest, str(tmp_path / 'restore.zip'))
+    with zipfile.ZipFile(archive) as zipf:
+        assert len(zipf.read('history.ndjson').decode('utf-8').splitlines()) == 50
+        assert zipf.read('tasks.ndjson') == b''
+
+
+def test_put_chunk_is_idempotent(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    digest, path, created = store.put_chunk(b'{"id": 1}\n')
+    assert created and os.path.exists(path)
+    assert store.put_chunk(b'{"id": 1}\n') == (digest, path, False)
+
+
+def test_snapshot_ids_unique_within_one_second_and_sortable():
+    moment = datetime.datetime(2025, 1, 1, 12, 0, 0)
+    ids = {new_snapshot_id(moment) for _ in range(100)}
+    assert len(ids) == 100
+    assert new_snapshot_id(moment) < new_snapshot_id(moment + datetime.timedelta(microseconds=1))
+
+
+@pytest.mark.asyncio
+async def test_missing_chunks_reports_deleted_objects(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    store = SnapshotStore(str(tmp_path))
+    fake_conn.cursor = history_cursor(fake_cursor, [{'id': i, 'action': 'a'} for i in range(5)])
+    manifest, _ = await store.create_snapshot(fake_memory_bank, 1, 's1')
+    assert store.missing_chunks(manifest) == []
+    digest = manifest['entities']['history'][0]['hash']
+    os.remove(store.object_path(digest))
+    assert store.missing_chunks(manifest) == [digest]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_snapshots_each_get_commit_and_tag(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    repo = GitRepo(str(tmp_path))
+    await repo.run('init', '-q')
+    await repo.run('config', 'user.email', 'test@example.com')
+    await repo.run('config', 'user.name', 'test')
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    fake_conn.cursor = history_cursor(fake_cursor, [{'id': i, 'action': 'a'} for i in range(5)])
+
+    async def snapshot(project_id):
+        # Тот же порядок, что у POST /projects/{id}/snapshot: чанки и манифест, затем commit и tag
+        snapshot_id = new_snapshot_id(datetime.datetime.utcnow())
+        _, paths = await store.create_snapshot(fake_memory_bank, project_id, snapshot_id)
+        tag = f'snapshot-{project_id}-{snapshot_id}'
+        await repo.commit_paths(paths, f'[snapshot] project {project_id} at {snapshot_id}', tag)
+        return tag
+
+    tags = await asyncio.gather(snapshot(1), snapshot(2), return_exceptions=True)
+    assert not any(isinstance(t, Exception) for t in tags)
+    assert sorted(await repo.tags('snapshot-')) == sorted(tags)
+    commit = repo.metrics()['commit']
+    assert commit['count'] == 2 and commit['errors'] == 0
+
+
+@pytest.mark.asyncio
+async def test_chunks_left_by_failed_commit_reach_next_commit(tmp_path, fake_memory_bank, fake_conn, fake_cursor):
+    repo = GitRepo(str(tmp_path))
+    await repo.run('init', '-q')
+    await repo.run('config', 'user.email', 'test@example.com')
+    await repo.run('config', 'user.name', 'test')
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    fake_conn.cursor = history_cursor(fake_cursor, [{'id': i, 'action': 'a'} for i in range(5)])
+    # Первый снапшот записал чанки, но commit не состоялся
+    await store.create_snapshot(fake_memory_bank, 1, 's1')
+    manifest, paths = await store.create_snapshot(fake_memory_bank, 1, 's2')
+    await repo.commit_paths(paths, 'snapshot s2', 'snapshot-1-s2')
+    tracked = await repo.run('ls-files', '--', 'snapshots/objects')
+    digest = manifest['entities']['history'][0]['hash']
+    assert os.path.relpath(store.object_path(digest), str(tmp_path)) in tracked.splitlines()
@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import json
+import pytest
+from unittest.mock import AsyncMock
+from src.mcp.memory.task_store import upsert_task, insert_task, complete_task, export_tasks_mdf, TaskJournal, TaskExistsError
+from src.cacd import CACD
+
+ROW = {'id': 't1', 'project_id': None, 'command': 'build', 'context': 'ctx', 'rules': '[{"type": "priority"}]', 'status': 'pending', 'result': None}
+
+
+@pytest.fixture
+def fake_conn(fake_conn):
+    fake_conn.fetchrow.return_value = ROW
+    return fake_conn
+
+
+@pytest.mark.asyncio
+async def test_upsert_task_single_statement_and_decodes_rules(fake_conn):
+    conn = fake_conn
+    task = await upsert_task(conn, {'id': 't1', 'command': 'build', 'context': 'ctx', 'rules': [{'type': 'priority'}], 'status': 'pending'})
+    sql, *args = conn.fetchrow.call_args.args
+    assert 'ON CONFLICT (id) DO UPDATE' in sql
+    assert args[4] == '[{"type": "priority"}]'
+    assert task['rules'] == [{'type': 'priority'}]
+
+
+@pytest.mark.asyncio
+async def test_complete_missing_task_returns_none(fake_conn):
+    conn = fake_conn
+    conn.fetchrow.return_value = None
+    assert await complete_task(conn, 'nope', 'ok') is None
+    assert conn.fetchrow.call_args.args[1:] == ('nope', 'ok')
+
+
+@pytest.mark.asyncio
+async def test_export_tasks_mdf_writes_json_array(tmp_path, fake_conn, fake_cursor):
+    path = tmp_path / 'tasks.mdf'
+    path.write_text('old')
+    conn = fake_conn
+    conn.cursor = lambda *args, **kwargs: fake_cursor([ROW, dict(ROW, id='t2')])
+    assert await export_tasks_mdf(conn, str(path)) == 2
+    tasks = json.loads(path.read_text(encoding='utf-8'))
+    assert [t['id'] for t in tasks] == ['t1', 't2'] and tasks[0]['rules'] == [{'type': 'priority'}]
+    assert os.listdir(tmp_path) == ['tasks.mdf']
+
+
+@pytest.mark.asyncio
+async def test_insert_task_never_overwrites_existing(fake_conn):
+    task = await insert_task(fake_conn, {'id': 't1', 'command': 'build', 'status': 'pending'})
+    assert 'ON CONFLICT (id) DO NOTHING' in fake_conn.fetchrow.call_args.args[0] and task['id'] == 't1'
+    fake_conn.fetchrow.return_value = None
+    with pytest.raises(TaskExistsError):
+        await insert_task(fake_conn, {'id': 't1', 'command': 'again', 'status': 'pending'})
+
+
+@pytest.mark.asyncio
+async def test_cacd_process_command_inserts_and_journals(tmp_path, fake_memory_bank):
+    memory = fake_memory_bank
+    memory.save_context = AsyncMock()
+    journal = tmp_path / 'tasks.jsonl'
+    cacd = CACD(memory_bank=memory, rules_path=str(tmp_path / 'rules.json'), tasks_path=str(tmp_path / 'tasks.mdf'),
+                journal=TaskJournal(str(journal)))
+    task = await cacd.process_command('build', 't1')
+    assert task['id'] == 't1'
+    assert not (tmp_path / 'tasks.mdf').exists()
+    event = json.loads(journal.read_text(encoding='utf-8').splitlines()[0])
+    assert event['event'] == 'created' and event['task']['id'] == 't1'
+
+
+@pytest.mark.asyncio
+async def test_cacd_process_command_rejects_existing_task(tmp_path, fake_memory_bank, fake_conn):
+    fake_conn.fetchrow.return_value = None
+    memory = fake_memory_bank
+    memory.save_context = AsyncMock()
+    journal = tmp_path / 'tasks.jsonl'
+    cacd = CACD(memory_bank=memory, rules_path=str(tmp_path / 'rules.json'), tasks_path=str(tmp_path / 'tasks.mdf'),
+                journal=TaskJournal(str(journal)))
+    with pytest.raises(TaskExistsError):
+        await cacd.process_command('build', 't1')
+    memory.save_context.assert_not_awaited()
+    assert not journal.exists() and cacd.backlog == []
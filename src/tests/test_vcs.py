@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import asyncio
+import pytest
+from src.mcp.core.vcs import GitRepo, GitError, get_repo
+
+
+async def init_repo(path):
+    repo = GitRepo(str(path))
+    await repo.run('init', '-q')
+    await repo.run('config', 'user.email', 'test@example.com')
+    await repo.run('config', 'user.name', 'test')
+    return repo
+
+
+@pytest.mark.asyncio
+async def test_commit_tag_and_log(tmp_path):
+    repo = await init_repo(tmp_path)
+    (tmp_path / 'a.txt').write_text('1', encoding='utf-8')
+    await repo.add('a.txt')
+    await repo.commit('first')
+    await repo.tag('snapshot-1-2025')
+    await repo.tag('snapshot-2-2025')
+    assert await repo.tags('snapshot-1-') == ['snapshot-1-2025']
+    log = await repo.log_file('a.txt')
+    assert len(log) == 1 and log[0].endswith('|first')
+    metrics = repo.metrics()
+    assert metrics['commit']['count'] == 1 and metrics['commit']['errors'] == 0
+    assert metrics['tag']['count'] == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_command_raises_and_is_counted(tmp_path):
+    repo = await init_repo(tmp_path)
+    with pytest.raises(GitError):
+        await repo.checkout('no-such-ref', 'a.txt')
+    assert repo.metrics()['checkout']['errors'] == 1
+
+
+@pytest.mark.asyncio
+async def test_operations_are_serialised(tmp_path):
+    repo = await init_repo(tmp_path)
+    for i in range(5):
+        (tmp_path / f'f{i}.txt').write_text(str(i), encoding='utf-8')
+    # Параллельные add без лока конфликтуют на index.lock
+    await asyncio.gather(*(repo.add(f'f{i}.txt') for i in range(5)))
+    add = repo.metrics()['add']
+    assert add['count'] == 5 and add['errors'] == 0
+
+
+def test_get_repo_is_shared_per_path(tmp_path):
+    assert get_repo(str(tmp_path)) is get_repo(str(tmp_path) + '/.')
+
+
+@pytest.mark.asyncio
+async def test_commit_paths_keeps_add_commit_tag_together(tmp_path):
+    repo = await init_repo(tmp_path)
+    for name in ('a', 'b'):
+        (tmp_path / f'{name}.txt').write_text(name, encoding='utf-8')
+    # С отдельными add/commit/tag первый commit забрал бы оба файла, второй упал бы на "nothing to commit"
+    results = await asyncio.gather(
+        repo.commit_paths(['a.txt'], 'snapshot a', 'snapshot-1-a'),
+        repo.commit_paths(['b.txt'], 'snapshot b', 'snapshot-1-b'),
+        return_exceptions=True,
+    )
+    assert results == [None, None]
+    assert await repo.tags('snapshot-1-') == ['snapshot-1-a', 'snapshot-1-b']
+    assert (await repo.log_file('a.txt'))[0].endswith('|snapshot a')
+    assert (await repo.log_file('b.txt'))[0].endswith('|snapshot b')
+    assert repo.metrics()['commit']['errors'] == 0
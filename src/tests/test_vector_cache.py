@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import asyncio
+import struct
+import numpy as np
+import pytest
+from src.mcp.memory.vector_cache import ProjectVectors, VectorCache, parse_vectors
+
+
+def vector_send(values):
+    # Двоичный формат pgvector: размерность, резерв, float4 big-endian
+    return struct.pack(f'>hh{len(values)}f', len(values), 0, *values)
+
+
+def rows_for(matrix):
+    return [{'entity_id': f't{i}', 'entity_type': 'task', 'description': f'd{i}', 'vector': vector_send(v)} for i, v in enumerate(matrix)]
+
+
+def test_parse_vectors():
+    parsed = parse_vectors([vector_send([1, 2]), vector_send([3, 4.5])])
+    assert parsed.dtype == np.float32 and parsed.tolist() == [[1.0, 2.0], [3.0, 4.5]]
+    assert parse_vectors([]).shape == (0, 0)
+    with pytest.raises(ValueError):
+        parse_vectors([vector_send([1, 2]), vector_send([3])])
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'ip', 'l2'])
+def test_top_k_matches_brute_force(metric):
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((200, 16)).astype(np.float32) * rng.uniform(0.5, 2, (200, 1)).astype(np.float32)
+    query = rng.standard_normal(16).astype(np.float32)
+    entry = ProjectVectors([f't{i}' for i in range(200)], [''] * 200, matrix)
+    if metric == 'cosine':
+        expected = np.argsort(-(matrix @ query) / np.linalg.norm(matrix, axis=1))
+    elif metric == 'ip':
+        expected = np.argsort(-(matrix @ query))
+    else:
+        expected = np.argsort(np.linalg.norm(matrix - query, axis=1))
+    assert entry.top_k(query, 10, metric) == expected[:10].tolist()
+    with pytest.raises(ValueError):
+        entry.top_k(query[:8], 10, metric)
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_invalidation_and_lru_budget(fake_memory_bank, fake_conn):
+    matrix = np.eye(4, dtype=np.float32)
+    memory_bank, conn = fake_memory_bank, fake_conn
+    conn.fetch.return_value = rows_for(matrix)
+    entry_bytes = ProjectVectors(['a'] * 4, [''] * 4, matrix).nbytes
+    cache = VectorCache(max_bytes=entry_bytes * 2, ttl=60, enabled=True)
+    first = await cache.get(memory_bank, 1)
+    assert await cache.get(memory_bank, 1) is first
+    assert (cache.hits, cache.misses, conn.fetch.await_count) == (1, 1, 1)
+
+    cache.invalidate(1)
+    assert await cache.get(memory_bank, 1) is not first
+    assert conn.fetch.await_count == 2
+
+    await cache.get(memory_bank, 2)
+    await cache.get(memory_bank, 3)
+    stats = cache.stats()
+    assert stats['projects'] == 2 and stats['evictions'] == 1 and stats['bytes'] <= stats['max_bytes']
+    await cache.get(memory_bank, 1)
+    assert conn.fetch.await_count == 5
+
+
+def test_top_k_entity_type_mask():
+    matrix = np.array([[1, 0], [0.9, 0.1], [0, 1]], dtype=np.float32)
+    entry = ProjectVectors(['a', 'b', 'c'], [''] * 3, matrix, ['doc', 'task', 'task'])
+    assert entry.top_k([1, 0], 2, 'cosine', entity_type='task') == [1, 2]
+    assert entry.top_k([1, 0], 5, 'cosine', entity_type='doc') == [0]
+    assert entry.top_k([1, 0], 5, 'cosine', entity_type='template') == []
+
+
+@pytest.mark.asyncio
+async def test_get_after_invalidate_does_not_join_stale_load(fake_memory_bank, fake_conn):
+    release = asyncio.Event()
+    stale_rows, fresh_rows = rows_for(np.eye(2, dtype=np.float32)), rows_for(np.eye(3, dtype=np.float32))
+
+    async def fetch(sql, project_id):
+        if fake_conn.fetch.await_count == 1:
+            await release.wait()
+            return stale_rows
+        return fresh_rows
+
+    fake_conn.fetch.side_effect = fetch
+    cache = VectorCache(ttl=60, enabled=True)
+    stale = asyncio.ensure_future(cache.get(fake_memory_bank, 1))
+    await asyncio.sleep(0)
+    cache.invalidate(1)
+    fresh = await cache.get(fake_memory_bank, 1)
+    assert len(fresh.ids) == 3 and fake_conn.fetch.await_count == 2
+    release.set()
+    assert len((await stale).ids) == 2
+    assert await cache.get(fake_memory_bank, 1) is fresh
@@ -0,0 +1,108 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import logging
+import pytest
+from unittest.mock import AsyncMock
+from src.mcp.memory.vector_index import (
+    create_index_sql, search_sql, vector_search, vector_literal, entity_type_predicate,
+    quantized_index_sql, quantized_search_sql, quantized_search,
+)
+
+
+def test_create_index_sql_per_method_and_metric():
+    assert create_index_sql('hnsw', 'cosine', m=8, ef_construction=32) == (
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_embeddings_vector_hnsw_cosine '
+        'ON embeddings USING hnsw (vector vector_cosine_ops) WITH (m = 8, ef_construction = 32)'
+    )
+    sql = create_index_sql('ivfflat', 'ip', lists=50, concurrently=False)
+    assert sql.startswith('CREATE INDEX IF NOT EXISTS idx_embeddings_vector_ivfflat_ip')
+    assert 'USING ivfflat (vector vector_ip_ops) WITH (lists = 50)' in sql
+    with pytest.raises(ValueError):
+        create_index_sql('btree', 'cosine')
+
+
+def test_search_sql_uses_metric_operator():
+    sql = search_sql('task_id', 'project_id = $1 AND description LIKE $2', 2, metric='l2')
+    assert sql.endswith('ORDER BY vector <-> $3::text::vector LIMIT $4')
+    assert vector_literal([1, 0.5]) == '[1.0,0.5]'
+
+
+@pytest.mark.asyncio
+async def test_vector_search_sets_params_locally(fake_conn):
+    conn = fake_conn
+    conn.fetch = AsyncMock(return_value=[{'task_id': 't1'}])
+    rows = await vector_search(conn, 'project_id = $1', [7], [0.1, 0.2], 3, metric='ip', ef_search=100, probes=None, exact=False)
+    assert rows == [{'task_id': 't1'}]
+    conn.execute.assert_awaited_once_with('SET LOCAL hnsw.ef_search = 100')
+    sql, *params = conn.fetch.call_args.args
+    assert '<#> $2::text::vector LIMIT $3' in sql
+    assert params == [7, '[0.1,0.2]', 3]
+
+
+@pytest.mark.asyncio
+async def test_vector_search_filters_first_for_small_candidate_sets(fake_conn, caplog):
+    conn = fake_conn
+    conn.fetch = AsyncMock(return_value=[])
+    conn.fetchval = AsyncMock(return_value=11)
+    where = f"project_id = $1 AND {entity_type_predicate('doc')}"
+    await vector_search(conn, where, [7], [0.1], 3, ef_search=100, exact_threshold=10)
+    assert 'LIMIT 11' in conn.fetchval.call_args.args[0]
+    assert not conn.fetch.call_args.args[0].startswith('WITH')
+    conn.execute.assert_awaited_once()
+
+    conn.fetchval = AsyncMock(return_value=10)
+    conn.execute.reset_mock()
+    with caplog.at_level(logging.INFO, logger='src.mcp.memory.vector_index'):
+        await vector_search(conn, where, [7], [0.1], 3, ef_search=100, exact_threshold=10)
+    sql = conn.fetch.call_args.args[0]
+    assert sql.startswith("WITH candidates AS MATERIALIZED (SELECT * FROM embeddings WHERE project_id = $1 AND entity_type = 'doc')")
+    conn.execute.assert_not_awaited()
+    assert 'ef_search=100' in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_vector_search_zero_threshold_always_uses_ann(fake_conn):
+    await vector_search(fake_conn, 'project_id = $1', [7], [0.1], 3, ef_search=100, exact_threshold=0)
+    fake_conn.fetchval.assert_not_awaited()
+    fake_conn.execute.assert_awaited_once_with('SET LOCAL hnsw.ef_search = 100')
+
+
+def test_partial_index_per_entity_type():
+    sql = create_index_sql('hnsw', 'ip', entity_type='task')
+    assert "idx_embeddings_vector_hnsw_ip_task" in sql and sql.endswith("WHERE entity_type = 'task'")
+    with pytest.raises(ValueError):
+        entity_type_predicate("x'; DROP TABLE embeddings; --")
+
+
+def test_halfvec_table_uses_halfvec_opclass_and_cast():
+    sql = create_index_sql('hnsw', 'l2', table='embeddings_m', vector_type='halfvec')
+    assert 'ON embeddings_m USING hnsw (vector halfvec_l2_ops)' in sql
+    assert search_sql('id', 'project_id = $1', 1, 'l2', 'embeddings_m', vector_type='halfvec').endswith(
+        'ORDER BY vector <-> $2::text::halfvec LIMIT $3')
+    with pytest.raises(ValueError):
+        create_index_sql('hnsw', 'l2', vector_type='bit')
+
+
+def test_quantized_index_uses_expression_of_search():
+    sql = quantized_index_sql('binary', 384, 'cosine')
+    assert 'USING hnsw ((binary_quantize(vector)::bit(384)) bit_hamming_ops)' in sql
+    assert 'USING hnsw ((vector::halfvec(768)) halfvec_ip_ops)' in quantized_index_sql('halfvec', 768, 'ip')
+    with pytest.raises(ValueError):
+        quantized_index_sql('int4', 384)
+    with pytest.raises(ValueError):
+        quantized_index_sql('halfvec', 384, vector_type='halfvec')
+
+
+@pytest.mark.asyncio
+async def test_quantized_search_reranks_coarse_candidates(fake_conn):
+    sql = quantized_search_sql('id', 'project_id = $1', 1, 'binary', 384, 'cosine', rerank_factor=4)
+    assert ('ORDER BY (binary_quantize(vector)::bit(384)) <~> (binary_quantize($2::text::vector)::bit(384)) '
+            'LIMIT $3 * 4) candidates ORDER BY vector <=> $2::text::vector LIMIT $3') in sql
+
+    conn = fake_conn
+    conn.fetch = AsyncMock(return_value=[])
+    await quantized_search(conn, 'project_id = $1', [7], [0.1], 50, 'halfvec', 384, ef_search=40, rerank_factor=4)
+    conn.execute.assert_awaited_once_with('SET LOCAL hnsw.ef_search = 200')
+    assert conn.fetch.call_args.args[1:] == (7, '[0.1]', 50)
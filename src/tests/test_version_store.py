@@ -0,0 +1,33 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.mcp.memory.version_store import insert_next_version
+
+
+@pytest.mark.asyncio
+async def test_next_version_is_computed_in_the_insert():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value=3)
+    version = await insert_next_version(conn, 'file_versions', {'project_id': 1, 'file_path': 'a.md'},
+                                        {'hash': 'h', 'user_id': 'u', 's3_url': None})
+    assert version == 3
+    sql, *params = conn.fetchval.call_args.args
+    assert 'INSERT INTO file_versions (project_id, file_path, version, hash, user_id, s3_url)' in sql
+    assert '(SELECT coalesce(max(version), 0) + 1 FROM file_versions WHERE project_id = $1 AND file_path = $2)' in sql
+    assert 'ON CONFLICT (project_id, file_path, version) DO NOTHING' in sql
+    assert params == [1, 'a.md', 'h', 'u', None]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_conflict_is_retried():
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(side_effect=[None, 5])
+    assert await insert_next_version(conn, 'doc_versions', {'doc_id': 7}, {'data': '{}'}) == 5
+    assert conn.fetchval.await_count == 2
+
+    conn.fetchval = AsyncMock(return_value=None)
+    with pytest.raises(RuntimeError):
+        await insert_next_version(conn, 'doc_versions', {'doc_id': 7}, {'data': '{}'}, retries=2)